@@ -0,0 +1,180 @@
+import math
+import os
+import threading
+import time
+
+# Admission control for the search routes: at most `limit` requests run at
+# once, a bounded number wait, everything beyond that is rejected right away
+# (the frontend answers 503) instead of piling up until clients time out.
+#
+# The limit adapts to observed latency like the gradient limiters used in
+# service meshes: a slow moving average of request latency stands for the
+# unloaded latency, a fast one for the current latency. While the current
+# latency stays close to the unloaded one the limit grows by about
+# sqrt(limit) per update; once queueing inside the server makes requests
+# slower, the ratio (the gradient) drops below 1 and shrinks the limit.
+#
+# Requests have a priority (0 is the highest). Priority p may only take
+# requests in flight up to PRIORITY_SHARES[p] of the limit, and waiting
+# requests are admitted highest priority first, so cheap /search requests
+# keep flowing while expensive ones are shed.
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1") == "1"
+INITIAL_LIMIT = int(os.getenv("ADMISSION_INITIAL_LIMIT", "16"))
+MIN_LIMIT = 2
+MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", "256"))
+QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "32"))
+# a request that waited this long is rejected, its client is likely gone
+QUEUE_TIMEOUT_MS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "500"))
+PRIORITY_SHARES = (1.0, 0.75, 0.5)
+# latency above RTT_TOLERANCE times the unloaded latency shrinks the limit
+RTT_TOLERANCE = 1.5
+SMOOTHING = 0.2
+# WSGI environ key of a request whose server already holds its slot (see
+# search_frontend_asgi.py), AdmissionMiddleware lets it through
+ADMITTED_ENVIRON_KEY = 'admission.admitted'
+OVERLOADED_BODY = b'{"error":"overloaded, retry later"}\n'
+
+
+class GradientLimiter:
+    """ Adaptive concurrency limit with a bounded, prioritized wait queue.
+        Thread safe.
+    """
+
+    def __init__(self, initial_limit=INITIAL_LIMIT, min_limit=MIN_LIMIT, max_limit=MAX_LIMIT,
+                 queue_size=QUEUE_SIZE, queue_timeout_ms=QUEUE_TIMEOUT_MS, shares=PRIORITY_SHARES):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout_ms / 1000
+        self.shares = shares
+        self.in_flight = 0
+        self.waiting = [0] * len(shares)
+        self._cond = threading.Condition()
+        # latency averages in seconds: fast (current) and slow (unloaded)
+        self._short_rtt = None
+        self._long_rtt = None
+        self.stats = {'admitted': 0, 'rejected': 0, 'timed_out': 0, 'completed': 0}
+
+    def _cap(self, priority):
+        return max(1, int(self.limit * self.shares[priority]))
+
+    def _can_run(self, priority):
+        return (self.in_flight < self._cap(priority)
+                and not any(self.waiting[:priority]))
+
+    def acquire(self, priority=0):
+        """ Wait for a slot. Returns True when the request may run (call
+            release() when it is done), False when it has to be rejected.
+        """
+        with self._cond:
+            if self._can_run(priority) and not self.waiting[priority]:
+                self.in_flight += 1
+                self.stats['admitted'] += 1
+                return True
+            queue_cap = max(1, int(self.queue_size * self.shares[priority]))
+            if sum(self.waiting) >= self.queue_size or self.waiting[priority] >= queue_cap:
+                self.stats['rejected'] += 1
+                return False
+
+            self.waiting[priority] += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while not self._can_run(priority):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats['timed_out'] += 1
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting[priority] -= 1
+            self.in_flight += 1
+            self.stats['admitted'] += 1
+            return True
+
+    def release(self, latency, ok=True):
+        """ Free a slot and feed the request's latency (seconds) into the
+            limit. Failed requests only free their slot.
+        """
+        with self._cond:
+            if ok:
+                self._update(latency, self.in_flight)
+                self.stats['completed'] += 1
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def _update(self, rtt, in_flight):
+        if self._short_rtt is None:
+            self._short_rtt = self._long_rtt = rtt
+            return
+        self._short_rtt += 0.1 * (rtt - self._short_rtt)
+        self._long_rtt += 0.01 * (rtt - self._long_rtt)
+        # after an overload the slow average sits far above the fast one,
+        # let it come down quickly
+        if self._long_rtt > 2 * self._short_rtt:
+            self._long_rtt = 0.95 * self._long_rtt + 0.05 * self._short_rtt
+        # an idle server tells nothing about a higher limit
+        if in_flight < self.limit / 2:
+            return
+
+        gradient = max(0.5, min(1.0, RTT_TOLERANCE * self._long_rtt / self._short_rtt))
+        new_limit = self.limit * gradient + math.sqrt(self.limit)
+        self.limit = (1 - SMOOTHING) * self.limit + SMOOTHING * new_limit
+        self.limit = max(self.min_limit, min(self.max_limit, self.limit))
+
+    def get_stats(self):
+        with self._cond:
+            return {**self.stats, 'limit': round(self.limit, 1), 'in_flight': self.in_flight,
+                    'waiting': list(self.waiting),
+                    'short_rtt_ms': None if self._short_rtt is None else round(self._short_rtt * 1000, 2),
+                    'long_rtt_ms': None if self._long_rtt is None else round(self._long_rtt * 1000, 2)}
+
+
+class _Release:
+    """ Response iterable that frees the admission slot once the server has
+        sent the whole body (or the client went away).
+    """
+
+    def __init__(self, body, limiter, start):
+        self._body = body
+        self._limiter = limiter
+        self._start = start
+
+    def __iter__(self):
+        return iter(self._body)
+
+    def close(self):
+        try:
+            if hasattr(self._body, 'close'):
+                self._body.close()
+        finally:
+            self._limiter.release(time.monotonic() - self._start)
+
+
+class AdmissionMiddleware:
+    """ WSGI middleware running the requests for the paths in `priorities`
+        (path -> priority) through `limiter`. A request holds its slot until
+        its response is fully sent, so the limit also covers serialization
+        and network writes. Rejected requests get a 503 right away.
+    """
+
+    def __init__(self, wsgi_app, limiter, priorities):
+        self.wsgi_app = wsgi_app
+        self.limiter = limiter
+        self.priorities = priorities
+
+    def __call__(self, environ, start_response):
+        priority = self.priorities.get(environ.get('PATH_INFO'))
+        if priority is None or environ.get(ADMITTED_ENVIRON_KEY):
+            return self.wsgi_app(environ, start_response)
+        if not self.limiter.acquire(priority):
+            start_response('503 Service Unavailable', [('Content-Type', 'application/json'),
+                                                       ('Retry-After', '1')])
+            return [OVERLOADED_BODY]
+        start = time.monotonic()
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except BaseException:
+            self.limiter.release(time.monotonic() - start, ok=False)
+            raise
+        return _Release(body, self.limiter, start)
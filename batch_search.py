@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+
+# A batch reads the posting list of every distinct term once, on
+# FETCH_THREADS threads at the same time, then scores its queries one after
+# the other against those lists. What a batch saves over single requests is
+# the reads: terms shared by several queries are read once, and the reads of
+# different terms overlap, which matters when every read is a bucket request.
+# Scoring is pure Python and holds the GIL, so it is not spread over threads;
+# a process pool would need its own copy of the indices and of every delta
+# segment written since it started.
+FETCH_THREADS = 16
+
+_fetch_pool = ThreadPoolExecutor(max_workers=FETCH_THREADS)
+
+
+# attributes of the wrapped index that scoring reads per term or per
+# posting, copied onto the PrefetchedIndex so they skip __getattr__
+BOUND_ATTRS = ('df', 'DL', 'doc_norms', 'posting_locs', 'name')
+
+
+class PrefetchedIndex:
+    """ Serves posting lists of one index from a dict filled by
+        fetch_postings(); everything else is forwarded to the wrapped index.
+        It reports no skip entries, so AND queries intersect the prefetched
+        lists instead of probing the posting files.
+    """
+
+    skips = {}
+
+    def __init__(self, index, postings):
+        self._index = index
+        self._postings = postings
+        for attr in BOUND_ATTRS:
+            if hasattr(index, attr):
+                setattr(self, attr, getattr(index, attr))
+
+    def __getattr__(self, attr):
+        if attr.startswith('__') or attr == '_index':
+            raise AttributeError(attr)
+        return getattr(self._index, attr)
+
+    def read_a_posting_list(self, base_dir, w, bucket_name=None):
+        if w in self._postings:
+            return self._postings[w]
+        return self._index.read_a_posting_list(base_dir, w, bucket_name)
+
+
+def fetch_postings(index, base_dir, terms, read_fn):
+    """ Read the posting list of every distinct term once, in parallel.
+    Parameters:
+    -----------
+      read_fn: function (index, term, base_dir) -> posting list
+    Returns:
+    --------
+      PrefetchedIndex over `index` holding the lists.
+    """
+    terms = [w for w in set(terms) if w in index.df]
+    lists = _fetch_pool.map(lambda w: read_fn(index, w, base_dir), terms)
+    return PrefetchedIndex(index, dict(zip(terms, lists)))
+
@@ -0,0 +1,52 @@
+from collections import Counter
+
+from inverted_index_gcp import InvertedIndex
+
+# Index of frequent adjacent token pairs ("w1 w2", tokens after stopword
+# removal), in the same format as the unigram indices. A pair is indexed when
+# at least BIGRAM_MIN_DF documents contain it, keeping the MAX_BIGRAMS most
+# frequent ones. The Spark notebook builds the same index with bigram_count.
+BIGRAM_MIN_DF = 100
+MAX_BIGRAMS = 5_000_000
+
+
+def adjacent_pairs(tokens):
+    """ The adjacent token pairs of a token list, as "w1 w2" terms. """
+    return [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+
+
+def select_bigrams(docs, min_df=BIGRAM_MIN_DF, max_bigrams=MAX_BIGRAMS):
+    """ The pairs to index, chosen by document frequency.
+    Parameters:
+    -----------
+      docs: dict mapping doc_id to a list of tokens.
+    Returns:
+    --------
+      set of "w1 w2" terms
+    """
+    df = Counter()
+    for tokens in docs.values():
+        df.update(set(adjacent_pairs(tokens)))
+    frequent = [(pair, n) for pair, n in df.items() if n >= min_df]
+    frequent.sort(key=lambda x: x[1], reverse=True)
+    return {pair for pair, _ in frequent[:max_bigrams]}
+
+
+def bigram_docs(docs, vocabulary):
+    """ doc_id -> the document's pairs that are in `vocabulary` (repeated
+        pairs stay repeated, they are the tf).
+    """
+    return {doc_id: [pair for pair in adjacent_pairs(tokens) if pair in vocabulary]
+            for doc_id, tokens in docs.items()}
+
+
+def build_bigram_index(docs, base_dir, name='bigram', min_df=BIGRAM_MIN_DF, max_bigrams=MAX_BIGRAMS):
+    """ Select the frequent pairs of `docs` (doc_id -> tokens) and write their
+        posting lists (`name`_NNN.bin, with skip entries) and `name`_index.pkl
+        to base_dir.
+    """
+    vocabulary = select_bigrams(docs, min_df, max_bigrams)
+    index = InvertedIndex(bigram_docs(docs, vocabulary))
+    index.write_posting_lists(base_dir, name)
+    index.write_index(base_dir, f'{name}_index')
+    return index
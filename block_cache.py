@@ -0,0 +1,281 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from time import time
+
+# Read-through cache of posting file bytes on local disk, used by
+# MultiFileReader when it reads from a bucket. Objects are split into
+# CACHE_BLOCK_SIZE blocks. Missing blocks are fetched with one ranged GET per
+# run of adjacent blocks. When a read spans several blocks (a long posting
+# list, or the planner reading one in chunks), the GET also fetches the next
+# READAHEAD_BLOCKS blocks of the object. The list of cached blocks is kept in
+# an sqlite file next to them, so the cache survives restarts. The least
+# recently used blocks are evicted once the cache holds more than
+# BLOCK_CACHE_BYTES. Hits only update the LRU in memory; their last_used
+# times are written with the next new block or on close.
+#
+# Blocks are keyed by the object's generation as well as its name, so an
+# object rebuilt and uploaded under the same name is never served from the
+# old blocks (those age out of the LRU). The generation is read once per
+# object and remembered until forget_generations(), which /reload calls.
+BLOCK_CACHE_DIR = os.getenv("BLOCK_CACHE_DIR", "")
+BLOCK_CACHE_BYTES = int(os.getenv("BLOCK_CACHE_BYTES", str(8 << 30)))
+CACHE_BLOCK_SIZE = 256 * 1024
+READAHEAD_BLOCKS = int(os.getenv("READAHEAD_BLOCKS", "8"))
+
+
+class LocalDirBlob:
+    """ The parts of a google.cloud.storage Blob the index code uses, over a
+        file in a local directory.
+    """
+
+    def __init__(self, bucket, name):
+        self.name = name
+        self._bucket = bucket
+        self._path = Path(bucket.root) / name
+        self.generation = None
+
+    def reload(self):
+        """ Reads the metadata, the generation is the file's mtime in ns. """
+        self.generation = self._path.stat().st_mtime_ns
+
+    def open(self, mode):
+        if 'w' in mode:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+        return open(self._path, mode)
+
+    def download_as_bytes(self, start=None, end=None):
+        """ Bytes [start, end] of the object, `end` inclusive like GCS. """
+        with open(self._path, 'rb') as f:
+            f.seek(start or 0)
+            b = f.read() if end is None else f.read(end - (start or 0) + 1)
+        self._bucket.requests += 1
+        self._bucket.bytes_served += len(b)
+        return b
+
+
+class LocalDirBucket:
+    """ Stand-in for a GCS bucket backed by a local directory, selected with a
+        bucket name of the form file:///path/to/dir (see get_bucket in
+        inverted_index_gcp.py). Counts the ranged reads it serves.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.name = f'file://{root}'
+        self.requests = 0
+        self.bytes_served = 0
+
+    def blob(self, name):
+        return LocalDirBlob(self, name)
+
+    def get_blob(self, name):
+        """ The blob with its metadata, or None when there is no such file. """
+        blob = LocalDirBlob(self, name)
+        try:
+            blob.reload()
+        except FileNotFoundError:
+            return None
+        return blob
+
+
+class BlockCache:
+    """ Size-bounded LRU cache of object blocks in `cache_dir`. Thread safe;
+        bucket reads happen outside the lock.
+    """
+
+    def __init__(self, cache_dir, max_bytes=BLOCK_CACHE_BYTES, block_size=CACHE_BLOCK_SIZE,
+                 readahead=READAHEAD_BLOCKS):
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.readahead = readahead
+        self._blocks_dir = Path(cache_dir) / 'blocks'
+        self._blocks_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(Path(cache_dir) / 'blocks.sqlite'), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS blocks (object TEXT, block INTEGER, "
+                         "size INTEGER, last_used REAL, PRIMARY KEY (object, block))")
+        # (object, block) -> size, least recently used first
+        self._lru = OrderedDict()
+        # (object, block) -> last_used of hits not written to the index yet
+        self._touched = {}
+        # (bucket name, object name) -> generation
+        self._generations = {}
+        self.size = 0
+        self.stats = {'hits': 0, 'misses': 0, 'bucket_requests': 0, 'bytes_fetched': 0,
+                      'bytes_saved': 0, 'evictions': 0}
+        self._load()
+
+    def _path(self, key):
+        digest = hashlib.sha1(f'{key[0]}\0{key[1]}'.encode('utf-8')).hexdigest()
+        return self._blocks_dir / digest[:2] / digest
+
+    def _load(self):
+        """ Rebuild the LRU from the index, dropping rows whose file is gone
+            and files no row points to (e.g. after a crash mid-write).
+        """
+        stale = []
+        rows = self._db.execute("SELECT object, block, size FROM blocks ORDER BY last_used")
+        for obj, block, size in rows.fetchall():
+            path = self._path((obj, block))
+            if path.exists() and path.stat().st_size == size:
+                self._lru[(obj, block)] = size
+                self.size += size
+            else:
+                stale.append((obj, block))
+        self._db.executemany("DELETE FROM blocks WHERE object = ? AND block = ?", stale)
+        self._db.commit()
+        known = {self._path(key) for key in self._lru}
+        for path in self._blocks_dir.glob('*/*'):
+            if path not in known:
+                path.unlink(missing_ok=True)
+
+    def _get(self, key):
+        with self._lock:
+            if key not in self._lru:
+                return None
+            self._lru.move_to_end(key)
+            self._touched[key] = time()
+        try:
+            return self._path(key).read_bytes()
+        except FileNotFoundError:
+            # evicted by another thread in between
+            return None
+
+    def _put(self, key, b):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_suffix(f'.tmp{threading.get_ident()}')
+        tmp.write_bytes(b)
+        os.replace(tmp, path)
+        with self._lock:
+            self.size += len(b) - self._lru.pop(key, 0)
+            self._lru[key] = len(b)
+            self._touched.pop(key, None)
+            self._db.execute("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?)",
+                             (key[0], key[1], len(b), time()))
+            evicted = []
+            while self.size > self.max_bytes and len(self._lru) > 1:
+                old_key, old_size = self._lru.popitem(last=False)
+                self.size -= old_size
+                self._touched.pop(old_key, None)
+                evicted.append(old_key)
+            self._db.executemany("DELETE FROM blocks WHERE object = ? AND block = ?", evicted)
+            self._flush_touched()
+            self.stats['evictions'] += len(evicted)
+            for old_key in evicted:
+                self._path(old_key).unlink(missing_ok=True)
+
+    def _flush_touched(self):
+        """ Writes the last_used times of hits and commits. Needs the lock. """
+        self._db.executemany("UPDATE blocks SET last_used = ? WHERE object = ? AND block = ?",
+                             [(used, obj, block) for (obj, block), used in self._touched.items()])
+        self._touched.clear()
+        self._db.commit()
+
+    def _object_key(self, bucket, name):
+        """ Cache key of object `name`: bucket, name and generation. """
+        key = (bucket.name, name)
+        with self._lock:
+            generation = self._generations.get(key)
+        if generation is None:
+            blob = bucket.get_blob(name)
+            if blob is None:
+                # missing, the ranged GET reports it
+                return f'{bucket.name}/{name}'
+            generation = blob.generation
+            with self._lock:
+                self._generations[key] = generation
+        return f'{bucket.name}/{name}#{generation}'
+
+    def forget_generations(self):
+        """ Reads the generation of every object again on its next read, so
+            objects replaced in the bucket since are fetched anew.
+        """
+        with self._lock:
+            self._generations.clear()
+
+    def _fetch(self, bucket, name, obj, first, last):
+        """ Fetch blocks [first, last] with one ranged GET and cache them.
+            Returns {block: bytes}; blocks past the end of the object are
+            missing from it.
+        """
+        bs = self.block_size
+        b = bucket.blob(name).download_as_bytes(start=first * bs, end=(last + 1) * bs - 1)
+        with self._lock:
+            self.stats['bucket_requests'] += 1
+            self.stats['bytes_fetched'] += len(b)
+        fetched = {}
+        for i, block in enumerate(range(first, last + 1)):
+            data = b[i * bs:(i + 1) * bs]
+            if not data:
+                break
+            self._put((obj, block), data)
+            fetched[block] = data
+        return fetched
+
+    def read(self, bucket, name, offset, n_bytes):
+        """ Bytes [offset, offset + n_bytes) of object `name` in `bucket`. """
+        if n_bytes <= 0:
+            return b''
+        bs = self.block_size
+        obj = self._object_key(bucket, name)
+        first, last = offset // bs, (offset + n_bytes - 1) // bs
+        blocks = {}
+        for block in range(first, last + 1):
+            data = self._get((obj, block))
+            if data is not None:
+                blocks[block] = data
+        with self._lock:
+            self.stats['hits'] += len(blocks)
+            self.stats['misses'] += last - first + 1 - len(blocks)
+            # the bytes of this read a ranged GET would have fetched
+            self.stats['bytes_saved'] += sum(min(offset + n_bytes, (block + 1) * bs) - max(offset, block * bs)
+                                             for block in blocks)
+
+        missing = [block for block in range(first, last + 1) if block not in blocks]
+        run_start = 0
+        for i, block in enumerate(missing):
+            if i + 1 < len(missing) and missing[i + 1] == block + 1:
+                continue
+            run_end = block
+            if block == last and last > first:
+                # readahead: extend the last run over blocks not cached yet
+                while run_end < last + self.readahead and (obj, run_end + 1) not in self._lru:
+                    run_end += 1
+            blocks.update(self._fetch(bucket, name, obj, missing[run_start], run_end))
+            run_start = i + 1
+
+        b = b''.join(blocks.get(block, b'') for block in range(first, last + 1))
+        start = offset - first * bs
+        return b[start:start + n_bytes]
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, 'cached_bytes': self.size, 'cached_blocks': len(self._lru),
+                    'max_bytes': self.max_bytes}
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._db.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_block_cache():
+    """ The process-wide BlockCache in BLOCK_CACHE_DIR, or None when no cache
+        directory is configured.
+    """
+    global _cache
+    if not BLOCK_CACHE_DIR:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = BlockCache(BLOCK_CACHE_DIR)
+        return _cache
@@ -0,0 +1,64 @@
+from bisect import bisect_left
+from contextlib import closing
+
+from inverted_index_gcp import MultiFileReader, SKIP_BLOCK
+
+
+def _probe_blocks(index, base_dir, w, skips, doc_ids, reader):
+    """ Look up the sorted `doc_ids` in `w`'s posting list, reading only the
+        skip blocks that can contain them. Runs of adjacent blocks are read
+        with a single call. Returns the (doc_id, tf) pairs found.
+    """
+    last_docs = [last_doc for last_doc, _ in skips]
+    blocks = sorted({bisect_left(last_docs, doc_id) for doc_id in doc_ids} - {len(skips)})
+    wanted = set(doc_ids)
+    found = []
+    run_start = 0
+    for i, block in enumerate(blocks):
+        # flush the run when the next block is not adjacent
+        if i + 1 < len(blocks) and blocks[i + 1] == block + 1:
+            continue
+        first = blocks[run_start]
+        postings = index.read_posting_range(base_dir, w, first * SKIP_BLOCK,
+                                            (block - first + 1) * SKIP_BLOCK, reader=reader)
+        found.extend((doc_id, tf) for doc_id, tf in postings if doc_id in wanted)
+        run_start = i + 1
+    return found
+
+
+def probe_postings(index, base_dir, w, doc_ids, reader, bucket_name=None):
+    """ The (doc_id, tf) pairs of `w` for the sorted `doc_ids`. Reads only the
+        skip blocks that can hold them when `w` has skip entries, the whole
+        posting list otherwise.
+    """
+    skips = index.skips.get(w)
+    if skips is None:
+        wanted = set(doc_ids)
+        return [(doc_id, tf) for doc_id, tf in index.read_a_posting_list(base_dir, w, bucket_name)
+                if doc_id in wanted]
+    return _probe_blocks(index, base_dir, w, skips, doc_ids, reader)
+
+
+def intersect_postings(index, base_dir, terms, bucket_name=None):
+    """ Conjunctive (AND) match of `terms` against `index`.
+        Starts from the rarest term and looks up the surviving candidates in the
+        next rarest one. Terms with skip entries are probed block by block, the
+        others are read in full.
+    Returns:
+    --------
+      dict mapping every doc_id that contains all terms to {term: tf}.
+    """
+    terms = sorted(set(terms), key=lambda w: index.df.get(w, 0))
+    if not terms or any(w not in index.df for w in terms):
+        return {}
+
+    matches = {doc_id: {terms[0]: tf}
+               for doc_id, tf in index.read_a_posting_list(base_dir, terms[0], bucket_name)}
+    with closing(MultiFileReader(base_dir, bucket_name)) as reader:
+        for w in terms[1:]:
+            if not matches:
+                break
+            postings = probe_postings(index, base_dir, w, sorted(matches), reader, bucket_name)
+            matches = {doc_id: {**matches[doc_id], w: tf}
+                       for doc_id, tf in postings if doc_id in matches}
+    return matches
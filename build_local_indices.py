@@ -1,11 +1,22 @@
 import pickle
 import os
+import sys
 from pathlib import Path
 from inverted_index_local import InvertedIndex
+from sharding import build_shards
+from pagerank import LinkGraph, PageRankStore, pagerank, save_pagerank
+from pageviews import PAGEVIEWS_FILE, PageviewCounter
+from bigram_index import build_bigram_index
+from suggest import SUGGEST_DIR, build_suggest
+import numpy as np
 
 PROJECT_DIR = Path(__file__).parent
 DATA_DIR = PROJECT_DIR / 'postings_gcp'
 DATA_DIR.mkdir(exist_ok=True)
+# PageRank and the other per-document metadata go where the frontend reads
+# them (its META_DIR, the folder it is started from by default)
+META_DIR = Path(os.getenv("META_DIR", PROJECT_DIR))
+META_DIR.mkdir(exist_ok=True)
 
 
 def create_dummy_index(name, text_dict, with_dl=False, save_titles=False):
@@ -35,17 +46,45 @@ def create_dummy_index(name, text_dict, with_dl=False, save_titles=False):
             pickle.dump(titles, f)
 
 
-def create_auxiliary_data():
+def create_bigram_index(text_dict, min_df=2):
+
+    print("Creating bigram index...")
+    docs = {doc_id: text.lower().split() for doc_id, text in text_dict.items()}
+    index = build_bigram_index(docs, str(DATA_DIR), min_df=min_df)
+    print(f"Indexed {len(index.df)} bigrams")
+
+
+def create_auxiliary_data(links):
 
     print("Creating PageRank and PageViews...")
-    page_rank = {1: 0.5, 2: 0.8, 3: 0.1, 4: 0.9}
+    src = [doc_id for doc_id, targets in links.items() for _ in targets]
+    dst = [target for targets in links.values() for target in targets]
+    graph = LinkGraph.from_edges(src, dst)
+    scores, _, _ = pagerank(graph)
+    save_pagerank(META_DIR / 'pagerank.npz', graph.doc_ids, scores)
+
     page_views = {1: 1000, 2: 5000, 3: 100, 4: 2000}
 
-    with open(DATA_DIR / 'pr.pkl', 'wb') as f:
-        pickle.dump(page_rank, f)
+    counter = PageviewCounter(str(META_DIR / PAGEVIEWS_FILE), initial_size=8)
+    counter.add(np.array(list(page_views.keys())), np.array(list(page_views.values())))
+    counter.close()
+
+
+def create_suggest_data(titles):
+
+    print("Creating title suggestions...")
+    build_suggest(titles, PageRankStore.load(META_DIR / 'pagerank.npz'), str(META_DIR / SUGGEST_DIR))
 
-    with open(DATA_DIR / 'pageviews.pkl', 'wb') as f:
-        pickle.dump(page_views, f)
+
+def create_sharded_indices(n_shards, body_docs, title_docs, anchor_docs):
+
+    print(f"Creating {n_shards} shards...")
+    field_docs = {
+        "body": {doc_id: text.lower().split() for doc_id, text in body_docs.items()},
+        "title": {doc_id: text.lower().split() for doc_id, text in title_docs.items()},
+        "anchor": {doc_id: text.lower().split() for doc_id, text in anchor_docs.items()},
+    }
+    build_shards(field_docs, PROJECT_DIR / 'shards', n_shards)
 
 
 def main():
@@ -56,6 +95,7 @@ def main():
         4: "data science involves statistics and python"
     }
     create_dummy_index("index", body_docs, with_dl=True)
+    create_bigram_index(body_docs)
 
     title_docs = {
         1: "Python (programming language)",
@@ -73,9 +113,23 @@ def main():
     }
     create_dummy_index("anchor_index", anchor_docs)
 
-    create_auxiliary_data()
+    # page -> pages it links to (the anchor_text targets)
+    links = {
+        1: [2, 4],
+        2: [1, 4],
+        3: [1],
+        4: [1, 2]
+    }
+
+    # python build_local_indices.py --shards N
+    if "--shards" in sys.argv:
+        n_shards = int(sys.argv[sys.argv.index("--shards") + 1])
+        create_sharded_indices(n_shards, body_docs, title_docs, anchor_docs)
+
+    create_auxiliary_data(links)
+    create_suggest_data(title_docs)
 
-    print(f"Done! All data created successfully in {DATA_DIR}")
+    print(f"Done! Indices created in {DATA_DIR}, metadata in {META_DIR}")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,22 @@
+import sys
+from inverted_index_gcp import InvertedIndex
+
+# Adds skip entries to indices built before they existed, e.g. the ones built by
+# the Spark notebook. Reads every posting list once and rewrites `name`.pkl.
+# Usage: python build_skips.py [index_dir] [name ...]
+#   python build_skips.py postings_gcp body_index title_index anchor_index
+
+
+def main():
+    index_dir = sys.argv[1] if len(sys.argv) > 1 else 'postings_gcp'
+    names = sys.argv[2:] or ['body_index', 'title_index', 'anchor_index']
+    for name in names:
+        print(f"Building skips for {name}...")
+        index = InvertedIndex.read_index(index_dir, name)
+        index.build_skips(index_dir)
+        index.write_index(index_dir, name)
+        print(f"{name}: skip entries for {len(index.skips)} terms")
+
+
+if __name__ == '__main__':
+    main()
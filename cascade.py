@@ -0,0 +1,74 @@
+import heapq
+
+from inverted_index_gcp import SKIP_BLOCK
+
+# Candidate generation for cascade ranking. Instead of scoring every posting
+# of every query term, stage one picks at most `cap` documents: the best ones
+# by the cheap title and anchor scores (up to FIELD_SHARE of the cap) and the
+# documents with the highest BM25 contribution ("impact") in the body
+# postings. Stage two (in the frontend) scores only those documents exactly.
+#
+# The body postings are sorted by doc id, not by impact, but every skip block
+# of SKIP_BLOCK postings stores its max tf. Blocks are read in descending
+# max-tf order until no unread block can beat the n-th best posting found so
+# far, or MAX_BLOCKS_PER_CANDIDATE blocks per wanted posting were read.
+FIELD_SHARE = 0.5
+MAX_BLOCKS_PER_CANDIDATE = 0.05
+
+
+def worth_cascading(index, terms, cap):
+    """ Whether a cascade of `cap` candidates reads less of the body postings
+        of `terms` than full scoring: some posting list must be longer than
+        the `cap` skip blocks stage two may read per term, and every term
+        needs skip entries, as stage two would read it in full otherwise
+        (while the index has delta segments, it has none).
+    """
+    terms = [w for w in terms if w in index.df]
+    return (max((index.df[w] for w in terms), default=0) > cap * SKIP_BLOCK
+            and all(index.skips.get(w) for w in terms))
+
+
+def top_impact_docs(index, base_dir, w, n, contribution, upper_bound, read_postings, reader):
+    """ (contribution, doc_id) of the (approximately) n postings of `w` with
+        the highest contribution, best first.
+    Parameters:
+    -----------
+      contribution: function (doc_id, tf) -> the posting's score.
+      upper_bound: function max_tf -> the most a posting with that tf can score.
+      read_postings: function w -> the full posting list, used for terms
+        without skip entries.
+      reader: an open MultiFileReader for the skip block reads.
+    """
+    skips = index.skips.get(w)
+    if skips is None:
+        return heapq.nlargest(n, ((contribution(doc_id, tf), doc_id) for doc_id, tf in read_postings(w)))
+
+    order = sorted(range(len(skips)), key=lambda block: skips[block][1], reverse=True)
+    max_blocks = max(1, int(n * MAX_BLOCKS_PER_CANDIDATE))
+    best = []
+    for n_read, block in enumerate(order):
+        if n_read >= max_blocks or (len(best) == n and upper_bound(skips[block][1]) <= best[0][0]):
+            break
+        for doc_id, tf in index.read_posting_range(base_dir, w, block * SKIP_BLOCK, SKIP_BLOCK, reader=reader):
+            item = (contribution(doc_id, tf), doc_id)
+            if len(best) < n:
+                heapq.heappush(best, item)
+            elif item > best[0]:
+                heapq.heapreplace(best, item)
+    return sorted(best, reverse=True)
+
+
+def select_candidates(field_scores, body_impacts, cap, field_share=FIELD_SHARE):
+    """ Up to `cap` doc ids: the best of `field_scores` (doc_id -> cheap
+        title/anchor score) first, filled up with the best of `body_impacts`
+        (doc_id -> summed contribution of its top-impact postings).
+    """
+    n_field = min(len(field_scores), int(cap * field_share))
+    candidates = set(heapq.nlargest(n_field, field_scores, key=field_scores.get))
+    body = (doc_id for doc_id in sorted(body_impacts, key=body_impacts.get, reverse=True)
+            if doc_id not in candidates)
+    for doc_id in body:
+        if len(candidates) >= cap:
+            break
+        candidates.add(doc_id)
+    return candidates
@@ -3,6 +3,7 @@ import requests
 import sys
 
 ENGINE_URL = "http://127.0.0.1:8080/search"
+BATCH_URL = "http://127.0.0.1:8080/search_batch"
 GROUND_TRUTH_FILE = "queries_train.json"
 
 K = 10
@@ -32,14 +33,26 @@ def calculate_ap_for_query(predicted, relevant, k):
     return score / min(len(relevant), k)
 
 
-def evaluate_quality(verbose=False):
+def fetch_batch_results():
+    """ All queries in one /search_batch call, as {query: results}. """
+    queries = list(ground_truth.keys())
+    response = requests.post(BATCH_URL, json=queries, timeout=600)
+    response.raise_for_status()
+    return dict(zip(queries, response.json()))
+
+
+def evaluate_quality(verbose=False, batch=False):
     ap_scores = []
+    batch_results = fetch_batch_results() if batch else None
 
     for query, relevant_docs in ground_truth.items():
         try:
-            response = requests.get(ENGINE_URL, params={"query": query}, timeout=10)
-            response.raise_for_status()
-            results = response.json()
+            if batch_results is not None:
+                results = batch_results[query]
+            else:
+                response = requests.get(ENGINE_URL, params={"query": query}, timeout=10)
+                response.raise_for_status()
+                results = response.json()
 
             predicted = [doc_id for doc_id, _ in results]
             relevant_set = set(relevant_docs)
@@ -66,12 +79,13 @@ def evaluate_quality(verbose=False):
 if __name__ == "__main__":
     verbose = "--verbose" in sys.argv or "-v" in sys.argv
     quiet = "--quiet" in sys.argv or "-q" in sys.argv
+    batch = "--batch" in sys.argv
 
     if verbose:
         print(f"\n{'=' * 70}")
         print(f"{'=' * 70}\n")
 
-    map_score = evaluate_quality(verbose=verbose)
+    map_score = evaluate_quality(verbose=verbose, batch=batch)
 
     if quiet:
         print(f"{map_score:.4f}")
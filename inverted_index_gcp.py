@@ -12,9 +12,16 @@ import pickle
 from google.cloud import storage
 from collections import defaultdict
 from contextlib import closing
+from functools import lru_cache
+
+from block_cache import LocalDirBucket, get_block_cache
 
 PROJECT_ID = 'ex3-sagikatan'
+@lru_cache(maxsize=None)
 def get_bucket(bucket_name):
+    # file:///some/dir serves a local directory as a bucket (for testing)
+    if bucket_name.startswith('file://'):
+        return LocalDirBucket(bucket_name[len('file://'):])
     return storage.Client(PROJECT_ID).bucket(bucket_name)
 
 def _open(path, mode, bucket=None):
@@ -60,12 +67,19 @@ class MultiFileReader:
     def __init__(self, base_dir, bucket_name=None):
         self._base_dir = Path(base_dir)
         self._bucket = None if bucket_name is None else get_bucket(bucket_name)
+        # bucket reads go through the local block cache when one is configured
+        self._cache = None if self._bucket is None else get_block_cache()
         self._open_files = {}
 
     def read(self, locs, n_bytes):
         b = []
         for f_name, offset in locs:
             f_name = str(self._base_dir / f_name)
+            if self._cache is not None:
+                n_read = min(n_bytes, BLOCK_SIZE - offset)
+                b.append(self._cache.read(self._bucket, f_name, offset, n_read))
+                n_bytes -= n_read
+                continue
             if f_name not in self._open_files:
                 self._open_files[f_name] = _open(f_name, 'rb', self._bucket)
             f = self._open_files[f_name]
@@ -86,6 +100,28 @@ class MultiFileReader:
 TUPLE_SIZE = 6       # We're going to pack the doc_id and tf values in this 
                      # many bytes.
 TF_MASK = 2 ** 16 - 1 # Masking the 16 low bits of an integer
+SKIP_BLOCK = 128     # Number of postings covered by one skip entry.
+
+
+def _decode_postings(b):
+    posting_list = []
+    for i in range(len(b) // TUPLE_SIZE):
+        doc_id = int.from_bytes(b[i*TUPLE_SIZE:i*TUPLE_SIZE+4], 'big')
+        tf = int.from_bytes(b[i*TUPLE_SIZE+4:(i+1)*TUPLE_SIZE], 'big')
+        posting_list.append((doc_id, tf))
+    return posting_list
+
+
+def make_skips(posting_list):
+    """ Skip entries for a posting list sorted by doc_id: one (last_doc_id,
+        max_tf) pair per SKIP_BLOCK postings. Postings have a fixed size, so
+        block i starts at posting i * SKIP_BLOCK and needs no stored offset.
+    """
+    skips = []
+    for start in range(0, len(posting_list), SKIP_BLOCK):
+        block = posting_list[start:start + SKIP_BLOCK]
+        skips.append((block[-1][0], max(tf for _, tf in block)))
+    return skips
 
 
 class InvertedIndex:  
@@ -99,6 +135,9 @@ class InvertedIndex:
         self.df = Counter()
         # stores total frequency per term
         self.term_total = Counter()
+        # stores skip entries (see make_skips) per term, lets readers jump to
+        # the blocks of a posting list they need instead of decoding all of it
+        self.skips = {}
         # stores posting list per term while building the index (internally), 
         # otherwise too big to store in memory.
         self._posting_list = defaultdict(list)
@@ -138,14 +177,43 @@ class InvertedIndex:
         with _open(path, 'wb', bucket) as f:
             pickle.dump(self, f)
 
+    def write_posting_lists(self, base_dir, name, bucket_name=None):
+        """ Write the in-memory posting lists, sorted by doc_id, to `name`_NNN.bin
+            files and record their locations. Like the posting files written by
+            `write_a_posting_list`, locations hold file names relative to
+            `base_dir`.
+        """
+        self.posting_locs = defaultdict(list)
+        with closing(MultiFileWriter(base_dir, name, bucket_name)) as writer:
+            for w in sorted(self._posting_list):
+                pl = sorted(self._posting_list[w], key=itemgetter(0))
+                b = b''.join([(doc_id << 16 | (tf & TF_MASK)).to_bytes(TUPLE_SIZE, 'big')
+                              for doc_id, tf in pl])
+                for f_name, offset in writer.write(b):
+                    self.posting_locs[w].append((os.path.basename(f_name), offset))
+                self.skips[w] = make_skips(pl)
+
+    def build_skips(self, base_dir, bucket_name=None):
+        """ Compute skip entries for an index whose posting files are already
+            written (e.g. one built by the Spark notebook), in one pass over
+            the posting files.
+        """
+        self.skips = {w: make_skips(pl)
+                      for w, pl in self.posting_lists_iter(base_dir, bucket_name)}
+
     def __getstate__(self):
         """ Modify how the object is pickled by removing the internal posting lists
             from the object's state dictionary. 
         """
         state = self.__dict__.copy()
-        del state['_posting_list']
+        state.pop('_posting_list', None)
         return state
 
+    def __setstate__(self, state):
+        # indices pickled before skip entries existed
+        state.setdefault('skips', {})
+        self.__dict__.update(state)
+
     def posting_lists_iter(self, base_dir, bucket_name=None):
         """ A generator that reads one posting list from disk and yields 
             a (word:str, [(doc_id:int, tf:int), ...]) tuple.
@@ -173,6 +241,31 @@ class InvertedIndex:
                 posting_list.append((doc_id, tf))
         return posting_list
 
+    def read_posting_range(self, base_dir, w, start, count, bucket_name=None, reader=None):
+        """ Read postings [start, start + count) of `w`'s posting list without
+            touching the rest of it. Pass an open MultiFileReader as `reader` to
+            reuse its file handles across calls.
+        """
+        if w not in self.posting_locs:
+            return []
+        count = min(count, self.df[w] - start)
+        if count <= 0:
+            return []
+        # skip whole files, then move the offset inside the first needed one
+        byte_start = start * TUPLE_SIZE
+        locs = []
+        for f_name, offset in self.posting_locs[w]:
+            chunk = BLOCK_SIZE - offset
+            if byte_start >= chunk:
+                byte_start -= chunk
+                continue
+            locs.append((f_name, offset + byte_start))
+            byte_start = 0
+        if reader is not None:
+            return _decode_postings(reader.read(locs, count * TUPLE_SIZE))
+        with closing(MultiFileReader(base_dir, bucket_name)) as reader:
+            return _decode_postings(reader.read(locs, count * TUPLE_SIZE))
+
     @staticmethod
     def write_a_posting_list(b_w_pl, base_dir, bucket_name=None):
         posting_locs = defaultdict(list)
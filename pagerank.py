@@ -0,0 +1,240 @@
+import argparse
+import glob
+from time import time
+
+import numpy as np
+
+# PageRank over the anchor-link graph (page A links to page B when A's
+# anchor_text contains B's id), the same graph the anchor index is built from.
+# The graph is kept in CSR form (rows = source pages, sorted) and every power
+# iteration is a handful of vectorized numpy passes over it, in row blocks of
+# about EDGE_CHUNK edges to bound temporary memory.
+DAMPING = 0.85
+TOLERANCE = 1e-6
+MAX_ITER = 100
+EDGE_CHUNK = 1 << 24
+
+
+class LinkGraph:
+    """ Directed link graph in CSR form over dense node numbers.
+        Node i is the page with doc id `doc_ids[i]` (sorted), its out-links are
+        indices[indptr[i]:indptr[i + 1]].
+    """
+
+    def __init__(self, doc_ids, indptr, indices):
+        self.doc_ids = doc_ids
+        self.indptr = indptr
+        self.indices = indices
+
+    @property
+    def n_nodes(self):
+        return len(self.doc_ids)
+
+    @property
+    def n_edges(self):
+        return len(self.indices)
+
+    def out_degrees(self):
+        return np.diff(self.indptr)
+
+    @staticmethod
+    def from_edges(src, dst):
+        """ Build the graph from parallel arrays of source and target doc ids.
+            Duplicate edges and self-links are dropped.
+        """
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        doc_ids = np.unique(np.concatenate([src, dst]))
+        s = np.searchsorted(doc_ids, src)
+        d = np.searchsorted(doc_ids, dst)
+        n = len(doc_ids)
+        # sorting the combined key sorts by source, then target, and makes
+        # duplicates adjacent
+        keys = np.unique(s[s != d] * n + d[s != d])
+        rows, cols = np.divmod(keys, n)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        return LinkGraph(doc_ids, indptr, cols.astype(np.int32))
+
+    def save(self, path):
+        np.savez(path, doc_ids=self.doc_ids, indptr=self.indptr, indices=self.indices)
+
+    @staticmethod
+    def load(path):
+        data = np.load(path)
+        return LinkGraph(data['doc_ids'], data['indptr'], data['indices'])
+
+
+def read_parquet_edges(paths):
+    """ (src, dst) doc id arrays from the preprocessed Wikipedia parquet files
+        (columns id and anchor_text, a list of (id, text) structs). Needs
+        pyarrow; files are streamed one record batch at a time.
+    """
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    src_parts, dst_parts = [], []
+    for path in paths:
+        for batch in pq.ParquetFile(path).iter_batches(columns=['id', 'anchor_text']):
+            links = batch.column('anchor_text')
+            parents = pc.list_parent_indices(links)
+            targets = pc.struct_field(pc.list_flatten(links), 'id')
+            valid = pc.is_valid(targets)
+            src_parts.append(pc.take(batch.column('id'), pc.filter(parents, valid)).to_numpy())
+            dst_parts.append(pc.filter(targets, valid).to_numpy())
+    if not src_parts:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    return np.concatenate(src_parts), np.concatenate(dst_parts)
+
+
+def _propagate(graph, x_over_deg):
+    """ y[j] = sum of x[i] / outdeg[i] over the links i -> j. """
+    y = np.zeros(graph.n_nodes)
+    row = 0
+    while row < graph.n_nodes:
+        # rows [row, end) hold about EDGE_CHUNK edges
+        end = int(np.searchsorted(graph.indptr, graph.indptr[row] + EDGE_CHUNK, side='right'))
+        end = min(max(end - 1, row + 1), graph.n_nodes)
+        e0, e1 = graph.indptr[row], graph.indptr[end]
+        weights = np.repeat(x_over_deg[row:end], np.diff(graph.indptr[row:end + 1]))
+        y += np.bincount(graph.indices[e0:e1], weights=weights, minlength=graph.n_nodes)
+        row = end
+    return y
+
+
+def pagerank(graph, damping=DAMPING, tol=TOLERANCE, max_iter=MAX_ITER, start=None, verbose=False):
+    """ Power iteration. Rank of dangling pages (no out-links) is spread
+        uniformly over all pages, like the teleport.
+    Parameters:
+    -----------
+      start: optional initial vector over graph.doc_ids (see warm_start).
+      tol: stop when the L1 change of one iteration drops below it.
+    Returns:
+    --------
+      (scores summing to 1, number of iterations, L1 change of the last
+      iteration). The run converged when that change is below `tol`,
+      otherwise it stopped at `max_iter`.
+    """
+    n = graph.n_nodes
+    if n == 0:
+        return np.zeros(0), 0, 0.0
+    out_deg = graph.out_degrees()
+    dangling = out_deg == 0
+    inv_deg = np.zeros(n)
+    inv_deg[~dangling] = 1.0 / out_deg[~dangling]
+
+    x = np.full(n, 1.0 / n) if start is None else start / start.sum()
+    for it in range(1, max_iter + 1):
+        y = damping * (_propagate(graph, x * inv_deg) + x[dangling].sum() / n) + (1 - damping) / n
+        delta = np.abs(y - x).sum()
+        x = y
+        if verbose:
+            print(f"iteration {it}: L1 change {delta:.3e}")
+        if delta < tol:
+            break
+    return x / x.sum(), it, delta
+
+
+def warm_start(graph, prev_doc_ids, prev_scores):
+    """ Initial vector for `graph` from a previous run on an older graph.
+        Pages that are new get the average score.
+    """
+    x = np.full(graph.n_nodes, 1.0 / max(graph.n_nodes, 1))
+    if len(prev_doc_ids):
+        pos = np.clip(np.searchsorted(prev_doc_ids, graph.doc_ids), 0, len(prev_doc_ids) - 1)
+        known = prev_doc_ids[pos] == graph.doc_ids
+        x[known] = prev_scores[pos[known]] / prev_scores.sum()
+    return x / x.sum()
+
+
+# --- Stored format ---
+
+def save_pagerank(path, doc_ids, scores):
+    """ Compact format read by the frontend: sorted doc ids and float32 scores.
+        Scores are scaled to average 1 per page, the scale of the GraphFrames
+        PageRank the ranking boost was tuned on.
+    """
+    np.savez(path, doc_ids=doc_ids.astype(np.int64),
+             scores=(scores * len(scores)).astype(np.float32))
+
+
+class PageRankStore:
+    """ Read-only doc_id -> PageRank lookups over the sorted arrays written by
+        save_pagerank, with vectorized lookups for many ids at once.
+    """
+
+    def __init__(self, doc_ids, scores):
+        order = np.argsort(doc_ids, kind='stable')
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int64)[order]
+        self.scores = np.asarray(scores, dtype=np.float64)[order]
+        # ranking boost, see rank_with_weights in search_frontend.py
+        self.boosts = 1 + np.log10(self.scores + 1)
+
+    @staticmethod
+    def load(path):
+        data = np.load(path)
+        return PageRankStore(data['doc_ids'], data['scores'])
+
+    @staticmethod
+    def from_dict(pagerank_dict):
+        return PageRankStore(np.fromiter(pagerank_dict.keys(), dtype=np.int64, count=len(pagerank_dict)),
+                             np.fromiter(pagerank_dict.values(), dtype=np.float64, count=len(pagerank_dict)))
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def _lookup(self, values, doc_ids, default):
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        if len(self.doc_ids) == 0:
+            return np.full(len(doc_ids), default, dtype=np.float64)
+        pos = np.clip(np.searchsorted(self.doc_ids, doc_ids), 0, len(self.doc_ids) - 1)
+        return np.where(self.doc_ids[pos] == doc_ids, values[pos], default)
+
+    def lookup(self, doc_ids, default=0.0):
+        return self._lookup(self.scores, doc_ids, default)
+
+    def lookup_boosts(self, doc_ids):
+        return self._lookup(self.boosts, doc_ids, 1.0)
+
+    def get(self, doc_id, default=0):
+        return float(self._lookup(self.scores, [doc_id], default)[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute PageRank over the anchor-link graph.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--parquet', nargs='+', help="parquet files/globs with id and anchor_text")
+    source.add_argument('--graph', help="CSR graph .npz to load instead of parquet input")
+    parser.add_argument('--save-graph', help="write the CSR graph here for later runs")
+    parser.add_argument('--previous', help="earlier pagerank .npz to warm-start from")
+    parser.add_argument('--out', default='pagerank.npz')
+    parser.add_argument('--damping', type=float, default=DAMPING)
+    parser.add_argument('--tol', type=float, default=TOLERANCE)
+    parser.add_argument('--max-iter', type=int, default=MAX_ITER)
+    args = parser.parse_args()
+
+    t_start = time()
+    if args.graph:
+        graph = LinkGraph.load(args.graph)
+    else:
+        paths = sorted(p for pattern in args.parquet for p in glob.glob(pattern))
+        graph = LinkGraph.from_edges(*read_parquet_edges(paths))
+    print(f"Graph: {graph.n_nodes} pages, {graph.n_edges} links ({time() - t_start:.1f}s)")
+    if args.save_graph:
+        graph.save(args.save_graph)
+
+    start = None
+    if args.previous:
+        prev = np.load(args.previous)
+        start = warm_start(graph, prev['doc_ids'], prev['scores'])
+    scores, iterations, delta = pagerank(graph, args.damping, args.tol, args.max_iter, start, verbose=True)
+    save_pagerank(args.out, graph.doc_ids, scores)
+    if delta < args.tol:
+        status = f"converged after {iterations} iterations"
+    else:
+        status = f"did not converge in {iterations} iterations (L1 change {delta:.3e}, tol {args.tol:.0e})"
+    print(f"PageRank {status}, written to {args.out} ({time() - t_start:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
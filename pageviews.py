@@ -0,0 +1,143 @@
+import argparse
+import bz2
+import gzip
+import os
+import pickle
+from time import time
+
+import numpy as np
+
+# Page view counts live in a flat uint32 file indexed by doc id
+# (pageviews.u32): the frontend memory-maps it and looks up any number of ids
+# with one fancy-indexing operation. Doc ids without views read as 0.
+PAGEVIEWS_FILE = 'pageviews.u32'
+COUNT_DTYPE = np.uint32
+# lines parsed before they are aggregated into the counts file
+CHUNK_LINES = 1_000_000
+# domain codes of English Wikipedia in the monthly ("en.wikipedia") and the
+# hourly ("en", "en.m" for mobile) dump formats
+DOMAINS = frozenset(['en.wikipedia', 'en', 'en.m'])
+
+
+def _open_dump(path):
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8', errors='replace')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, 'rt', encoding='utf-8', errors='replace')
+
+
+class PageviewCounter:
+    """ Memory-mapped counts file that grows as larger doc ids show up. """
+
+    def __init__(self, path, initial_size=1 << 20):
+        self._path = path
+        with open(path, 'wb') as f:
+            f.truncate(initial_size * np.dtype(COUNT_DTYPE).itemsize)
+        self._counts = np.memmap(path, dtype=COUNT_DTYPE, mode='r+')
+
+    def _grow(self, min_size):
+        size = len(self._counts)
+        while size < min_size:
+            size *= 2
+        self._counts.flush()
+        del self._counts
+        with open(self._path, 'r+b') as f:
+            f.truncate(size * np.dtype(COUNT_DTYPE).itemsize)
+        self._counts = np.memmap(self._path, dtype=COUNT_DTYPE, mode='r+')
+
+    def add(self, doc_ids, views):
+        """ Add `views` to the counts of `doc_ids` (parallel arrays, ids may
+            repeat). Memory use is bounded by the number of distinct ids.
+        """
+        if len(doc_ids) == 0:
+            return
+        ids, inverse = np.unique(doc_ids, return_inverse=True)
+        sums = np.bincount(inverse, weights=views)
+        if ids[-1] >= len(self._counts):
+            self._grow(ids[-1] + 1)
+        total = self._counts[ids].astype(np.float64) + sums
+        self._counts[ids] = np.minimum(total, np.iinfo(COUNT_DTYPE).max).astype(COUNT_DTYPE)
+
+    def close(self):
+        self._counts.flush()
+        del self._counts
+
+
+def parse_line(line, title_to_id):
+    """ (doc_id, views) from one dump line, or None.
+        Monthly per-article dumps: `domain title page_id access views hourly`.
+        Hourly dumps carry no page id: `domain title views bytes`, the title is
+        resolved with `title_to_id`.
+    """
+    fields = line.split(' ')
+    if len(fields) < 4 or fields[0] not in DOMAINS:
+        return None
+    if len(fields) >= 5 and fields[2].isdigit() and fields[4].isdigit():
+        return int(fields[2]), int(fields[4])
+    if title_to_id is not None and fields[2].isdigit():
+        doc_id = title_to_id.get(fields[1])
+        if doc_id is not None:
+            return doc_id, int(fields[2])
+    return None
+
+
+def ingest(paths, out_path, title_to_id=None, verbose=False):
+    """ Stream the dump files once and sum the views per doc id into out_path. """
+    counter = PageviewCounter(out_path)
+    doc_ids, views = [], []
+    n_lines = 0
+    for path in paths:
+        with _open_dump(path) as f:
+            for line in f:
+                parsed = parse_line(line.rstrip('\n'), title_to_id)
+                if parsed is None:
+                    continue
+                doc_ids.append(parsed[0])
+                views.append(parsed[1])
+                if len(doc_ids) >= CHUNK_LINES:
+                    counter.add(np.array(doc_ids, dtype=np.int64), np.array(views, dtype=np.float64))
+                    n_lines += len(doc_ids)
+                    doc_ids, views = [], []
+                    if verbose:
+                        print(f"{n_lines} lines aggregated")
+    counter.add(np.array(doc_ids, dtype=np.int64), np.array(views, dtype=np.float64))
+    counter.close()
+
+
+def load_pageviews(path):
+    """ Read-only memory map of a counts file, or None when it does not exist. """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    return np.memmap(path, dtype=COUNT_DTYPE, mode='r')
+
+
+def lookup_pageviews(counts, doc_ids):
+    """ View counts for a list of doc ids, 0 for unknown ids. """
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    result = np.zeros(len(doc_ids), dtype=np.int64)
+    if counts is None:
+        return result
+    known = (doc_ids >= 0) & (doc_ids < len(counts))
+    result[known] = counts[doc_ids[known]]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate Wikipedia pageview dumps per doc id.")
+    parser.add_argument('dumps', nargs='+', help="dump files (.bz2, .gz or plain text)")
+    parser.add_argument('--out', default=PAGEVIEWS_FILE)
+    parser.add_argument('--id2title', help="id2title.pkl, needed for dumps without page ids")
+    args = parser.parse_args()
+
+    t_start = time()
+    title_to_id = None
+    if args.id2title:
+        with open(args.id2title, 'rb') as f:
+            title_to_id = {title.replace(' ', '_'): doc_id for doc_id, title in pickle.load(f).items()}
+    ingest(args.dumps, args.out, title_to_id, verbose=True)
+    print(f"Page views written to {args.out} ({time() - t_start:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import heapq
+import json
+
+# Results of the single-field routes come in pages of ?limit= (default
+# PAGE_SIZE, at most MAX_PAGE_SIZE), ordered by score and then doc id. When
+# more results follow, the X-Next-Cursor header holds the (score, doc id) of
+# the page's last result; passing it back as ?cursor= returns the results
+# ranked after it, so pages neither repeat nor skip documents. The score is
+# written with repr(), which reads back as exactly the same float.
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def format_cursor(doc_id, score):
+    """ The cursor of the result (doc_id, score), see page_args. """
+    return f'{float(score)!r}:{doc_id}'
+
+
+def page_args(args):
+    """ (limit, after) from the request args, after is None or a (score,
+        doc_id) pair. Raises ValueError for malformed values.
+    """
+    limit = int(args.get('limit', PAGE_SIZE))
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    cursor = args.get('cursor')
+    if not cursor:
+        return limit, None
+    score, doc_id = cursor.split(':')
+    return limit, (float(score), int(doc_id))
+
+
+def top_page(scores, limit, after=None):
+    """ The `limit` best (doc_id, score) items of `scores` ranked after
+        `after`, with a heap instead of sorting everything, and whether more
+        items follow them.
+    """
+    items = scores.items()
+    if after is not None:
+        after_score, after_id = after
+        items = ((doc_id, score) for doc_id, score in items
+                 if score < after_score or (score == after_score and doc_id > after_id))
+    page = heapq.nsmallest(limit + 1, items, key=lambda x: (-x[1], x[0]))
+    return page[:limit], len(page) > limit
+
+
+def stream_json_list(rows):
+    """ The JSON encoding of the list `rows`, one row at a time. """
+    yield '['
+    for i, row in enumerate(rows):
+        yield (',' if i else '') + json.dumps(row, separators=(',', ':'))
+    yield ']\n'
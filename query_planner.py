@@ -0,0 +1,60 @@
+from collections import Counter
+
+from inverted_index_gcp import TUPLE_SIZE
+
+# A term whose BM25 upper bound is below this share of the query's total upper
+# bound cannot move a document far (typically a term with IDF close to zero)
+# and is not read at all.
+MIN_TERM_SHARE = 0.02
+
+
+class TermPlan:
+    """ Planning data for one query term. """
+
+    def __init__(self, term, idf, upper_bound, cost_bytes):
+        self.term = term
+        self.idf = idf
+        # the most this term can add to one document's score
+        self.upper_bound = upper_bound
+        # bytes of postings to read for it
+        self.cost_bytes = cost_bytes
+
+    def density(self):
+        """ Expected score contribution per byte read. """
+        return self.upper_bound / max(self.cost_bytes, 1)
+
+
+def bm25_upper_bound(idf, max_tf, qtf, k1, b):
+    """ Largest BM25 contribution of a term: the maximal tf in a document of
+        (close to) zero length. Without a known max tf, tf -> infinity.
+    """
+    if max_tf is None:
+        return qtf * idf * (k1 + 1)
+    return qtf * idf * max_tf * (k1 + 1) / (max_tf + k1 * (1 - b))
+
+
+def plan_terms(query_tokens, index, idf_fn, k1=1.5, b=0.75):
+    """ Order the query terms by upper bound per byte and drop the ones that
+        cannot matter.
+    Parameters:
+    -----------
+      idf_fn: function term -> idf, so the planner uses the same IDF as scoring.
+    Returns:
+    --------
+      (list of TermPlan in reading order, list of skipped terms)
+    """
+    plans = []
+    for term, qtf in Counter(query_tokens).items():
+        if term not in index.df:
+            continue
+        idf = idf_fn(term)
+        skips = index.skips.get(term)
+        max_tf = max(tf for _, tf in skips) if skips else None
+        plans.append(TermPlan(term, idf, bm25_upper_bound(idf, max_tf, qtf, k1, b),
+                              index.df[term] * TUPLE_SIZE))
+
+    total = sum(plan.upper_bound for plan in plans)
+    kept = [plan for plan in plans if plan.upper_bound >= MIN_TERM_SHARE * total]
+    skipped = [plan.term for plan in plans if plan.upper_bound < MIN_TERM_SHARE * total]
+    kept.sort(key=TermPlan.density, reverse=True)
+    return kept, skipped
@@ -1,6 +1,6 @@
 #!/bin/bash
 
-VERSIONS=("BASE_BODY_NO_PR" "BASE_BODY__PR" "BASE_TITLE_NO_PR" "BASE_TITLE_PR" "TITLE_60_NO_PR" "TITLE_60_PR" "BALANCED_2_NO_PR" "BALANCED_2_PR" "BODY_50_NO_PR" "BODY_50_PR" "PR_LOW_TITLE" "RECOMMENDED_1" "RECOMMENDED_2" )
+VERSIONS=("BASE_BODY_NO_PR" "BASE_BODY__PR" "BASE_TITLE_NO_PR" "BASE_TITLE_PR" "TITLE_60_NO_PR" "TITLE_60_PR" "BALANCED_2_NO_PR" "BALANCED_2_PR" "BODY_50_NO_PR" "BODY_50_PR" "PR_LOW_TITLE" "RECOMMENDED_1" "RECOMMENDED_2" "RECOMMENDED_2_PV" "RECOMMENDED_2_BIGRAM" "RECOMMENDED_2_CASCADE_1K" "RECOMMENDED_2_CASCADE_300" )
 RESULTS_FILE="results.csv"
 K=10
 
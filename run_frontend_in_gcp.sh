@@ -62,6 +62,25 @@ gcloud compute ssh $GOOGLE_ACCOUNT_NAME@$INSTANCE_NAME --zone $ZONE
 
 # 7. Run the server
 nohup ~/venv/bin/python ~/search_frontend.py > ~/frontend.log 2>&1 &
+FRONTEND_PID=$!
+# wait until the index is loaded and the warm-up (see warmup.py) is done,
+# before that /ready answers 503 (or nothing at all while the index loads).
+# If the warm-up fails, /ready stays 503 and reports the error (see
+# ~/frontend.log), set WARMUP_ALLOW_COLD=1 to serve cold instead. Gives up
+# when the server exits or is not ready after READY_TIMEOUT seconds.
+READY_TIMEOUT=${READY_TIMEOUT:-1800}
+READY_DEADLINE=$((SECONDS + READY_TIMEOUT))
+until curl -sf "http://127.0.0.1:8080/ready" > /dev/null; do
+  if ! kill -0 $FRONTEND_PID 2> /dev/null; then
+    echo "search_frontend.py exited, see ~/frontend.log" >&2
+    exit 1
+  fi
+  if [ $SECONDS -ge $READY_DEADLINE ]; then
+    echo "not ready after ${READY_TIMEOUT}s, see ~/frontend.log" >&2
+    exit 1
+  fi
+  sleep 5
+done
 
 # 8. Start querying
 curl "http://127.0.0.1:8080/search?query=hello"
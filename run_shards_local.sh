@@ -0,0 +1,24 @@
+#!/bin/bash
+
+# Starts one search_frontend.py worker per shard folder plus a coordinator on
+# port 8080 that fans /search out to them.
+# Build the shards first, e.g.: python build_local_indices.py --shards 4
+# Usage: ./run_shards_local.sh [N_SHARDS]
+
+N_SHARDS=${1:-4}
+SHARDS_DIR=${SHARDS_DIR:-shards}
+FIRST_PORT=8081
+
+URLS=""
+for ((i = 0; i < N_SHARDS; i++)); do
+  PORT=$((FIRST_PORT + i))
+  SHARD=$(printf "%s/shard_%03d" "$SHARDS_DIR" "$i")
+  echo "Starting shard $i ($SHARD) on port $PORT..."
+  INDEX_DIR=$SHARD PORT=$PORT nohup python search_frontend.py > shard_$i.log 2>&1 &
+  URLS="$URLS,http://127.0.0.1:$PORT"
+done
+
+echo "Starting coordinator on port 8080..."
+SHARD_URLS=${URLS#,} PORT=8080 nohup python search_frontend.py > coordinator.log 2>&1 &
+
+echo "Shard URLs: ${URLS#,}"
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, has_request_context
 import pickle
 from inverted_index_gcp import InvertedIndex
 import nltk
@@ -7,7 +7,32 @@ import re
 import math
 from collections import Counter
 import heapq
+import hmac
 import os
+import gc
+import copy
+import threading
+import time
+from segmented_index import SegmentedIndex
+from sharding import ShardCoordinator, read_global_stats
+from boolean_query import intersect_postings, probe_postings
+from bigram_index import adjacent_pairs
+from query_planner import bm25_upper_bound, plan_terms
+from cascade import select_candidates, top_impact_docs, worth_cascading
+from inverted_index_gcp import MultiFileReader, SKIP_BLOCK
+from contextlib import closing
+from batch_search import fetch_postings
+from paging import format_cursor, page_args, stream_json_list, top_page
+from pagerank import PageRankStore
+from pageviews import PAGEVIEWS_FILE, load_pageviews, lookup_pageviews
+from block_cache import get_block_cache
+from suggest import SUGGEST_DIR, TOP_K as SUGGEST_TOP_K, TitleSuggester
+from spelling import SPELLING_FILE, SpellChecker
+from urllib.parse import quote
+from admission import ADMISSION_CONTROL, AdmissionMiddleware, GradientLimiter
+from warmup import (QUERY_LOG, WARMUP_ALLOW_COLD, WARMUP_QUERIES, WARMUP_REPLAY, QueryLog, hot_terms,
+                    load_queries, prefetch_postings)
+import numpy as np
 
 
 ENGINE_VERSION = os.getenv("ENGINE_VERSION", "BALANCED_2_NO_PR")
@@ -26,6 +51,23 @@ WEIGHT_CONFIGS = {
     "PR_LOW_TITLE": {"title": 0.5, "body": 0.3, "anchor": 0.2, "use_pagerank": True, "pagerank_alpha": 0.02},
     "RECOMMENDED_1": {"title": 0.5, "body": 0.3, "anchor": 0.2, "use_pagerank": True, "pagerank_alpha": 0.1},
     "RECOMMENDED_2": {"title": 0.45, "body": 0.35, "anchor": 0.2, "use_pagerank": True, "pagerank_alpha": 0.08},
+    "RECOMMENDED_2_PV": {"title": 0.45, "body": 0.35, "anchor": 0.2, "use_pagerank": True, "pagerank_alpha": 0.08,
+                         "use_pageviews": True, "pageview_alpha": 0.02},
+    # adds the BM25 of indexed query bigrams (needs bigram_index.pkl)
+    "RECOMMENDED_2_BIGRAM": {"title": 0.45, "body": 0.35, "anchor": 0.2, "use_pagerank": True,
+                             "pagerank_alpha": 0.08, "bigram": 0.1},
+    # cascade ranking: only "cascade" candidate documents are scored in full,
+    # for queries where some term's df exceeds cascade * SKIP_BLOCK (128k
+    # documents for 1K, 38.4k for 300), see worth_cascading. The quality cost
+    # on Wikipedia is unmeasured: MAP@10 on queries_train.json needs the full
+    # index (run_all_versions.sh runs all three configs). On a synthetic 150k
+    # document index with planted relevant documents (48 two-word queries) 1K
+    # never cascaded; 300 cascaded 17 queries, 5x faster, but their MAP@10
+    # fell from 0.252 to 0.198 (top-10 overlap with RECOMMENDED_2 31%).
+    "RECOMMENDED_2_CASCADE_1K": {"title": 0.45, "body": 0.35, "anchor": 0.2, "use_pagerank": True,
+                                 "pagerank_alpha": 0.08, "cascade": 1000},
+    "RECOMMENDED_2_CASCADE_300": {"title": 0.45, "body": 0.35, "anchor": 0.2, "use_pagerank": True,
+                                  "pagerank_alpha": 0.08, "cascade": 300},
 }
 print("Running engine version:", ENGINE_VERSION)
 
@@ -38,30 +80,176 @@ app = MyFlaskApp(__name__)
 app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
 
 # --- 1. Load Data ---
-print("Loading indices and metadata... please wait")
-
-# Load Indices
-with open('postings_gcp/body_index.pkl', 'rb') as f:
-    body_index = pickle.load(f)
-with open('postings_gcp/title_index.pkl', 'rb') as f:
-    title_index = pickle.load(f)
-with open('postings_gcp/anchor_index.pkl', 'rb') as f:
-    anchor_index = pickle.load(f)
-
-# Load PageRank
-with open('pagerank.pkl', 'rb') as f:
-    pagerank_dict = pickle.load(f)
-
-# Load Titles
-with open('id2title.pkl', 'rb') as f:
-    id_to_title = pickle.load(f)
-
-# Pre-calculate boosting
-global_boost_dict = {}
-all_relevant_ids = set(pagerank_dict.keys())
-for doc_id in all_relevant_ids:
-    pr = pagerank_dict.get(doc_id, 0)
-    global_boost_dict[doc_id] = 1 + math.log10(pr + 1)
+# Indices live in INDEX_DIR, PageRank and titles in META_DIR. Everything that is
+# loaded from these folders is grouped into one IndexGeneration so a rebuilt
+# index can be loaded next to the running one and swapped in without a restart.
+INDEX_DIR = os.getenv("INDEX_DIR", "postings_gcp")
+META_DIR = os.getenv("META_DIR", ".")
+# With POSTINGS_BUCKET set, posting files are read from that GCS bucket (under
+# INDEX_DIR) instead of local disk, through the block cache in BLOCK_CACHE_DIR
+# if one is configured (see block_cache.py). The index pickles stay local.
+POSTINGS_BUCKET = os.getenv("POSTINGS_BUCKET") or None
+
+
+class IndexGeneration:
+    """ One snapshot of the indices and their metadata.
+        Requests take a reference to the current generation when they start and
+        use only that reference, so a reload never changes data under a running
+        query. The old generation is freed once its last request finishes.
+        The only thing that changes inside a generation are the delta segments
+        of its indices (see segmented_index.py), which swap their own state
+        atomically.
+    """
+
+    def __init__(self, index_dir, meta_dir, generation_id):
+        self.generation_id = generation_id
+        self.index_dir = index_dir
+        self.meta_dir = meta_dir
+        # posting files are resolved relative to this prefix
+        self.base_dir = index_dir.rstrip('/') + '/'
+
+        # Load Indices (main index + delta segments)
+        with open(os.path.join(index_dir, 'body_index.pkl'), 'rb') as f:
+            self.body_index = SegmentedIndex(index_dir, 'body', pickle.load(f))
+        with open(os.path.join(index_dir, 'title_index.pkl'), 'rb') as f:
+            self.title_index = SegmentedIndex(index_dir, 'title', pickle.load(f))
+        with open(os.path.join(index_dir, 'anchor_index.pkl'), 'rb') as f:
+            self.anchor_index = SegmentedIndex(index_dir, 'anchor', pickle.load(f))
+        # Frequent adjacent token pairs of the body (bigram_index.py), optional
+        self.bigram_index = None
+        bigram_path = os.path.join(index_dir, 'bigram_index.pkl')
+        if os.path.exists(bigram_path):
+            with open(bigram_path, 'rb') as f:
+                self.bigram_index = SegmentedIndex(index_dir, 'bigram', pickle.load(f))
+
+        # Load PageRank: the compact arrays written by pagerank.py, or the
+        # older {doc_id: pagerank} pickle
+        npz_path = os.path.join(meta_dir, 'pagerank.npz')
+        if os.path.exists(npz_path):
+            self.pagerank = PageRankStore.load(npz_path)
+        else:
+            with open(os.path.join(meta_dir, 'pagerank.pkl'), 'rb') as f:
+                self.pagerank = PageRankStore.from_dict(pickle.load(f))
+
+        # Page views (memory-mapped counts by doc id, None if not built)
+        self.pageviews = load_pageviews(os.path.join(meta_dir, PAGEVIEWS_FILE))
+
+        # Load Titles
+        with open(os.path.join(meta_dir, 'id2title.pkl'), 'rb') as f:
+            self.id_to_title = pickle.load(f)
+
+        # Spelling correction over the body and title vocabularies, built by
+        # spelling.py, optional
+        spelling_path = os.path.join(index_dir, SPELLING_FILE)
+        self.speller = SpellChecker.load(spelling_path) if os.path.exists(spelling_path) else None
+
+        # Title autocomplete arrays built by suggest.py, optional
+        suggest_dir = os.path.join(meta_dir, SUGGEST_DIR)
+        self.suggester = TitleSuggester.load(suggest_dir) if os.path.isdir(suggest_dir) else None
+
+        # Corpus-wide df and N when this index is one shard of a sharded build
+        self.global_stats = read_global_stats(index_dir)
+
+    def doc_freq(self, index, term):
+        if self.global_stats is not None:
+            return self.global_stats['df'].get(index.name, {}).get(term, index.df[term])
+        return index.df[term]
+
+    def has_term(self, index, term):
+        """ Whether any document of the corpus (all shards) contains `term`. """
+        if self.global_stats is not None and term in self.global_stats['df'].get(index.name, {}):
+            return True
+        return term in index.df
+
+    def num_docs(self, index):
+        if self.global_stats is not None:
+            return self.global_stats['N']
+        return len(index.DL) if hasattr(index, 'DL') else len(self.pagerank)
+
+    def segmented_indices(self):
+        indices = (self.body_index, self.title_index, self.anchor_index)
+        return indices if self.bigram_index is None else indices + (self.bigram_index,)
+
+    def get_title(self, doc_id):
+        title = self.title_index.get_title(doc_id)
+        if title is None:
+            title = self.id_to_title.get(doc_id, "Unknown")
+        return title
+
+
+# Coordinator mode: with SHARD_URLS set this process holds no index and fans
+# /search out to the shard workers (search_frontend.py processes started with
+# INDEX_DIR pointing at one shard folder each).
+SHARD_URLS = [url for url in os.getenv("SHARD_URLS", "").split(",") if url]
+SHARD_TIMEOUT = float(os.getenv("SHARD_TIMEOUT", "2.0"))
+coordinator = ShardCoordinator(SHARD_URLS, SHARD_TIMEOUT) if SHARD_URLS else None
+
+if coordinator is None:
+    print("Loading indices and metadata... please wait")
+    _generation = IndexGeneration(INDEX_DIR, META_DIR, generation_id=1)
+else:
+    print(f"Coordinator mode over {len(SHARD_URLS)} shards")
+    _generation = None
+_reload_lock = threading.Lock()
+_reload_status = {"state": "idle", "error": None}
+
+
+# WSGI environ key through which a server can pin the generation one request
+# runs against (search_frontend_asgi.py passes one with prefetched postings).
+GENERATION_ENVIRON_KEY = 'search.generation'
+
+
+def current_generation():
+    """ Returns the generation new requests should run against. """
+    if has_request_context() and GENERATION_ENVIRON_KEY in request.environ:
+        return request.environ[GENERATION_ENVIRON_KEY]
+    return _generation
+
+
+def _reload_worker(index_dir, meta_dir):
+    global _generation
+    try:
+        old = _generation
+        cache = get_block_cache()
+        if cache is not None:
+            # the bucket's posting files may have been rebuilt under the same names
+            cache.forget_generations()
+        new = IndexGeneration(index_dir, meta_dir, old.generation_id + 1)
+        if _warmup_queries:
+            warm_generation(new, _warmup_queries)
+        # Rebinding the module global is atomic, requests already holding `old`
+        # finish on it and later requests see `new`.
+        _generation = new
+        del old
+        gc.collect()
+        _reload_status.update(state="idle", error=None)
+        print(f"Swapped in index generation {new.generation_id} from {index_dir}")
+    except Exception as e:
+        _reload_status.update(state="failed", error=str(e))
+        print(f"Index reload from {index_dir} failed: {e}")
+    finally:
+        _reload_lock.release()
+
+
+# Delta segments are merged in the background every COMPACTION_INTERVAL seconds.
+COMPACTION_INTERVAL = int(os.getenv("COMPACTION_INTERVAL", "60"))
+
+
+def _compaction_loop():
+    while True:
+        time.sleep(COMPACTION_INTERVAL)
+        # a reload reads the segment manifests, don't rewrite them meanwhile
+        if _reload_lock.locked() or coordinator is not None:
+            continue
+        for index in current_generation().segmented_indices():
+            try:
+                index.compact()
+            except Exception as e:
+                print(f"Segment compaction failed: {e}")
+
+
+threading.Thread(target=_compaction_loop, daemon=True).start()
+
 
 # Avg Body Length (Fallback)
 AVG_BODY_LEN = 500
@@ -85,68 +273,208 @@ def tokenize(text):
 
 # --- 3. Ranking Functions (Fixed) ---
 
-def read_posting_list(index, term):
+def read_posting_list(index, term, base_dir='postings_gcp/'):
     """
     Helper to safely read posting lists handling function name mismatches.
     Tries 'read_a_posting_list' (v2) first, then 'read_posting_list' (v1).
     """
     try:
         # Try the new signature: (base_dir, term)
-        return index.read_a_posting_list('postings_gcp/', term)
+        return index.read_a_posting_list(base_dir, term, POSTINGS_BUCKET)
     except AttributeError:
         # Fallback to old signature: (term, base_dir)
-        return index.read_posting_list(term, 'postings_gcp/')
+        return index.read_posting_list(term, base_dir)
     except Exception:
         return []
 
 
-def get_bm25_scores(query_tokens, index, k1=1.5, b=0.75):
+def bm25_idf(term, index, gen):
+    N = gen.num_docs(index)
+    df = gen.doc_freq(index, term)
+    return math.log10((N - df + 0.5) / (df + 0.5) + 1)
+
+
+def get_bm25_scores(query_tokens, index, gen, k1=1.5, b=0.75):
     scores = {}
-    # Safe N calculation
-    N = len(index.DL) if hasattr(index, 'DL') else len(pagerank_dict)
+    doc_lens = index.DL if hasattr(index, 'DL') else {}
 
     for term in query_tokens:
         if term in index.df:
-            df = index.df[term]
-            idf = math.log10((N - df + 0.5) / (df + 0.5) + 1)
+            idf = bm25_idf(term, index, gen)
 
-            postings = read_posting_list(index, term)
+            postings = read_posting_list(index, term, gen.base_dir)
 
             for doc_id, tf in postings:
-                # Safe DL calculation
-                doc_len = index.DL.get(doc_id, AVG_BODY_LEN) if hasattr(index, 'DL') else AVG_BODY_LEN
+                doc_len = doc_lens.get(doc_id, AVG_BODY_LEN)
 
                 denominator = tf + k1 * (1 - b + b * (doc_len / AVG_BODY_LEN))
                 scores[doc_id] = scores.get(doc_id, 0) + (idf * tf * (k1 + 1) / denominator)
     return scores
 
 
-def get_title_scores(query_tokens, index):
+# Postings are read in chunks of this many when a deadline applies, and the
+# deadline is checked before every read, so a budget cuts a huge posting list
+# within a few blocks.
+DEADLINE_CHUNK = 4 * SKIP_BLOCK
+# Estimated time (in microseconds per scored document) of combining the field
+# scores and selecting the top 100. The body planner stops early enough to
+# leave this much of the budget.
+DEADLINE_COMBINE_US = float(os.getenv("DEADLINE_COMBINE_US", "1.5"))
+
+
+def get_bm25_scores_planned(query_tokens, index, gen, deadline, k1=1.5, b=0.75):
+    """ BM25 under a deadline (time.monotonic() value).
+        Terms are read in query-planner order, highest upper bound per byte
+        first, and terms that cannot matter are skipped. Before each chunk is
+        read, the time left is checked against the deadline less the estimated
+        cost of combining the scores so far; once it is used up, the scores of
+        the chunks already read are returned.
+    Returns:
+    --------
+      (scores, notes) where notes may hold "approximate": True and
+      "skipped_terms".
+    """
+    plans, skipped = plan_terms(query_tokens, index, lambda t: bm25_idf(t, index, gen), k1, b)
+    notes = {"skipped_terms": skipped} if skipped else {}
+    # chunked reads go straight to the main index's posting files
+    chunked = not (hasattr(index, 'has_deltas') and index.has_deltas())
+    qtfs = Counter(query_tokens)
+    doc_lens = index.DL if hasattr(index, 'DL') else {}
+    scores = {}
+
+    with closing(MultiFileReader(gen.base_dir, POSTINGS_BUCKET)) as reader:
+        for plan in plans:
+            weight = qtfs[plan.term] * plan.idf
+            starts = range(0, index.df[plan.term], DEADLINE_CHUNK) if chunked else [None]
+            for start in starts:
+                if time.monotonic() + len(scores) * DEADLINE_COMBINE_US / 1e6 >= deadline:
+                    notes["approximate"] = True
+                    return scores, notes
+                if start is None:
+                    postings = read_posting_list(index, plan.term, gen.base_dir)
+                else:
+                    postings = index.read_posting_range(gen.base_dir, plan.term, start, DEADLINE_CHUNK, reader=reader)
+                for doc_id, tf in postings:
+                    doc_len = doc_lens.get(doc_id, AVG_BODY_LEN)
+                    denominator = tf + k1 * (1 - b + b * (doc_len / AVG_BODY_LEN))
+                    scores[doc_id] = scores.get(doc_id, 0) + (weight * tf * (k1 + 1) / denominator)
+    return scores, notes
+
+
+def get_bm25_scores_conjunctive(query_tokens, index, gen, k1=1.5, b=0.75):
+    """ BM25 over the documents that contain every query term (AND). """
+    matches = intersect_postings(index, gen.base_dir, query_tokens, POSTINGS_BUCKET)
+    if not matches:
+        return {}
+    idfs = {term: bm25_idf(term, index, gen) for term in set(query_tokens)}
+    doc_lens = index.DL if hasattr(index, 'DL') else {}
+    scores = {}
+    for doc_id, tfs in matches.items():
+        doc_len = doc_lens.get(doc_id, AVG_BODY_LEN)
+        score = 0
+        for term in query_tokens:
+            tf = tfs[term]
+            denominator = tf + k1 * (1 - b + b * (doc_len / AVG_BODY_LEN))
+            score += idfs[term] * tf * (k1 + 1) / denominator
+        scores[doc_id] = score
+    return scores
+
+
+def get_bm25_scores_for_docs(query_tokens, index, gen, doc_ids, k1=1.5, b=0.75):
+    """ BM25 of the sorted `doc_ids` only. Terms with skip entries are looked
+        up block by block instead of being read in full.
+    """
+    doc_lens = index.DL if hasattr(index, 'DL') else {}
+    scores = {}
+    with closing(MultiFileReader(gen.base_dir, POSTINGS_BUCKET)) as reader:
+        for term, qtf in Counter(query_tokens).items():
+            if term not in index.df:
+                continue
+            weight = qtf * bm25_idf(term, index, gen)
+            for doc_id, tf in probe_postings(index, gen.base_dir, term, doc_ids, reader, POSTINGS_BUCKET):
+                doc_len = doc_lens.get(doc_id, AVG_BODY_LEN)
+                denominator = tf + k1 * (1 - b + b * (doc_len / AVG_BODY_LEN))
+                scores[doc_id] = scores.get(doc_id, 0) + (weight * tf * (k1 + 1) / denominator)
+    return scores
+
+
+def get_bigram_scores(pairs, gen, k1=1.5, b=0.75):
+    """ BM25 of the query's indexed bigrams, with the body's N and document
+        lengths. Every document that contains one of the pairs gets a score.
+    """
+    index, body = gen.bigram_index, gen.body_index
+    N = gen.num_docs(body)
+    doc_lens = body.DL if hasattr(body, 'DL') else {}
+    scores = {}
+    for pair, qtf in Counter(pairs).items():
+        df = gen.doc_freq(index, pair)
+        weight = qtf * math.log10((N - df + 0.5) / (df + 0.5) + 1)
+        for doc_id, tf in read_posting_list(index, pair, gen.base_dir):
+            doc_len = doc_lens.get(doc_id, AVG_BODY_LEN)
+            denominator = tf + k1 * (1 - b + b * (doc_len / AVG_BODY_LEN))
+            scores[doc_id] = scores.get(doc_id, 0) + (weight * tf * (k1 + 1) / denominator)
+    return scores
+
+
+def get_cascade_candidates(query_tokens, gen, cfg, title_scores, anchor_scores, deadline=None, k1=1.5, b=0.75):
+    """ Stage one of cascade ranking (see cascade.py): up to cfg["cascade"]
+        documents from the title/anchor hits and the top-impact body postings.
+        Once the deadline passes, the remaining terms add no body candidates.
+    Returns:
+    --------
+      (candidates, notes) where notes may hold "approximate": True.
+    """
+    cap = cfg["cascade"]
+    index = gen.body_index
+    field_scores = {doc_id: title_scores.get(doc_id, 0) * cfg["title"] + anchor_scores.get(doc_id, 0) * cfg["anchor"]
+                    for doc_id in set(title_scores) | set(anchor_scores)}
+    doc_lens = index.DL if hasattr(index, 'DL') else {}
+    body_impacts, notes = {}, {}
+    with closing(MultiFileReader(gen.base_dir, POSTINGS_BUCKET)) as reader:
+        for term, qtf in Counter(query_tokens).items():
+            if term not in index.df:
+                continue
+            if deadline is not None and time.monotonic() >= deadline:
+                notes["approximate"] = True
+                break
+            weight = qtf * bm25_idf(term, index, gen)
+
+            def contribution(doc_id, tf):
+                doc_len = doc_lens.get(doc_id, AVG_BODY_LEN)
+                return weight * tf * (k1 + 1) / (tf + k1 * (1 - b + b * (doc_len / AVG_BODY_LEN)))
+
+            for impact, doc_id in top_impact_docs(index, gen.base_dir, term, cap, contribution,
+                                                  lambda max_tf: bm25_upper_bound(weight, max_tf, 1, k1, b),
+                                                  lambda w: read_posting_list(index, w, gen.base_dir), reader):
+                body_impacts[doc_id] = body_impacts.get(doc_id, 0) + impact
+    return select_candidates(field_scores, body_impacts, cap), notes
+
+
+def get_title_scores(query_tokens, index, gen):
     scores = {}
     for term in set(query_tokens):
         if term in index.df:
-            postings = read_posting_list(index, term)
+            postings = read_posting_list(index, term, gen.base_dir)
             for doc_id, tf in postings:
                 scores[doc_id] = scores.get(doc_id, 0) + 1
     return scores
 
 
-def get_body_scores(query_tokens, index):
+def get_body_scores(query_tokens, index, gen):
     scores = {}
     query_counts = Counter(query_tokens)
 
-    # Calculate N safely for IDF
-    N = len(index.DL) if hasattr(index, 'DL') else len(pagerank_dict)
+    N = gen.num_docs(index)
 
     query_norm_sq = 0
     for term, tf_q in query_counts.items():
         if term in index.df:
-            df = index.df[term]
+            df = gen.doc_freq(index, term)
             idf = math.log10(N / df)  # Classic IDF
             w_t_q = tf_q * idf
             query_norm_sq += w_t_q ** 2
 
-            postings = read_posting_list(index, term)
+            postings = read_posting_list(index, term, gen.base_dir)
 
             for doc_id, tf_d in postings:
                 w_t_d = tf_d * idf
@@ -162,19 +490,201 @@ def get_body_scores(query_tokens, index):
     return results
 
 
-# --- 4. Routes ---
-
+def get_doc_norm(tokens, index, gen):
+    """ Norm of a document's tf-idf vector, with the weights get_body_scores
+        gives its terms.
+    """
+    N = gen.num_docs(index)
+    norm_sq = 0
+    for term, tf in Counter(tokens).items():
+        df = gen.doc_freq(index, term) if term in index.df else 1
+        norm_sq += (tf * math.log10(N / df)) ** 2
+    return math.sqrt(norm_sq) or 1
 
 
+# --- 4. Routes ---
 
-def rank_with_weights(query_tokens):
-    cfg = WEIGHT_CONFIGS.get(ENGINE_VERSION, WEIGHT_CONFIGS["BALANCED_2_NO_PR"])
+def get_config(version=None):
+    """ Resolves the weight config for a request. `version` comes from the
+        ?version= argument and overrides ENGINE_VERSION for that request only.
+        Returns None for an unknown version.
+    """
+    if version:
+        return WEIGHT_CONFIGS.get(version)
+    return WEIGHT_CONFIGS.get(ENGINE_VERSION, WEIGHT_CONFIGS["BALANCED_2_NO_PR"])
+
+
+# Query modes for /search (?mode=):
+#   or     - every document matching any term is scored (default)
+#   and    - only documents whose body contains every term; falls back to "or"
+#            when fewer than AND_MIN_RESULTS documents match
+#   phrase - like "and" without the fallback. Positions are not indexed, so
+#            this is the candidate prefilter for a phrase, not a phrase match.
+QUERY_MODES = ("or", "and", "phrase")
+AND_MIN_RESULTS = int(os.getenv("AND_MIN_RESULTS", "100"))
+
+# Configs with a "bigram" weight add the BM25 of the query's indexed adjacent
+# pairs (see bigram_index.py), times that weight, to the documents the query
+# matches anyway. In "or" mode, when at least BIGRAM_MIN_RESULTS documents
+# contain one of the pairs, only those documents are ranked: their body BM25
+# is looked up with skip entries instead of reading the body postings in full.
+# With fewer pair matches every matching document is scored. Under a deadline
+# the pairs are only scored while time is left.
+BIGRAM_MIN_RESULTS = int(os.getenv("BIGRAM_MIN_RESULTS", "100"))
+
+# Default latency budget for /search in ms (0: no budget, score everything).
+# A request can set its own with ?budget_ms=. The budget covers the whole of
+# score_query: the title and anchor lists are read first (short, and the
+# heaviest weights), then the body postings in "or" mode (the query planner,
+# or stage one of a cascade) and the bigram postings get the time left, less
+# an estimate of the combine step (DEADLINE_COMBINE_US). Every read is skipped
+# once the deadline has passed. AND/phrase intersections and stage two of a
+# cascade (at most "cascade" probes per term) always run to completion.
+QUERY_BUDGET_MS = float(os.getenv("QUERY_BUDGET_MS", "0"))
+
+
+def get_deadline(args):
+    """ time.monotonic() deadline of a request, or None without a budget.
+        Raises ValueError when ?budget_ms= is not a number.
+    """
+    budget_ms = float(args.get('budget_ms', QUERY_BUDGET_MS))
+    return time.monotonic() + budget_ms / 1000 if budget_ms > 0 else None
 
-    body_scores = get_bm25_scores(query_tokens, body_index)
-    title_scores = get_title_scores(query_tokens, title_index)
-    anchor_scores = get_title_scores(query_tokens, anchor_index)
 
-    all_docs = set(body_scores) | set(title_scores) | set(anchor_scores)
+def get_query_bigram_scores(query_tokens, gen, cfg, deadline, notes):
+    """ Bigram scores for configs with a "bigram" weight, else None. Past the
+        deadline the pairs are skipped and notes marks the result approximate.
+    """
+    if not cfg.get("bigram") or gen.bigram_index is None:
+        return None
+    pairs = [pair for pair in adjacent_pairs(query_tokens) if pair in gen.bigram_index.df]
+    if not pairs:
+        return None
+    if deadline is not None and time.monotonic() >= deadline:
+        notes["approximate"] = True
+        return None
+    return get_bigram_scores(pairs, gen)
+
+
+def get_field_scores(query_tokens, gen, deadline, notes):
+    """ Title and anchor scores. Past the deadline a field is skipped and
+        notes marks the result approximate.
+    Returns:
+    --------
+      (title_scores, anchor_scores)
+    """
+    fields = []
+    for index in (gen.title_index, gen.anchor_index):
+        if deadline is not None and time.monotonic() >= deadline:
+            notes["approximate"] = True
+            fields.append({})
+        else:
+            fields.append(get_title_scores(query_tokens, index, gen))
+    return tuple(fields)
+
+
+def score_query(query_tokens, gen, cfg, mode="or", deadline=None):
+    """ Scores a query in the given mode. With a deadline the whole query is
+        scored within it (see QUERY_BUDGET_MS), the body by the query planner
+        (see get_bm25_scores_planned).
+    Returns:
+    --------
+      (scores, notes) - notes is a dict describing shortcuts that were taken.
+    """
+    notes = {}
+    if mode in ("and", "phrase") and len(set(query_tokens)) > 1:
+        body_scores = get_bm25_scores_conjunctive(query_tokens, gen.body_index, gen)
+        if mode == "phrase" or len(body_scores) >= AND_MIN_RESULTS:
+            title_scores, anchor_scores = get_field_scores(query_tokens, gen, deadline, notes)
+            bigram_scores = get_query_bigram_scores(query_tokens, gen, cfg, deadline, notes)
+            return rank_with_weights(query_tokens, gen, cfg, body_scores=body_scores,
+                                     candidates=body_scores.keys(), bigram_scores=bigram_scores,
+                                     title_scores=title_scores, anchor_scores=anchor_scores), notes
+    title_scores, anchor_scores = get_field_scores(query_tokens, gen, deadline, notes)
+    if mode == "or" and cfg.get("cascade") and worth_cascading(gen.body_index, set(query_tokens), cfg["cascade"]):
+        # stage two: exact scores for the stage one candidates only
+        candidates, stage_notes = get_cascade_candidates(query_tokens, gen, cfg, title_scores, anchor_scores,
+                                                         deadline)
+        notes.update(stage_notes)
+        candidates = sorted(candidates)
+        body_scores = get_bm25_scores_for_docs(query_tokens, gen.body_index, gen, candidates)
+        bigram_scores = get_query_bigram_scores(query_tokens, gen, cfg, deadline, notes)
+        return rank_with_weights(query_tokens, gen, cfg, body_scores=body_scores, candidates=candidates,
+                                 title_scores=title_scores, anchor_scores=anchor_scores,
+                                 bigram_scores=bigram_scores), notes
+    bigram_scores = get_query_bigram_scores(query_tokens, gen, cfg, deadline, notes)
+    if mode == "or" and bigram_scores is not None and len(bigram_scores) >= BIGRAM_MIN_RESULTS:
+        # candidate-first: only the documents holding one of the pairs
+        candidates = sorted(bigram_scores)
+        body_scores = get_bm25_scores_for_docs(query_tokens, gen.body_index, gen, candidates)
+        return rank_with_weights(query_tokens, gen, cfg, body_scores=body_scores, candidates=candidates,
+                                 title_scores=title_scores, anchor_scores=anchor_scores,
+                                 bigram_scores=bigram_scores), notes
+    body_scores = None
+    if deadline is not None:
+        body_scores, body_notes = get_bm25_scores_planned(query_tokens, gen.body_index, gen, deadline)
+        notes.update(body_notes)
+    return rank_with_weights(query_tokens, gen, cfg, body_scores=body_scores, bigram_scores=bigram_scores,
+                             title_scores=title_scores, anchor_scores=anchor_scores), notes
+
+
+def annotate(response, notes):
+    """ Reports shortcuts taken while scoring in response headers, so the JSON
+        body keeps the usual format.
+    """
+    if notes.get("approximate"):
+        response.headers['X-Result-Approximate'] = '1'
+    if notes.get("skipped_terms"):
+        response.headers['X-Skipped-Terms'] = ','.join(notes["skipped_terms"])
+    if notes.get("corrected_query"):
+        # percent-encoded, header values are latin-1
+        response.headers['X-Corrected-Query'] = quote(notes["corrected_query"])
+    return response
+
+
+def spell_correct(query, query_tokens, gen):
+    """ Replaces query tokens that are in neither the body nor the title
+        vocabulary by their spelling correction (see spelling.py). On a shard
+        the vocabulary is the corpus-wide one, so every shard leaves the
+        same tokens alone.
+    Returns:
+    --------
+      (tokens, notes) - notes holds the corrected query text under
+      "corrected_query" when a token was replaced.
+    """
+    if gen.speller is None:
+        return query_tokens, {}
+    corrections = {}
+    for token in set(query_tokens):
+        if not gen.has_term(gen.body_index, token) and not gen.has_term(gen.title_index, token):
+            correction = gen.speller.correct(token)
+            if correction:
+                corrections[token] = correction
+    if not corrections:
+        return query_tokens, {}
+    corrected = RE_WORD.sub(lambda m: corrections.get(m.group().lower(), m.group()), query)
+    return [corrections.get(token, token) for token in query_tokens], {"corrected_query": corrected}
+
+
+def rank_with_weights(query_tokens, gen, cfg, body_scores=None, candidates=None, bigram_scores=None,
+                      title_scores=None, anchor_scores=None):
+    """ Weighted combination of the body, title and anchor scores (and
+        PageRank). `body_scores`, `title_scores` and `anchor_scores` may be
+        passed in when already computed, and `candidates` restricts the result
+        to those documents. `bigram_scores` are added with the config's bigram
+        weight.
+    """
+    if body_scores is None:
+        body_scores = get_bm25_scores(query_tokens, gen.body_index, gen)
+    if title_scores is None:
+        title_scores = get_title_scores(query_tokens, gen.title_index, gen)
+    if anchor_scores is None:
+        anchor_scores = get_title_scores(query_tokens, gen.anchor_index, gen)
+
+    if candidates is None:
+        all_docs = set(body_scores) | set(title_scores) | set(anchor_scores)
+    else:
+        all_docs = candidates
     final_scores = {}
 
     for doc_id in all_docs:
@@ -183,75 +693,437 @@ def rank_with_weights(query_tokens):
             body_scores.get(doc_id, 0)  * cfg["body"]  +
             anchor_scores.get(doc_id, 0) * cfg["anchor"]
         )
-
-        if cfg["use_pagerank"]:
-            alpha = cfg.get("pagerank_alpha", 0.05)
-            boost = global_boost_dict.get(doc_id, 1)
-            text_score *= (1 + alpha * boost)
-
         final_scores[doc_id] = text_score
 
+    if bigram_scores:
+        weight = cfg["bigram"]
+        for doc_id in final_scores:
+            final_scores[doc_id] += bigram_scores.get(doc_id, 0) * weight
+
+    if cfg["use_pagerank"] and final_scores:
+        # boost = 1 + log10(pagerank + 1), looked up for all documents at once
+        alpha = cfg.get("pagerank_alpha", 0.05)
+        doc_ids = list(final_scores)
+        boosts = gen.pagerank.lookup_boosts(doc_ids)
+        for doc_id, boost in zip(doc_ids, boosts.tolist()):
+            final_scores[doc_id] *= (1 + alpha * boost)
+
+    if cfg.get("use_pageviews") and final_scores:
+        # same shape as the PageRank boost: 1 + alpha * log10(views + 1)
+        alpha = cfg.get("pageview_alpha", 0.02)
+        doc_ids = list(final_scores)
+        boosts = np.log10(lookup_pageviews(gen.pageviews, doc_ids) + 1)
+        for doc_id, boost in zip(doc_ids, boosts.tolist()):
+            final_scores[doc_id] *= (1 + alpha * boost)
+
     return final_scores
 
 
+# routes a coordinator serves itself, everything else needs a local index
+COORDINATOR_ROUTES = ("/search", "/ready", "/admission")
+
+
+@app.before_request
+def coordinator_routes_only():
+    if coordinator is not None and request.path not in COORDINATOR_ROUTES:
+        return jsonify({"error": "not available in coordinator mode"}), 501
+
+
+# Routes that change the served index only answer requests carrying
+# ADMIN_TOKEN in the X-Admin-Token header, or, when no token is configured,
+# requests from this machine. /reload only loads folders below RELOAD_ROOT.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+RELOAD_ROOT = os.getenv("RELOAD_ROOT", ".")
+ADMIN_ROUTES = ("/add_docs", "/delete_docs", "/reload")
+
+
+@app.before_request
+def admin_routes_only():
+    if request.path not in ADMIN_ROUTES:
+        return None
+    if ADMIN_TOKEN:
+        allowed = hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+    else:
+        allowed = request.remote_addr in ('127.0.0.1', '::1')
+    if not allowed:
+        return jsonify({"error": "forbidden"}), 403
+
+
+# Admission control (see admission.py): priority of each limited route, lower
+# numbers are served first and may use more of the concurrency limit.
+ROUTE_PRIORITIES = {
+    "/search": 0,
+    "/search_shard": 0,
+    "/search_title": 1,
+    "/search_anchor": 1,
+    "/search_body": 2,
+    "/search_batch": 2,
+}
+limiter = GradientLimiter() if ADMISSION_CONTROL else None
+if limiter is not None:
+    app.wsgi_app = AdmissionMiddleware(app.wsgi_app, limiter, ROUTE_PRIORITIES)
+
+
+@app.route("/admission")
+def admission():
+    """ Concurrency limit, requests in flight and waiting, and counters of
+        admitted, rejected and timed out requests.
+    """
+    if limiter is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **limiter.get_stats()})
+
+
 @app.route("/search")
 def search():
     query = request.args.get('query', '')
     if not query: return jsonify([])
 
+    cfg = get_config(request.args.get('version'))
+    if cfg is None:
+        return jsonify({"error": f"unknown version '{request.args.get('version')}'"}), 400
+    mode = request.args.get('mode', 'or')
+    if mode not in QUERY_MODES:
+        return jsonify({"error": f"unknown mode '{mode}'"}), 400
+    try:
+        deadline = get_deadline(request.args)
+    except ValueError:
+        return jsonify({"error": "budget_ms must be a number"}), 400
+
+    if coordinator is not None:
+        top_docs, missing, notes = coordinator.search(request.args.to_dict(), k=100)
+        response = jsonify([(str(doc_id), title) for doc_id, _, title in top_docs])
+        if missing:
+            response.headers['X-Partial-Results'] = ','.join(missing)
+        return annotate(response, notes)
+
+    if query_log is not None:
+        query_log.append(query)
     query_tokens = tokenize(query)
     if not query_tokens: return jsonify([])
 
-    scores = rank_with_weights(query_tokens)
+    gen = current_generation()
+    spell_notes = {}
+    if request.args.get('spell') == '1':
+        query_tokens, spell_notes = spell_correct(query, query_tokens, gen)
+    scores, notes = score_query(query_tokens, gen, cfg, mode, deadline)
     top_docs = heapq.nlargest(100, scores.items(), key=lambda x: x[1])
-    return jsonify([
-        (str(doc_id), id_to_title.get(doc_id, "Unknown"))
+    return annotate(jsonify([
+        (str(doc_id), gen.get_title(doc_id))
         for doc_id, _ in top_docs
-    ])
+    ]), {**notes, **spell_notes})
 
 
+# upper bound of a shard's top-k, the coordinator asks for 100
+MAX_SHARD_K = int(os.getenv("MAX_SHARD_K", "1000"))
 
-@app.route("/search_body")
-def search_body():
+
+@app.route("/search_shard")
+def search_shard():
+    """ /search for a coordinator: the shard's top-k with scores, as
+        [[doc_id, score, title], ...].
+    """
     query = request.args.get('query', '')
-    if not query: return jsonify([])
+    try:
+        k = int(request.args.get('k', 100))
+    except ValueError:
+        return jsonify({"error": "k must be an integer"}), 400
+    if not 1 <= k <= MAX_SHARD_K:
+        return jsonify({"error": f"k must be between 1 and {MAX_SHARD_K}"}), 400
+    cfg = get_config(request.args.get('version'))
+    if cfg is None:
+        return jsonify({"error": f"unknown version '{request.args.get('version')}'"}), 400
+    mode = request.args.get('mode', 'or')
+    if mode not in QUERY_MODES:
+        return jsonify({"error": f"unknown mode '{mode}'"}), 400
+    try:
+        deadline = get_deadline(request.args)
+    except ValueError:
+        return jsonify({"error": "budget_ms must be a number"}), 400
     query_tokens = tokenize(query)
-    scores = get_body_scores(query_tokens, body_index)
-    sorted_res = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:100]
-    return jsonify([(str(d), id_to_title.get(d, "Unknown")) for d, s in sorted_res])
+    if not query_tokens: return jsonify([])
 
+    gen = current_generation()
+    spell_notes = {}
+    if request.args.get('spell') == '1':
+        query_tokens, spell_notes = spell_correct(query, query_tokens, gen)
+    scores, notes = score_query(query_tokens, gen, cfg, mode, deadline)
+    top_docs = heapq.nlargest(k, scores.items(), key=lambda x: x[1])
+    return annotate(jsonify([(doc_id, score, gen.get_title(doc_id)) for doc_id, score in top_docs]),
+                    {**notes, **spell_notes})
 
-@app.route("/search_title")
-def search_title():
+
+
+# a batch holds its worker for all of its queries
+MAX_BATCH = int(os.getenv("MAX_BATCH", "1000"))
+
+
+@app.route("/search_batch", methods=['POST'])
+def search_batch():
+    """ Runs many /search queries in one call. Body: a JSON list of queries, or
+        {"queries": [...], "version": ..., "mode": ...}, at most MAX_BATCH
+        queries. Returns one /search result list per query, in order.
+        Each distinct term's posting lists are read once for the whole batch.
+    """
+    body = request.get_json(silent=True)
+    if isinstance(body, list):
+        body = {"queries": body}
+    if (not isinstance(body, dict) or not isinstance(body.get("queries"), list)
+            or not all(isinstance(query, str) for query in body["queries"])
+            or not all(isinstance(body.get(key, ""), str) for key in ("version", "mode"))):
+        return jsonify({"error": 'expected a list of query strings or {"queries": [str, ...]}'}), 400
+    if len(body["queries"]) > MAX_BATCH:
+        return jsonify({"error": f"at most {MAX_BATCH} queries per batch"}), 400
+    cfg = get_config(body.get('version'))
+    if cfg is None:
+        return jsonify({"error": f"unknown version '{body.get('version')}'"}), 400
+    mode = body.get('mode', 'or')
+    if mode not in QUERY_MODES:
+        return jsonify({"error": f"unknown mode '{mode}'"}), 400
+
+    gen = current_generation()
+    token_lists = [tokenize(query) for query in body["queries"]]
+    terms = [term for tokens in token_lists for term in tokens]
+    batch_gen = copy.copy(gen)
+    batch_gen.body_index = fetch_postings(gen.body_index, gen.base_dir, terms, read_posting_list)
+    batch_gen.title_index = fetch_postings(gen.title_index, gen.base_dir, terms, read_posting_list)
+    batch_gen.anchor_index = fetch_postings(gen.anchor_index, gen.base_dir, terms, read_posting_list)
+    if cfg.get("bigram") and gen.bigram_index is not None:
+        pairs = [pair for tokens in token_lists for pair in adjacent_pairs(tokens)]
+        batch_gen.bigram_index = fetch_postings(gen.bigram_index, gen.base_dir, pairs, read_posting_list)
+
+    def top_k(query_tokens, k=100):
+        if not query_tokens:
+            return []
+        scores, _ = score_query(query_tokens, batch_gen, cfg, mode)
+        return [doc_id for doc_id, _ in heapq.nlargest(k, scores.items(), key=lambda x: x[1])]
+
+    return jsonify([[(str(doc_id), gen.get_title(doc_id)) for doc_id in top_k(tokens)]
+                    for tokens in token_lists])
+
+
+def field_search(score_fn, index_name):
+    """ A page of (doc_id, title) results of score_fn over one field index,
+        streamed (see paging.py).
+    """
     query = request.args.get('query', '')
     if not query: return jsonify([])
+    try:
+        limit, after = page_args(request.args)
+    except ValueError:
+        return jsonify({"error": "bad limit or cursor"}), 400
+    gen = current_generation()
     query_tokens = tokenize(query)
-    scores = get_title_scores(query_tokens, title_index)
-    sorted_res = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-    return jsonify([(str(d), id_to_title.get(d, "Unknown")) for d, s in sorted_res])
+    scores = score_fn(query_tokens, getattr(gen, index_name), gen)
+    page, more = top_page(scores, limit, after)
+    response = app.response_class(stream_json_list((str(d), gen.get_title(d)) for d, _ in page),
+                                  mimetype='application/json')
+    if more:
+        doc_id, score = page[-1]
+        response.headers['X-Next-Cursor'] = format_cursor(doc_id, score)
+    return response
+
+
+@app.route("/search_body")
+def search_body():
+    return field_search(get_body_scores, 'body_index')
+
+
+@app.route("/search_title")
+def search_title():
+    return field_search(get_title_scores, 'title_index')
 
 
 @app.route("/search_anchor")
 def search_anchor():
+    return field_search(get_title_scores, 'anchor_index')
+
+
+@app.route("/suggest")
+def suggest():
+    """ Title autocomplete: the (up to) k titles with the highest PageRank
+        that start with ?query=, as (doc_id, title) pairs. k is capped at the
+        number of titles stored per prefix, beyond that a prefix's whole
+        title range would be scanned.
+    """
     query = request.args.get('query', '')
-    if not query: return jsonify([])
-    query_tokens = tokenize(query)
-    scores = get_title_scores(query_tokens, anchor_index)
-    sorted_res = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-    return jsonify([(str(d), id_to_title.get(d, "Unknown")) for d, s in sorted_res])
+    try:
+        k = min(int(request.args.get('k', SUGGEST_TOP_K)), SUGGEST_TOP_K)
+    except ValueError:
+        return jsonify({"error": "k must be an integer"}), 400
+    gen = current_generation()
+    if gen.suggester is None:
+        return jsonify({"error": "title suggestions are not built"}), 501
+    if not query or k < 1:
+        return jsonify([])
+    return jsonify([(str(doc_id), title) for doc_id, title in gen.suggester.suggest(query, k)])
 
 
 @app.route("/get_pagerank", methods=['POST'])
 def get_pagerank():
     wiki_ids = request.get_json() or []
-    return jsonify([pagerank_dict.get(doc_id, 0) for doc_id in wiki_ids])
+    gen = current_generation()
+    return jsonify(gen.pagerank.lookup(wiki_ids).tolist())
 
 
 @app.route("/get_pageview", methods=['POST'])
 def get_pageview():
     wiki_ids = request.get_json() or []
-    return jsonify([0] * len(wiki_ids))  # Dummy return to avoid crash
+    gen = current_generation()
+    return jsonify(lookup_pageviews(gen.pageviews, wiki_ids).tolist())
+
+
+@app.route("/reload", methods=['POST'])
+def reload_index():
+    """ Loads a new index generation in the background and swaps it in when it
+        is fully loaded. Optional args: index_dir, meta_dir (default: the
+        folders of the current generation).
+    """
+    gen = current_generation()
+    index_dir = request.args.get('index_dir', gen.index_dir)
+    meta_dir = request.args.get('meta_dir', gen.meta_dir)
+    root = os.path.realpath(RELOAD_ROOT)
+    for path in (index_dir, meta_dir):
+        if os.path.commonpath([root, os.path.realpath(path)]) != root or not os.path.isdir(path):
+            return jsonify({"error": f"'{path}' is not a folder below RELOAD_ROOT"}), 400
+    if not os.path.exists(os.path.join(index_dir, 'body_index.pkl')):
+        return jsonify({"error": f"no index in '{index_dir}'"}), 400
+    if not _reload_lock.acquire(blocking=False):
+        return jsonify({"state": "loading", "generation": gen.generation_id}), 409
+    _reload_status.update(state="loading", error=None)
+    threading.Thread(target=_reload_worker, args=(index_dir, meta_dir), daemon=True).start()
+    return jsonify({"state": "loading", "generation": gen.generation_id}), 202
+
+
+@app.route("/generation")
+def generation():
+    gen = current_generation()
+    return jsonify({"generation": gen.generation_id, "index_dir": gen.index_dir,
+                    "meta_dir": gen.meta_dir, **_reload_status})
+
+
+@app.route("/cache_stats")
+def cache_stats():
+    """ Counters of the posting block cache: hits, misses, bucket requests,
+        bytes fetched from the bucket and bytes the cache saved.
+    """
+    cache = get_block_cache()
+    if cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **cache.get_stats()})
+
+
+@app.route("/ready")
+def ready():
+    """ 200 once the startup warm-up is done, 503 while it runs or when it
+        failed (with its error), unless WARMUP_ALLOW_COLD is set.
+    """
+    ready_states = ("ready", "failed") if WARMUP_ALLOW_COLD else ("ready",)
+    status = 200 if _warmup_status["state"] in ready_states else 503
+    return jsonify({"ready": status == 200, **_warmup_status}), status
+
+
+@app.route("/add_docs", methods=['POST'])
+def add_docs():
+    """ Indexes new or edited pages into delta segments. Body: a JSON list of
+        {"id": int, "title": str, "body": str, "anchor": str}; a field that is
+        left out keeps its current content.
+    """
+    docs = request.get_json(silent=True)
+    if not isinstance(docs, list) or not all(
+            isinstance(doc, dict) and type(doc.get("id")) is int
+            and all(isinstance(doc[field], str) for field in ("title", "body", "anchor") if field in doc)
+            for doc in docs):
+        return jsonify({"error": 'expected a list of {"id": int, "title"/"body"/"anchor": str}'}), 400
+    if _reload_lock.locked():
+        return jsonify({"error": "index reload in progress"}), 409
+    gen = current_generation()
+    titles = {doc["id"]: doc["title"] for doc in docs if "title" in doc}
+    for index, field in zip(gen.segmented_indices(), ("body", "title", "anchor")):
+        field_docs = {doc["id"]: tokenize(doc[field]) for doc in docs if field in doc}
+        if field_docs:
+            doc_norms = {doc_id: get_doc_norm(tokens, index, gen) for doc_id, tokens in field_docs.items()}
+            index.add_documents(field_docs, titles if field == "title" else None, doc_norms)
+    if gen.bigram_index is not None:
+        # only pairs that are already indexed, the bigram vocabulary is fixed
+        # at build time
+        pair_docs = {doc["id"]: [pair for pair in adjacent_pairs(tokenize(doc["body"]))
+                                 if pair in gen.bigram_index.df]
+                     for doc in docs if "body" in doc}
+        if pair_docs:
+            gen.bigram_index.add_documents(pair_docs)
+    return jsonify({"indexed": len(docs)})
+
+
+@app.route("/delete_docs", methods=['POST'])
+def delete_docs():
+    wiki_ids = request.get_json(silent=True)
+    if not isinstance(wiki_ids, list) or not all(type(doc_id) is int for doc_id in wiki_ids):
+        return jsonify({"error": "expected a list of doc ids"}), 400
+    if _reload_lock.locked():
+        return jsonify({"error": "index reload in progress"}), 409
+    for index in current_generation().segmented_indices():
+        index.delete_documents(wiki_ids)
+    return jsonify({"deleted": len(wiki_ids)})
+
+
+# --- Warm-up (see warmup.py) ---
+# the query log records /search queries once the warm-up replay is over
+query_log = None
+_warmup_queries = []
+_warmup_status = {"state": "warming", "queries": 0, "bytes_prefetched": 0, "seconds": None, "error": None}
+
+
+def warm_generation(gen, queries):
+    """ Reads the posting lists of the hottest terms of `queries` in every
+        index of `gen`. Returns the number of bytes read.
+    """
+    token_lists = [tokenize(query) for query in queries]
+    n_bytes = 0
+    for index in gen.segmented_indices():
+        if index is gen.bigram_index:
+            terms = hot_terms([adjacent_pairs(tokens) for tokens in token_lists])
+        else:
+            terms = hot_terms(token_lists)
+        n_bytes += prefetch_postings(index.main_index, gen.base_dir, terms, POSTINGS_BUCKET)
+    return n_bytes
+
+
+def _warmup_worker():
+    global query_log
+    t_start = time.time()
+    try:
+        queries = load_queries(WARMUP_QUERIES)
+        _warmup_queries.extend(queries)
+        _warmup_status.update(queries=len(queries),
+                              bytes_prefetched=warm_generation(current_generation(), queries))
+        # fills the in-process state the first queries would otherwise
+        # create (block cache index, bucket clients, lazily loaded pages)
+        with app.test_client() as client:
+            for query in queries[:WARMUP_REPLAY]:
+                # buffered, so the response is closed and frees its admission slot
+                client.get('/search', query_string={'query': query}, buffered=True)
+        _warmup_status["state"] = "ready"
+    except Exception as e:
+        # /ready reports it, see WARMUP_ALLOW_COLD
+        _warmup_status.update(state="failed", error=str(e))
+        print(f"Warm-up failed: {e}")
+    if QUERY_LOG:
+        query_log = QueryLog(QUERY_LOG)
+    _warmup_status["seconds"] = round(time.time() - t_start, 1)
+    print(f"Warm-up {_warmup_status['state']} after {_warmup_status['seconds']}s: "
+          f"{_warmup_status['queries']} queries, {_warmup_status['bytes_prefetched']} posting bytes")
+
+
+if coordinator is not None:
+    _warmup_status["state"] = "ready"
+elif not WARMUP_QUERIES or not os.path.exists(WARMUP_QUERIES):
+    _warmup_status["state"] = "ready"
+    if QUERY_LOG:
+        query_log = QueryLog(QUERY_LOG)
+else:
+    threading.Thread(target=_warmup_worker, daemon=True).start()
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=int(os.getenv("PORT", "8080")), debug=False)
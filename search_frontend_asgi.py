@@ -0,0 +1,244 @@
+import asyncio
+import copy
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import search_frontend as frontend
+from admission import ADMITTED_ENVIRON_KEY, OVERLOADED_BODY
+from batch_search import PrefetchedIndex
+from bigram_index import adjacent_pairs
+
+# Async serving mode: same routes and JSON as search_frontend.py, served by an
+# ASGI server, e.g.
+#   uvicorn search_frontend_asgi:app --host 0.0.0.0 --port 8080
+# or `python search_frontend_asgi.py`.
+#
+# A request to a route under admission control (ROUTE_PRIORITIES) first waits
+# for its slot, so rejected requests read nothing. For the search routes, the
+# posting lists a request needs are then read on IO_THREADS threads and
+# awaited, so a request waiting for slow disks or GCS holds no worker. The
+# Flask view then runs on the CPU_WORKERS pool against a generation pinned to
+# those prefetched postings, and its response is sent chunk by chunk. All
+# other routes go straight to the Flask app on the CPU pool.
+#
+# Requests that read only parts of the posting lists are not prefetched, whole
+# lists would read more: AND/phrase queries and cascade configs (skip
+# entries), and requests under a latency budget (the query planner reads in
+# chunks and stops at the deadline).
+IO_THREADS = int(os.getenv("IO_THREADS", "64"))
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 1)))
+
+_io_pool = ThreadPoolExecutor(max_workers=IO_THREADS)
+_cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS)
+
+# index fields whose postings each route reads (bigram_index only for configs
+# with a "bigram" weight)
+PREFETCH_FIELDS = {
+    '/search': ('body_index', 'title_index', 'anchor_index', 'bigram_index'),
+    '/search_shard': ('body_index', 'title_index', 'anchor_index', 'bigram_index'),
+    '/search_batch': ('body_index', 'title_index', 'anchor_index', 'bigram_index'),
+    '/search_body': ('body_index',),
+    '/search_title': ('title_index',),
+    '/search_anchor': ('anchor_index',),
+}
+
+
+async def read_posting_list_async(index, term, base_dir):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_pool, frontend.read_posting_list, index, term, base_dir)
+
+
+async def prefetch_index(index, base_dir, terms):
+    """ PrefetchedIndex over `index` with the postings of `terms`, all read
+        concurrently.
+    """
+    terms = [w for w in set(terms) if w in index.df]
+    lists = await asyncio.gather(*(read_posting_list_async(index, w, base_dir) for w in terms))
+    return PrefetchedIndex(index, dict(zip(terms, lists)))
+
+
+def _request_args(path, query_string, body):
+    """ (queries, args) of a search request: its query strings and the other
+        parameters (version, mode, budget_ms). Raises ValueError for a
+        malformed /search_batch body.
+    """
+    if path == '/search_batch':
+        payload = json.loads(body or b'[]')
+        if isinstance(payload, list):
+            return payload, {}
+        return payload.get('queries', []), {k: v for k, v in payload.items() if k != 'queries'}
+    params = parse_qs(query_string)
+    return params.get('query', []), {k: v[0] for k, v in params.items() if k != 'query'}
+
+
+def wants_prefetch(args):
+    """ Whether reading the request's posting lists in full up front pays off
+        (see the notes at the top). Raises ValueError for invalid parameters.
+    """
+    if args.get('mode', 'or') != 'or' or frontend.get_deadline(args) is not None:
+        return False
+    cfg = frontend.get_config(args.get('version'))
+    return cfg is not None and not cfg.get("cascade")
+
+
+async def prefetch_generation(path, queries, args):
+    """ Copy of the current generation whose indices serve this request's
+        posting lists from memory.
+    """
+    gen = frontend.current_generation()
+    token_lists = [frontend.tokenize(query) for query in queries]
+    keys = {field: [term for tokens in token_lists for term in tokens] for field in PREFETCH_FIELDS[path]}
+    if 'bigram_index' in keys:
+        keys['bigram_index'] = [pair for tokens in token_lists for pair in adjacent_pairs(tokens)]
+    if gen.bigram_index is None or not frontend.get_config(args.get('version')).get("bigram"):
+        keys.pop('bigram_index', None)
+    pinned = copy.copy(gen)
+    fields = list(keys)
+    indices = await asyncio.gather(*(prefetch_index(getattr(gen, field), gen.base_dir, keys[field])
+                                     for field in fields))
+    for field, index in zip(fields, indices):
+        setattr(pinned, field, index)
+    return pinned
+
+
+# --- WSGI bridge ---
+
+def _wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'content-length':
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _call_flask(environ):
+    """ Runs the Flask app, returns (status, headers, response iterable).
+        The iterable may still compute the body as it is iterated.
+    """
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+
+    chunks = frontend.app.wsgi_app(environ, start_response)
+    return response['status'], response['headers'], chunks
+
+
+def _next_chunk(it):
+    return next(it, None)
+
+
+def _close(chunks):
+    if hasattr(chunks, 'close'):
+        chunks.close()
+
+
+async def _send_response(send, environ):
+    """ Runs the Flask app on the CPU pool and sends its response, one chunk
+        of the WSGI iterable per message.
+    """
+    loop = asyncio.get_running_loop()
+    status, headers, chunks = await loop.run_in_executor(_cpu_pool, _call_flask, environ)
+    try:
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+        it = iter(chunks)
+        while True:
+            chunk = await loop.run_in_executor(_cpu_pool, _next_chunk, it)
+            if chunk is None:
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        await loop.run_in_executor(_cpu_pool, _close, chunks)
+
+
+async def _reject(send):
+    await send({'type': 'http.response.start', 'status': 503,
+                'headers': [(b'content-type', b'application/json'), (b'retry-after', b'1')]})
+    await send({'type': 'http.response.body', 'body': OVERLOADED_BODY})
+
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    body = await _read_body(receive)
+    environ = _wsgi_environ(scope, body)
+    loop = asyncio.get_running_loop()
+
+    limiter = frontend.limiter
+    priority = None if limiter is None else frontend.ROUTE_PRIORITIES.get(scope['path'])
+    if priority is not None:
+        # waiting for a slot blocks, keep it off the event loop
+        if not await loop.run_in_executor(_io_pool, limiter.acquire, priority):
+            await _reject(send)
+            return
+        environ[ADMITTED_ENVIRON_KEY] = True
+    start = time.monotonic()
+    ok = False
+    try:
+        if frontend.coordinator is None and scope['path'] in PREFETCH_FIELDS:
+            try:
+                queries, args = _request_args(scope['path'], environ['QUERY_STRING'], body)
+                if wants_prefetch(args):
+                    environ[frontend.GENERATION_ENVIRON_KEY] = await prefetch_generation(
+                        scope['path'], queries, args)
+            except (ValueError, TypeError, AttributeError):
+                # malformed input, the Flask view reports it
+                pass
+        await _send_response(send, environ)
+        ok = True
+    finally:
+        if priority is not None:
+            limiter.release(time.monotonic() - start, ok=ok)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.getenv("PORT", "8080")))
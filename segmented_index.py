@@ -0,0 +1,329 @@
+import os
+import pickle
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+from inverted_index_gcp import InvertedIndex
+
+# Tiered compaction: a delta segment's tier is log_TIER_BASE of its number of
+# postings (everything below MIN_TIER_SIZE is tier 0). As soon as a tier holds
+# SEGMENTS_PER_TIER segments they are merged into one segment of the next tier,
+# so the number of segments (and the fan-out of every posting read) stays
+# logarithmic in the amount of freshly indexed content.
+SEGMENTS_PER_TIER = 4
+TIER_BASE = 10
+MIN_TIER_SIZE = 1000
+# A segment whose share of dead postings (deleted or replaced documents)
+# reaches this is rewritten on its own at the next compaction, so its df
+# counts and disk space come back even if its tier never fills up.
+MAX_DEAD_SHARE = 0.2
+
+
+class Segment:
+    """ A delta segment: a small InvertedIndex with its own posting files.
+        `seq` orders segments, the main index has seq 0.
+    """
+
+    def __init__(self, seq, name, index):
+        self.seq = seq
+        self.name = name
+        self.index = index
+        self.n_postings = sum(index.df.values())
+        self.titles = getattr(index, 'titles', {})
+        # length of every document of the segment
+        self.doc_lens = getattr(index, 'DL', {})
+
+    def tier(self):
+        tier, size = 0, MIN_TIER_SIZE
+        while self.n_postings >= size:
+            tier += 1
+            size *= TIER_BASE
+        return tier
+
+
+class _MergedDF:
+    """ Read-only df view over the main index and all delta segments.
+        Documents that were deleted or replaced still count towards df until
+        their segment is compacted (in the main index, until it is rebuilt),
+        which only slightly shifts IDF.
+    """
+
+    def __init__(self, indices):
+        self._indices = indices
+
+    def __contains__(self, w):
+        return any(w in index.df for index in self._indices)
+
+    def __getitem__(self, w):
+        n = sum(index.df.get(w, 0) for index in self._indices)
+        if n == 0:
+            raise KeyError(w)
+        return n
+
+    def get(self, w, default=None):
+        n = sum(index.df.get(w, 0) for index in self._indices)
+        return n if n else default
+
+
+class _MergedDocStats:
+    """ Read-only view of a per-document dict (DL, doc_norms) over the main
+        index and the delta segments: a document's newest version lives in
+        the newest segment holding it, so segments are searched newest first.
+        len() is the main index's, the few added documents do not change it
+        noticeably.
+    """
+
+    def __init__(self, main, segments, attr):
+        self._main = main
+        # (documents of the segment, its dict), newest segment first
+        self._segment_dicts = [(seg.doc_lens, getattr(seg.index, attr, {})) for seg in reversed(segments)]
+
+    def __len__(self):
+        return len(self._main)
+
+    def get(self, doc_id, default=None):
+        for docs, d in self._segment_dicts:
+            if doc_id in docs:
+                return d.get(doc_id, default)
+        return self._main.get(doc_id, default)
+
+
+class SegmentedIndex:
+    """ The write-once main index plus delta segments and tombstones.
+
+        New or edited documents are written into a new delta segment. Every
+        write gets a new sequence number and marks its doc ids in `tombstones`
+        with it; a posting coming from a segment older than the tombstone of its
+        doc is dead. That covers both deletions and edits (the new version lives
+        in the segment carrying the tombstone's seq).
+
+        The segment list and tombstones are replaced as a whole on every write,
+        so a reader that grabbed `_state` once sees a consistent snapshot.
+        DL and doc_norms look in the delta segments first, everything else
+        (posting_locs, ...) is forwarded to the main index.
+    """
+
+    def __init__(self, base_dir, name, main_index):
+        self._base_dir = Path(base_dir)
+        self._name = name
+        # field name ("body", "title", "anchor")
+        self.name = name
+        self._main = main_index
+        self._write_lock = threading.Lock()
+        # files of merged segments, deleted one compaction later so reads that
+        # started before the merge can still finish
+        self._retired = []
+        segments, tombstones, self._next_seq = [], {}, 1
+        manifest = self._manifest_path()
+        if manifest.exists():
+            with open(manifest, 'rb') as f:
+                state = pickle.load(f)
+            segments = [Segment(seq, seg_name, InvertedIndex.read_index(base_dir, seg_name))
+                        for seq, seg_name in state['segments']]
+            tombstones = state['tombstones']
+            self._next_seq = state['next_seq']
+        self._set_state(segments, tombstones)
+
+    def __getattr__(self, attr):
+        # only called for attributes not found on the SegmentedIndex itself
+        if attr.startswith('__') or attr == '_main':
+            raise AttributeError(attr)
+        return getattr(self._main, attr)
+
+    def _manifest_path(self):
+        return self._base_dir / f'{self._name}_segments.pkl'
+
+    def _set_state(self, segments, tombstones):
+        self.df = _MergedDF([self._main] + [seg.index for seg in segments])
+        # document lengths and norms of added documents come from their
+        # segment, the main index only has them for the documents it was
+        # built from (and keeps stale ones for replaced documents)
+        for attr in ('DL', 'doc_norms'):
+            if hasattr(self._main, attr):
+                main = getattr(self._main, attr)
+                setattr(self, attr, main if not segments else _MergedDocStats(main, segments, attr))
+        self._state = (tuple(segments), tombstones)
+
+    def _write_manifest(self):
+        segments, tombstones = self._state
+        state = {'segments': [(seg.seq, seg.name) for seg in segments],
+                 'tombstones': tombstones,
+                 'next_seq': self._next_seq}
+        path = self._manifest_path()
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f)
+        os.replace(tmp, path)
+
+    @property
+    def main_index(self):
+        return self._main
+
+    @property
+    def segments(self):
+        return self._state[0]
+
+    def has_deltas(self):
+        """ True while postings have to be merged with delta segments or
+            filtered by tombstones. Direct reads of the main index's posting
+            files (skips, read_posting_range) are only valid otherwise.
+        """
+        segments, tombstones = self._state
+        return bool(segments or tombstones)
+
+    @property
+    def skips(self):
+        return {} if self.has_deltas() else self._main.skips
+
+    def get_title(self, doc_id):
+        """ Title of a document added through a delta segment, or None. """
+        for seg in reversed(self._state[0]):
+            if doc_id in seg.titles:
+                return seg.titles[doc_id]
+        return None
+
+    # --- Reading ---
+
+    def read_a_posting_list(self, base_dir, w, bucket_name=None):
+        segments, tombstones = self._state
+        if not segments and not tombstones:
+            return self._main.read_a_posting_list(base_dir, w, bucket_name)
+
+        posting_list = []
+        for seq, index in [(0, self._main)] + [(seg.seq, seg.index) for seg in segments]:
+            if w not in index.df:
+                continue
+            # delta segments are always written to local disk
+            postings = index.read_a_posting_list(base_dir, w, bucket_name if seq == 0 else None)
+            if tombstones:
+                postings = [(doc_id, tf) for doc_id, tf in postings
+                            if tombstones.get(doc_id, 0) <= seq]
+            posting_list.extend(postings)
+        posting_list.sort()
+        return posting_list
+
+    # --- Writing ---
+
+    def add_documents(self, docs, titles=None, doc_norms=None):
+        """ Index `docs` (dict doc_id -> tokens) into a new delta segment.
+            Doc ids that already exist are replaced. `doc_norms` (doc_id ->
+            norm) is stored with the segment for cosine scoring.
+        """
+        with self._write_lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            seg_name = f'{self._name}_seg{seq:06}'
+            index = InvertedIndex(docs)
+            index.titles = dict(titles or {})
+            index.DL = {doc_id: len(tokens) for doc_id, tokens in docs.items()}
+            index.doc_norms = dict(doc_norms or {})
+            index.write_posting_lists(self._base_dir, seg_name)
+            index.write_index(self._base_dir, seg_name)
+
+            segments, tombstones = self._state
+            tombstones = {**tombstones, **{doc_id: seq for doc_id in docs}}
+            self._set_state(list(segments) + [Segment(seq, seg_name, index)], tombstones)
+            self._write_manifest()
+
+    def delete_documents(self, doc_ids):
+        with self._write_lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            segments, tombstones = self._state
+            tombstones = {**tombstones, **{doc_id: seq for doc_id in doc_ids}}
+            self._set_state(segments, tombstones)
+            self._write_manifest()
+
+    # --- Compaction ---
+
+    def compact(self):
+        """ Merge delta segments following the tiered policy, rewrite segments
+            with many dead postings and drop tombstones that no longer hide
+            anything. Returns the number of merges done.
+        """
+        with self._write_lock:
+            for path in self._retired:
+                path.unlink(missing_ok=True)
+            self._retired = []
+
+            merges = 0
+            while True:
+                tiers = defaultdict(list)
+                for seg in self._state[0]:
+                    tiers[seg.tier()].append(seg)
+                full = [segs for _, segs in sorted(tiers.items()) if len(segs) >= SEGMENTS_PER_TIER]
+                if not full:
+                    break
+                self._merge(full[0][:SEGMENTS_PER_TIER])
+                merges += 1
+            for seg in self._state[0]:
+                if self._dead_share(seg) >= MAX_DEAD_SHARE:
+                    self._merge([seg])
+                    merges += 1
+            self._reclaim_tombstones()
+            return merges
+
+    def _dead_share(self, seg):
+        tombstones = self._state[1]
+        if not seg.doc_lens:
+            return 0
+        dead = sum(1 for doc_id in seg.doc_lens if tombstones.get(doc_id, 0) > seg.seq)
+        return dead / len(seg.doc_lens)
+
+    def _reclaim_tombstones(self):
+        """ A tombstone is only needed while the main index or a segment older
+            than it still holds a posting of its document. Without a document
+            list of the main index (no DL), every tombstone may hide one there.
+        """
+        segments, tombstones = self._state
+        main_docs = getattr(self._main, 'DL', None)
+        if main_docs is None or not tombstones:
+            return
+        needed = {doc_id: seq for doc_id, seq in tombstones.items()
+                  if doc_id in main_docs
+                  or any(seg.seq < seq and doc_id in seg.doc_lens for seg in segments)}
+        if len(needed) < len(tombstones):
+            self._set_state(segments, needed)
+            self._write_manifest()
+
+    def _merge(self, to_merge):
+        segments, tombstones = self._state
+        seq = max(seg.seq for seg in to_merge)
+        # file names must be fresh, the inputs are still being read
+        seg_name = f'{self._name}_seg{self._next_seq:06}'
+        self._next_seq += 1
+
+        # drop dead postings now, the merged segment gets the newest seq of its
+        # inputs and would otherwise revive them
+        merged = InvertedIndex()
+        merged.titles, merged.DL, merged.doc_norms = {}, {}, {}
+        for seg in to_merge:
+            def live(doc_id):
+                return tombstones.get(doc_id, 0) <= seg.seq
+
+            for w in seg.index.posting_locs:
+                for doc_id, tf in seg.index.read_a_posting_list(self._base_dir, w):
+                    if live(doc_id):
+                        merged._posting_list[w].append((doc_id, tf))
+            merged.titles.update({doc_id: title for doc_id, title in seg.titles.items() if live(doc_id)})
+            merged.DL.update({doc_id: n for doc_id, n in seg.doc_lens.items() if live(doc_id)})
+            merged.doc_norms.update({doc_id: norm for doc_id, norm in getattr(seg.index, 'doc_norms', {}).items()
+                                     if live(doc_id)})
+        for w, pl in merged._posting_list.items():
+            merged.df[w] = len(pl)
+            merged.term_total[w] = sum(tf for _, tf in pl)
+
+        merged_names = {seg.name for seg in to_merge}
+        new_segments = [seg for seg in segments if seg.name not in merged_names]
+        # nothing of the inputs is alive any more, drop them without a new segment
+        if merged._posting_list or merged.titles:
+            merged.write_posting_lists(self._base_dir, seg_name)
+            merged.write_index(self._base_dir, seg_name)
+            new_segments = sorted(new_segments + [Segment(seq, seg_name, merged)], key=lambda seg: seg.seq)
+        self._set_state(new_segments, tombstones)
+        self._write_manifest()
+
+        for name in merged_names:
+            self._retired.append(self._base_dir / f'{name}.pkl')
+            self._retired.extend(self._base_dir.glob(f'{name}_[0-9][0-9][0-9].bin'))
@@ -0,0 +1,118 @@
+import heapq
+import json
+import os
+import pickle
+import urllib.parse
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+
+from inverted_index_gcp import InvertedIndex
+
+# Documents are split across shards by doc_id, every shard holds complete body,
+# title and anchor indices for its documents. Scores are only comparable across
+# shards when every shard computes IDF from the same numbers, so the builder
+# also writes the corpus-wide df and N next to each shard ("global stats").
+GLOBAL_STATS_FILE = 'global_stats.pkl'
+FIELDS = ('body', 'title', 'anchor')
+
+
+def shard_of(doc_id, n_shards):
+    """ The shard a document belongs to. Use the same function when
+        partitioning RDDs in the Spark builder.
+    """
+    return doc_id % n_shards
+
+
+def shard_dir(out_dir, shard_id):
+    return Path(out_dir) / f'shard_{shard_id:03}'
+
+
+def build_shards(field_docs, out_dir, n_shards):
+    """ Partition the documents into `n_shards` shards and write one index per
+        field and shard.
+    Parameters:
+    -----------
+      field_docs: dict mapping field name ("body", "title", "anchor") to a dict
+        of doc_id -> list of tokens.
+      out_dir: folder that gets one shard_NNN sub-folder per shard.
+    Returns:
+    --------
+      The global stats dict written next to every shard.
+    """
+    global_df = {}
+    n_docs = set()
+    for field in FIELDS:
+        docs = field_docs.get(field, {})
+        n_docs.update(docs)
+        shards = [{} for _ in range(n_shards)]
+        for doc_id, tokens in docs.items():
+            shards[shard_of(doc_id, n_shards)][doc_id] = tokens
+
+        df = Counter()
+        for shard_id, shard_docs in enumerate(shards):
+            base_dir = shard_dir(out_dir, shard_id)
+            base_dir.mkdir(parents=True, exist_ok=True)
+            index = InvertedIndex(shard_docs)
+            index.write_posting_lists(base_dir, field)
+            index.write_index(base_dir, f'{field}_index')
+            df.update(index.df)
+        global_df[field] = dict(df)
+
+    stats = {'n_shards': n_shards, 'N': len(n_docs), 'df': global_df}
+    for shard_id in range(n_shards):
+        with open(shard_dir(out_dir, shard_id) / GLOBAL_STATS_FILE, 'wb') as f:
+            pickle.dump({**stats, 'shard_id': shard_id}, f)
+    return stats
+
+
+def read_global_stats(index_dir):
+    """ Global stats of a shard folder, or None for an unsharded index. """
+    path = os.path.join(index_dir, GLOBAL_STATS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+class ShardCoordinator:
+    """ Fans a query out to the shard workers and merges their top-k lists.
+        Shards that do not answer within `timeout` seconds are left out, the
+        caller gets the list of missing shards to flag partial results.
+    """
+
+    def __init__(self, shard_urls, timeout):
+        self.shard_urls = shard_urls
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=4 * len(shard_urls))
+
+    def _query_shard(self, url, params):
+        full_url = f'{url.rstrip("/")}/search_shard?{urllib.parse.urlencode(params)}'
+        with urllib.request.urlopen(full_url, timeout=self.timeout) as response:
+            return json.loads(response.read()), response.headers
+
+    def search(self, params, k=100):
+        """ Returns (top-k [(doc_id, score, title), ...], missing shard urls,
+            notes merged from the shards' response headers).
+        """
+        params = {**params, 'k': k}
+        futures = {url: self._pool.submit(self._query_shard, url, params)
+                   for url in self.shard_urls}
+        wait(futures.values(), timeout=self.timeout)
+
+        results, missing, notes = [], [], {}
+        for url, future in futures.items():
+            if future.done() and future.exception() is None:
+                shard_results, headers = future.result()
+                results.extend(shard_results)
+                if headers.get('X-Result-Approximate'):
+                    notes['approximate'] = True
+                if headers.get('X-Skipped-Terms'):
+                    notes['skipped_terms'] = headers['X-Skipped-Terms'].split(',')
+                if headers.get('X-Corrected-Query'):
+                    notes['corrected_query'] = urllib.parse.unquote(headers['X-Corrected-Query'])
+            else:
+                future.cancel()
+                missing.append(url)
+        return heapq.nlargest(k, results, key=lambda x: x[1]), missing, notes
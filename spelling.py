@@ -0,0 +1,199 @@
+import argparse
+import os
+import pickle
+import zlib
+from collections import Counter
+from time import time
+
+import numpy as np
+
+from sharding import read_global_stats
+
+# Spelling correction with symmetric deletes (SymSpell). Every vocabulary
+# term is stored under all strings obtained by deleting up to MAX_DISTANCE
+# characters from its first PREFIX_LENGTH characters. A misspelled term
+# generates the same deletes of its own prefix, so the terms within the edit
+# distance are found with a few lookups, without scanning the vocabulary.
+# The deletes are stored as sorted 32-bit hashes next to their term numbers,
+# so a lookup is a binary search; the candidates are then checked with the
+# real edit distance, which also weeds out hash collisions. Among the terms
+# at the smallest distance the most frequent one (term_total, or df for
+# indices built without it) wins.
+SPELLING_FILE = 'spelling.npz'
+MAX_DISTANCE = 2
+PREFIX_LENGTH = 7
+# terms of at most this length are corrected by one edit only
+SHORT_TERM = 4
+MAX_TERMS = 500_000
+
+
+def _hash(s):
+    return zlib.crc32(s.encode('utf-8'))
+
+
+def _deletes(term, max_distance):
+    """ term and every string made by deleting up to max_distance characters. """
+    result = {term}
+    frontier = {term}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))} - result
+        result |= frontier
+    return result
+
+
+def edit_distance(a, b, max_distance):
+    """ Optimal string alignment distance (Levenshtein plus adjacent
+        transpositions), or max_distance + 1 once it is known to be larger.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    # a typo changes a few characters in the middle, the common prefix and
+    # suffix do not change the distance
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    if not a or not b:
+        return len(a) + len(b)
+
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            d = prev[j - 1] if a[i - 1] == b[j - 1] else prev[j - 1] + 1
+            if prev[j] + 1 < d:
+                d = prev[j] + 1
+            if cur[j - 1] + 1 < d:
+                d = cur[j - 1] + 1
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1] and prev2[j - 2] + 1 < d:
+                d = prev2[j - 2] + 1
+            cur[j] = d
+        if min(cur) > max_distance:
+            return max_distance + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def vocabulary_counts(indices):
+    """ term -> total count over `indices`, from term_total where the index
+        has it and df otherwise.
+    """
+    counts = Counter()
+    for index in indices:
+        counts.update(index.term_total if getattr(index, 'term_total', None) else index.df)
+    return counts
+
+
+def build_spelling(counts, out_path, max_terms=MAX_TERMS):
+    """ Write the delete index of the `max_terms` most frequent terms of
+        `counts` (term -> count) to out_path (.npz).
+    """
+    terms = [term for term, _ in counts.most_common(max_terms)]
+    hashes, term_ids = [], []
+    for term_id, term in enumerate(terms):
+        for d in _deletes(term[:PREFIX_LENGTH], MAX_DISTANCE):
+            hashes.append(_hash(d))
+            term_ids.append(term_id)
+    hashes = np.array(hashes, dtype=np.uint32)
+    order = np.argsort(hashes, kind='stable')
+    encoded = [term.encode('utf-8') for term in terms]
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    np.savez(out_path,
+             terms=np.frombuffer(b''.join(encoded), dtype=np.uint8), term_offsets=offsets,
+             counts=np.array([counts[term] for term in terms], dtype=np.int64),
+             lengths=np.array([len(term) for term in terms], dtype=np.int16),
+             hashes=hashes[order], term_ids=np.array(term_ids, dtype=np.int32)[order])
+    return len(terms), len(hashes)
+
+
+class SpellChecker:
+    """ Corrections over the arrays written by build_spelling. """
+
+    def __init__(self, terms, term_offsets, counts, lengths, hashes, term_ids):
+        self._terms = terms
+        self._term_offsets = term_offsets
+        self._counts = counts
+        self._lengths = lengths
+        self._hashes = hashes
+        self._term_ids = term_ids
+
+    @staticmethod
+    def load(path):
+        data = np.load(path)
+        return SpellChecker(data['terms'], data['term_offsets'], data['counts'], data['lengths'],
+                            data['hashes'], data['term_ids'])
+
+    def __len__(self):
+        return len(self._counts)
+
+    def _term(self, term_id):
+        return self._terms[self._term_offsets[term_id]:self._term_offsets[term_id + 1]].tobytes().decode('utf-8')
+
+    def candidates(self, term, max_distance=MAX_DISTANCE):
+        """ Numbers of the terms sharing a delete with `term`. """
+        keys = np.array(sorted(_hash(d) for d in _deletes(term[:PREFIX_LENGTH], max_distance)), dtype=np.uint32)
+        lo = np.searchsorted(self._hashes, keys, side='left')
+        n = np.searchsorted(self._hashes, keys, side='right') - lo
+        # positions lo[i], ..., lo[i] + n[i] - 1 for every key, in one array
+        steps = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        return np.unique(self._term_ids[np.repeat(lo, n) + steps])
+
+    def correct(self, term):
+        """ The most frequent vocabulary term at the smallest edit distance
+            from `term` (at most MAX_DISTANCE, 1 for short terms), or None.
+        """
+        max_distance = 1 if len(term) <= SHORT_TERM else MAX_DISTANCE
+        candidates = self.candidates(term, max_distance)
+        # deletes only cover the prefix, drop terms whose length rules them out
+        candidates = candidates[np.abs(self._lengths[candidates] - len(term)) <= max_distance]
+        # a vocabulary term needs no correction, even if a more frequent term
+        # is one edit away
+        if any(self._term(term_id) == term
+               for term_id in candidates[self._lengths[candidates] == len(term)].tolist()):
+            return None
+        # most frequent first, so the first hit at a distance is the answer
+        candidates = candidates[np.argsort(-self._counts[candidates], kind='stable')]
+        best, best_distance = None, max_distance + 1
+        for term_id in candidates.tolist():
+            candidate = self._term(term_id)
+            distance = edit_distance(term, candidate, best_distance - 1)
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+                if distance == 1:
+                    # nothing closer than one edit but the term itself
+                    break
+        return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the spelling correction index.")
+    parser.add_argument('--index-dir', default='postings_gcp')
+    parser.add_argument('--indices', nargs='+', default=['body_index', 'title_index'])
+    parser.add_argument('--out', default=None, help=f"default: INDEX_DIR/{SPELLING_FILE}")
+    parser.add_argument('--max-terms', type=int, default=MAX_TERMS)
+    args = parser.parse_args()
+
+    t_start = time()
+    stats = read_global_stats(args.index_dir)
+    if stats is not None:
+        # a shard: the corpus-wide df, so every shard corrects the same way
+        counts = Counter()
+        for name in args.indices:
+            counts.update(stats['df'].get(name.removesuffix('_index'), {}))
+    else:
+        indices = []
+        for name in args.indices:
+            with open(os.path.join(args.index_dir, f'{name}.pkl'), 'rb') as f:
+                indices.append(pickle.load(f))
+        counts = vocabulary_counts(indices)
+    out = args.out or os.path.join(args.index_dir, SPELLING_FILE)
+    n_terms, n_deletes = build_spelling(counts, out, args.max_terms)
+    print(f"{n_terms} terms, {n_deletes} deletes written to {out} ({time() - t_start:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -20,5 +20,6 @@ pip install \
   'nltk==3.6.3' \
   'pandas' \
   'google-cloud-storage' \
-  'numpy>=1.23.2,<3'
+  'numpy>=1.23.2,<3' \
+  'uvicorn>=0.22,<1'
 "
@@ -0,0 +1,170 @@
+import argparse
+import os
+import pickle
+import re
+from bisect import bisect_left, bisect_right
+from time import time
+
+import numpy as np
+
+from pagerank import PageRankStore
+
+# Title autocomplete. Titles are normalized (lowercase, single spaces) and
+# sorted by their UTF-8 bytes, so the titles starting with a prefix are one
+# contiguous range, found by binary search. Ranges of more than SCAN_LIMIT
+# titles are too slow to rank per request: for every such prefix (up to
+# MAX_PREFIX_BYTES long) the build stores the TOP_K titles with the highest
+# PageRank. Everything is written as .npy arrays into one folder and
+# memory-mapped by the frontend.
+SUGGEST_DIR = 'suggest'
+TOP_K = 10
+SCAN_LIMIT = 256
+MAX_PREFIX_BYTES = 16
+
+RE_SPACES = re.compile(r'[\s_]+')
+
+
+def normalize(title):
+    return RE_SPACES.sub(' ', title.casefold()).strip()
+
+
+def _blob(strings):
+    """ (uint8 array of the concatenated strings, int64 offsets, len n + 1) """
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in strings], out=offsets[1:])
+    return np.frombuffer(b''.join(strings), dtype=np.uint8), offsets
+
+
+def _top(ranks, lo, hi, k):
+    """ Positions in [lo, hi) of the k highest ranks, best first. """
+    r = ranks[lo:hi]
+    if hi - lo > k:
+        part = np.argpartition(-r, k)[:k]
+        return lo + part[np.argsort(-r[part], kind='stable')]
+    return lo + np.argsort(-r, kind='stable')
+
+
+def _popular_prefixes(keys, ranks, k=TOP_K, scan_limit=SCAN_LIMIT, max_len=MAX_PREFIX_BYTES):
+    """ {prefix: top-k positions} for every prefix matching more than
+        `scan_limit` of the sorted `keys`. Only children of popular prefixes
+        can be popular, so the search descends from the empty prefix.
+    """
+    popular = {}
+    stack = [(b'', 0, len(keys))]
+    while stack:
+        prefix, lo, hi = stack.pop()
+        length = len(prefix) + 1
+        if length > max_len:
+            continue
+        i = lo
+        while i < hi:
+            if len(keys[i]) < length:
+                # the prefix itself, sorts before its extensions
+                i += 1
+                continue
+            child = keys[i][:length]
+            j = bisect_right(keys, child, i, hi, key=lambda key: key[:length])
+            if j - i > scan_limit:
+                popular[child] = _top(ranks, i, j, k)
+                stack.append((child, i, j))
+            i = j
+    return popular
+
+
+def build_suggest(id2title, pagerank, out_dir=SUGGEST_DIR, k=TOP_K, scan_limit=SCAN_LIMIT):
+    """ Write the autocomplete arrays for `id2title` (dict doc_id -> title),
+        ranked by `pagerank` (a PageRankStore), into out_dir.
+    """
+    entries = sorted((normalize(title).encode('utf-8'), doc_id, title)
+                     for doc_id, title in id2title.items() if title)
+    keys = [key for key, _, _ in entries]
+    doc_ids = np.array([doc_id for _, doc_id, _ in entries], dtype=np.int64)
+    ranks = pagerank.lookup(doc_ids).astype(np.float32)
+    popular = _popular_prefixes(keys, ranks, k, scan_limit)
+
+    prefixes = sorted(popular)
+    top = np.full((len(prefixes), k), -1, dtype=np.int32)
+    for row, prefix in enumerate(prefixes):
+        top[row, :len(popular[prefix])] = popular[prefix]
+
+    os.makedirs(out_dir, exist_ok=True)
+    arrays = {'doc_ids': doc_ids, 'ranks': ranks, 'top': top}
+    arrays['keys'], arrays['key_offsets'] = _blob(keys)
+    arrays['titles'], arrays['title_offsets'] = _blob([title.encode('utf-8') for _, _, title in entries])
+    arrays['prefixes'], arrays['prefix_offsets'] = _blob(prefixes)
+    for name, array in arrays.items():
+        np.save(os.path.join(out_dir, f'{name}.npy'), array)
+    return len(keys), len(prefixes)
+
+
+class TitleSuggester:
+    """ Prefix lookups over the arrays written by build_suggest. """
+
+    def __init__(self, arrays):
+        # plain ndarray views of the memory maps, slicing a np.memmap is slower
+        self.__dict__.update({name: np.asarray(array) for name, array in arrays.items()})
+        self.k = self.top.shape[1]
+
+    @staticmethod
+    def load(path):
+        names = ['doc_ids', 'ranks', 'top', 'keys', 'key_offsets', 'titles', 'title_offsets',
+                 'prefixes', 'prefix_offsets']
+        return TitleSuggester({name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+                               for name in names})
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def _key(self, i):
+        return self.keys[self.key_offsets[i]:self.key_offsets[i + 1]].tobytes()
+
+    def _prefix(self, i):
+        return self.prefixes[self.prefix_offsets[i]:self.prefix_offsets[i + 1]].tobytes()
+
+    def title(self, i):
+        return self.titles[self.title_offsets[i]:self.title_offsets[i + 1]].tobytes().decode('utf-8')
+
+    def _positions(self, prefix, k):
+        n_prefixes = len(self.prefix_offsets) - 1
+        if k <= self.k:
+            row = bisect_left(range(n_prefixes), prefix, key=self._prefix)
+            if row < n_prefixes and self._prefix(row) == prefix:
+                top = self.top[row]
+                return top[top >= 0][:k]
+        n = len(self.doc_ids)
+        lo = bisect_left(range(n), prefix, key=self._key)
+        hi = bisect_right(range(n), prefix, lo, key=lambda i: self._key(i)[:len(prefix)])
+        return _top(self.ranks, lo, hi, k)
+
+    def suggest(self, prefix, k=TOP_K):
+        """ [(doc_id, title), ...] of the k titles with the highest PageRank
+            that start with `prefix` (after normalization).
+        """
+        prefix = normalize(prefix).encode('utf-8')
+        if not prefix:
+            return []
+        return [(int(self.doc_ids[i]), self.title(i)) for i in self._positions(prefix, k).tolist()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the title autocomplete arrays.")
+    parser.add_argument('--id2title', default='id2title.pkl')
+    parser.add_argument('--pagerank', default='pagerank.pkl', help="pagerank.pkl or pagerank.npz")
+    parser.add_argument('--out', default=SUGGEST_DIR)
+    args = parser.parse_args()
+
+    t_start = time()
+    with open(args.id2title, 'rb') as f:
+        id2title = pickle.load(f)
+    if args.pagerank.endswith('.npz'):
+        pagerank = PageRankStore.load(args.pagerank)
+    else:
+        with open(args.pagerank, 'rb') as f:
+            pagerank = PageRankStore.from_dict(pickle.load(f))
+    n_titles, n_prefixes = build_suggest(id2title, pagerank, args.out)
+    print(f"{n_titles} titles, {n_prefixes} precomputed prefixes written to {args.out} "
+          f"({time() - t_start:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
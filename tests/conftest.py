@@ -0,0 +1,77 @@
+import pickle
+import random
+import sys
+from pathlib import Path
+
+import pytest
+from flask.testing import FlaskClient
+
+# the modules live flat in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bigram_index import build_bigram_index  # noqa: E402
+from inverted_index_gcp import InvertedIndex  # noqa: E402
+from pagerank import PageRankStore  # noqa: E402
+from suggest import SUGGEST_DIR, build_suggest  # noqa: E402
+
+WORDS = ['python', 'data', 'science', 'machine', 'learning', 'search', 'engine', 'history', 'war', 'world',
+         'river', 'city', 'music', 'film', 'album', 'king', 'queen', 'mount', 'everest', 'fire', 'london']
+
+
+def write_index(base_dir, name, docs, with_dl=False):
+    index = InvertedIndex(docs)
+    if with_dl:
+        index.DL = {doc_id: len(tokens) for doc_id, tokens in docs.items()}
+    index.doc_norms = {doc_id: 1.0 for doc_id in docs}
+    index.write_posting_lists(base_dir, name)
+    index.write_index(base_dir, f'{name}_index')
+    return index
+
+
+@pytest.fixture(scope='session')
+def frontend(tmp_path_factory):
+    """ search_frontend imported over a small random index of 2000 documents
+        (it loads its index on import), with a bigram index and title
+        suggestions, without warm-up.
+    """
+    root = tmp_path_factory.mktemp('frontend')
+    index_dir = root / 'postings_gcp'
+    index_dir.mkdir()
+    rng = random.Random(0)
+    body = {doc_id: rng.choices(WORDS, weights=range(len(WORDS), 0, -1), k=rng.randint(5, 60))
+            for doc_id in range(1, 2001)}
+    titles = {doc_id: ' '.join(rng.sample(WORDS, 3)) for doc_id in body}
+    write_index(index_dir, 'body', body, with_dl=True)
+    build_bigram_index(body, index_dir, min_df=50)
+    write_index(index_dir, 'title', {doc_id: title.split() for doc_id, title in titles.items()})
+    write_index(index_dir, 'anchor', {doc_id: rng.sample(WORDS, 4) for doc_id in body if doc_id % 3})
+    pagerank = {doc_id: rng.random() * 10 for doc_id in body}
+    with open(root / 'pagerank.pkl', 'wb') as f:
+        pickle.dump(pagerank, f)
+    with open(root / 'id2title.pkl', 'wb') as f:
+        pickle.dump(titles, f)
+    build_suggest(titles, PageRankStore.from_dict(pagerank), str(root / SUGGEST_DIR))
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(root)
+        for name, value in [('INDEX_DIR', str(index_dir)), ('META_DIR', str(root)), ('WARMUP_QUERIES', ''),
+                            ('QUERY_BUDGET_MS', '0')]:
+            mp.setenv(name, value)
+        import search_frontend
+        search_frontend.app.test_client_class = BufferedClient
+        yield search_frontend
+
+
+class BufferedClient(FlaskClient):
+    """ Test client that reads every response right away, which closes it
+        and frees its admission slot.
+    """
+
+    def open(self, *args, **kwargs):
+        kwargs.setdefault('buffered', True)
+        return super().open(*args, **kwargs)
+
+
+@pytest.fixture
+def client(frontend):
+    return frontend.app.test_client()
@@ -0,0 +1,73 @@
+import threading
+
+from admission import GradientLimiter
+
+
+def test_limit_and_queue():
+    limiter = GradientLimiter(initial_limit=2, queue_size=0, queue_timeout_ms=10)
+    assert limiter.acquire() and limiter.acquire()
+    # no slot and no room to wait
+    assert not limiter.acquire()
+    limiter.release(0.01)
+    assert limiter.acquire()
+    assert limiter.get_stats()['in_flight'] == 2
+    assert limiter.stats['rejected'] == 1
+
+
+def test_waiting_request_times_out():
+    limiter = GradientLimiter(initial_limit=1, queue_size=4, queue_timeout_ms=20)
+    assert limiter.acquire()
+    assert not limiter.acquire()
+    assert limiter.stats['timed_out'] == 1
+    assert limiter.get_stats()['waiting'] == [0, 0, 0]
+
+
+def test_waiting_request_gets_released_slot():
+    limiter = GradientLimiter(initial_limit=1, queue_size=4, queue_timeout_ms=5000)
+    assert limiter.acquire()
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(limiter.acquire()))
+    waiter.start()
+    while limiter.get_stats()['waiting'][0] == 0:
+        pass
+    limiter.release(0.01)
+    waiter.join()
+    assert result == [True]
+
+
+def test_priority_shares():
+    limiter = GradientLimiter(initial_limit=4, queue_size=0, shares=(1.0, 0.5))
+    # low priority requests may only take half the limit
+    assert limiter.acquire(1) and limiter.acquire(1)
+    assert not limiter.acquire(1)
+    assert limiter.acquire(0) and limiter.acquire(0)
+    assert not limiter.acquire(0)
+
+
+def test_limit_adapts_to_latency():
+    limiter = GradientLimiter(initial_limit=10, min_limit=2, max_limit=100)
+    # requests keep the server busy at the unloaded latency: the limit grows
+    for _ in range(200):
+        for _ in range(10):
+            limiter.acquire()
+        for _ in range(10):
+            limiter.release(0.01)
+    grown = limiter.limit
+    assert grown > 10
+    # latency goes up tenfold: the limit shrinks (until the slow average
+    # takes the new latency as the unloaded one)
+    for _ in range(3):
+        n = int(limiter.limit)
+        for _ in range(n):
+            limiter.acquire()
+        for _ in range(n):
+            limiter.release(0.1)
+    assert limiter.limit < grown
+
+
+def test_failed_requests_only_free_their_slot():
+    limiter = GradientLimiter(initial_limit=1)
+    assert limiter.acquire()
+    limiter.release(10.0, ok=False)
+    stats = limiter.get_stats()
+    assert stats['in_flight'] == 0 and stats['completed'] == 0 and stats['short_rtt_ms'] is None
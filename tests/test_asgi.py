@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+import pytest
+
+from batch_search import PrefetchedIndex
+
+
+@pytest.fixture(scope='module')
+def asgi(frontend):
+    import search_frontend_asgi
+    return search_frontend_asgi
+
+
+def call(app, method, path, query_string=b'', body=b''):
+    """ (status, headers, body) of one request to the ASGI `app`. """
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query_string,
+             'headers': [(b'content-type', b'application/json')]}
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start = sent[0]
+    return start['status'], dict(start['headers']), b''.join(m.get('body', b'') for m in sent[1:])
+
+
+def test_search_matches_flask(asgi, client):
+    for query in ['python data', 'river city music', 'nothingmatches']:
+        status, headers, body = call(asgi.app, 'GET', '/search', f'query={query}'.encode())
+        assert status == 200 and headers[b'content-type'] == b'application/json'
+        assert json.loads(body) == client.get('/search', query_string={'query': query}).get_json()
+
+
+def test_batch_matches_flask(asgi, client):
+    queries = ['python data', 'king queen']
+    status, _, body = call(asgi.app, 'POST', '/search_batch', body=json.dumps(queries).encode())
+    assert status == 200
+    assert json.loads(body) == client.post('/search_batch', json=queries).get_json()
+    # malformed input reaches the Flask view, which reports it
+    assert call(asgi.app, 'POST', '/search_batch', body=b'{')[0] == 400
+    assert call(asgi.app, 'GET', '/search', b'query=python&mode=xor')[0] == 400
+
+
+def test_wants_prefetch(asgi):
+    assert asgi.wants_prefetch({})
+    assert not asgi.wants_prefetch({'mode': 'and'})
+    assert not asgi.wants_prefetch({'budget_ms': '50'})
+    assert not asgi.wants_prefetch({'version': 'RECOMMENDED_2_CASCADE_300'})
+    assert not asgi.wants_prefetch({'version': 'nope'})
+    with pytest.raises(ValueError):
+        asgi.wants_prefetch({'budget_ms': 'soon'})
+
+
+def test_prefetch_generation_serves_postings_from_memory(asgi, frontend):
+    gen = frontend.current_generation()
+    pinned = asyncio.run(asgi.prefetch_generation('/search', ['python data', 'python'], {}))
+    assert pinned is not gen and pinned.body_index is not gen.body_index
+    for field in ('body_index', 'title_index', 'anchor_index'):
+        index = getattr(pinned, field)
+        assert isinstance(index, PrefetchedIndex)
+        assert set(index._postings) == {w for w in ('python', 'data') if w in getattr(gen, field).df}
+    # per-posting attributes are bound, not forwarded
+    assert 'DL' in vars(pinned.body_index)
+    assert pinned.body_index.read_a_posting_list(gen.base_dir, 'python') == \
+        frontend.read_posting_list(gen.body_index, 'python', gen.base_dir)
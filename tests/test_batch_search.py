@@ -0,0 +1,39 @@
+from batch_search import BOUND_ATTRS, PrefetchedIndex, fetch_postings
+from inverted_index_gcp import InvertedIndex
+
+
+def test_prefetched_index_serves_lists_and_binds_stats(tmp_path):
+    index = InvertedIndex({1: ['a', 'b'], 2: ['a']})
+    index.DL = {1: 2, 2: 1}
+    index.write_posting_lists(tmp_path, 'body')
+    reads = []
+
+    def read_fn(index, w, base_dir):
+        reads.append(w)
+        return index.read_a_posting_list(base_dir, w)
+
+    prefetched = fetch_postings(index, tmp_path, ['a', 'b', 'a', 'missing'], read_fn)
+    assert sorted(reads) == ['a', 'b']
+    assert prefetched.read_a_posting_list(tmp_path, 'a') == [(1, 1), (2, 1)]
+    # scoring reads these per posting, they must not go through __getattr__
+    assert {'df', 'DL', 'posting_locs'} <= set(vars(prefetched)) <= set(BOUND_ATTRS) | {'_index', '_postings'}
+    assert prefetched.DL is index.DL
+    assert PrefetchedIndex(index, {}).skips == {}
+
+
+def test_batch_matches_single_queries(client):
+    queries = ['python data', 'river city music', 'king queen', 'nothingmatches', '', 'mount everest fire']
+    singles = [client.get('/search', query_string={'query': q}).get_json() for q in queries]
+    assert client.post('/search_batch', json=queries).get_json() == singles
+    body = {'queries': queries, 'version': 'RECOMMENDED_2', 'mode': 'and'}
+    singles = [client.get('/search', query_string={'query': q, 'version': 'RECOMMENDED_2', 'mode': 'and'}).get_json()
+               for q in queries]
+    assert client.post('/search_batch', json=body).get_json() == singles
+
+
+def test_batch_rejects_malformed_bodies(client, frontend):
+    for body in [{'queries': 5}, [1, 2], 'python', 7, {'queries': ['a'], 'version': []},
+                 {'queries': ['a'], 'mode': 'x'}, {'queries': ['a'], 'version': 'nope'},
+                 ['python'] * (frontend.MAX_BATCH + 1)]:
+        assert client.post('/search_batch', json=body).status_code == 400, body
+    assert client.post('/search_batch', data='{', content_type='application/json').status_code == 400
@@ -0,0 +1,45 @@
+import pytest
+
+from bigram_index import adjacent_pairs, bigram_docs, select_bigrams
+
+
+def test_adjacent_pairs():
+    assert adjacent_pairs(['new', 'york', 'city']) == ['new york', 'york city']
+    assert adjacent_pairs(['one']) == []
+
+
+def test_select_bigrams_by_document_frequency():
+    docs = {1: ['a', 'b', 'a', 'b'], 2: ['a', 'b', 'c'], 3: ['b', 'c']}
+    assert select_bigrams(docs, min_df=2) == {'a b', 'b c'}
+    assert select_bigrams(docs, min_df=2, max_bigrams=1) == {'a b'}
+    # repeated pairs stay repeated, they are the tf
+    assert bigram_docs(docs, {'a b'}) == {1: ['a b', 'a b'], 2: ['a b'], 3: []}
+
+
+def bigram_config(frontend):
+    return frontend.get_config('RECOMMENDED_2_BIGRAM')
+
+
+def test_bigram_hits_are_the_candidates(monkeypatch, frontend):
+    gen = frontend.current_generation()
+    tokens = ['python', 'data']
+    hits = {doc_id for doc_id, _ in gen.bigram_index.read_a_posting_list(gen.base_dir, 'python data')}
+    assert len(hits) >= frontend.BIGRAM_MIN_RESULTS
+    scores, _ = frontend.score_query(tokens, gen, bigram_config(frontend))
+    assert set(scores) == hits
+
+    # the full path scores the same documents the same way
+    monkeypatch.setattr(frontend, 'BIGRAM_MIN_RESULTS', len(hits) + 1)
+    full, _ = frontend.score_query(tokens, gen, bigram_config(frontend))
+    assert set(full) > hits
+    for doc_id in hits:
+        assert scores[doc_id] == pytest.approx(full[doc_id])
+
+
+def test_bigram_scores_need_a_bigram_config(frontend):
+    gen = frontend.current_generation()
+    with_pairs, _ = frontend.score_query(['python', 'data'], gen, bigram_config(frontend))
+    without, _ = frontend.score_query(['python', 'data'], gen, frontend.get_config('RECOMMENDED_2'))
+    assert set(without) > set(with_pairs)
+    assert frontend.get_query_bigram_scores(['python', 'data'], gen, frontend.get_config('RECOMMENDED_2'),
+                                            None, {}) is None
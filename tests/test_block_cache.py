@@ -0,0 +1,119 @@
+import os
+
+import pytest
+
+from block_cache import BlockCache, LocalDirBucket
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    root = tmp_path / 'bucket'
+    root.mkdir()
+    (root / 'postings_000.bin').write_bytes(os.urandom(10_000))
+    return LocalDirBucket(str(root))
+
+
+def make_cache(tmp_path, **kwargs):
+    return BlockCache(tmp_path / 'cache', **{'block_size': 100, 'readahead': 0, **kwargs})
+
+
+def test_reads_match_object(tmp_path, bucket):
+    data = (tmp_path / 'bucket' / 'postings_000.bin').read_bytes()
+    cache = make_cache(tmp_path)
+    for offset, n_bytes in [(0, 10), (95, 10), (150, 1000), (9990, 100), (0, 10_000), (42, 0)]:
+        assert cache.read(bucket, 'postings_000.bin', offset, n_bytes) == data[offset:offset + n_bytes]
+        # second time from the cache
+        assert cache.read(bucket, 'postings_000.bin', offset, n_bytes) == data[offset:offset + n_bytes]
+
+
+def test_hits_do_not_touch_bucket(tmp_path, bucket):
+    cache = make_cache(tmp_path)
+    cache.read(bucket, 'postings_000.bin', 0, 1000)
+    requests = bucket.requests
+    cache.read(bucket, 'postings_000.bin', 250, 500)
+    assert bucket.requests == requests
+    assert cache.stats['hits'] == 6
+
+
+def test_missing_blocks_fetched_in_runs(tmp_path, bucket):
+    cache = make_cache(tmp_path)
+    cache.read(bucket, 'postings_000.bin', 300, 100)
+    bucket.requests = 0
+    # blocks 0-2 and 4-5 are missing: two ranged reads
+    cache.read(bucket, 'postings_000.bin', 0, 600)
+    assert bucket.requests == 2
+
+
+def test_readahead(tmp_path, bucket):
+    cache = make_cache(tmp_path, readahead=3)
+    cache.read(bucket, 'postings_000.bin', 0, 200)
+    assert bucket.requests == 1
+    # blocks 2-4 came with the first read
+    cache.read(bucket, 'postings_000.bin', 200, 300)
+    assert bucket.requests == 1
+    # a read within one block fetches no readahead
+    cache.read(bucket, 'postings_000.bin', 900, 50)
+    cache.read(bucket, 'postings_000.bin', 1000, 50)
+    assert bucket.requests == 3
+
+
+def test_lru_eviction(tmp_path, bucket):
+    cache = make_cache(tmp_path, max_bytes=500)
+    cache.read(bucket, 'postings_000.bin', 0, 300)
+    # use block 0 again, blocks 1 and 2 are now the least recently used
+    cache.read(bucket, 'postings_000.bin', 0, 10)
+    cache.read(bucket, 'postings_000.bin', 1000, 300)
+    assert cache.size <= 500
+    bucket.requests = 0
+    cache.read(bucket, 'postings_000.bin', 0, 10)
+    assert bucket.requests == 0
+    cache.read(bucket, 'postings_000.bin', 100, 10)
+    assert bucket.requests == 1
+
+
+def test_survives_restart(tmp_path, bucket):
+    cache = make_cache(tmp_path)
+    cache.read(bucket, 'postings_000.bin', 0, 1000)
+    cache.close()
+    cache = make_cache(tmp_path)
+    assert cache.size == 1000
+    bucket.requests = 0
+    cache.read(bucket, 'postings_000.bin', 0, 1000)
+    assert bucket.requests == 0
+
+
+def replace_object(bucket, name, data):
+    path = os.path.join(bucket.root, name)
+    mtime_ns = os.stat(path).st_mtime_ns
+    with open(path, 'wb') as f:
+        f.write(data)
+    # a new generation even within the file system's timestamp resolution
+    os.utime(path, ns=(mtime_ns + 1000, mtime_ns + 1000))
+
+
+def test_replaced_object_is_not_served_from_old_blocks(tmp_path, bucket):
+    cache = make_cache(tmp_path)
+    old = cache.read(bucket, 'postings_000.bin', 0, 300)
+    new = os.urandom(10_000)
+    replace_object(bucket, 'postings_000.bin', new)
+    # the generation is read once per object, until forgotten
+    assert cache.read(bucket, 'postings_000.bin', 0, 300) == old
+    cache.forget_generations()
+    assert cache.read(bucket, 'postings_000.bin', 0, 300) == new[:300]
+    # and after a restart over the same cache directory
+    cache.close()
+    newer = os.urandom(10_000)
+    replace_object(bucket, 'postings_000.bin', newer)
+    assert make_cache(tmp_path).read(bucket, 'postings_000.bin', 0, 300) == newer[:300]
+
+
+def test_hits_leave_no_open_transaction(tmp_path, bucket):
+    cache = make_cache(tmp_path)
+    cache.read(bucket, 'postings_000.bin', 0, 300)
+    cache.read(bucket, 'postings_000.bin', 500, 100)
+    # block 0 becomes the most recently used by a hit only
+    cache.read(bucket, 'postings_000.bin', 0, 10)
+    assert not cache._db.in_transaction
+    cache.close()
+    cache = make_cache(tmp_path)
+    assert [block for _, block in cache._lru] == [1, 2, 5, 0]
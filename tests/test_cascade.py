@@ -0,0 +1,87 @@
+import heapq
+import random
+from contextlib import closing
+
+import pytest
+
+import cascade
+from cascade import select_candidates, top_impact_docs, worth_cascading
+from inverted_index_gcp import SKIP_BLOCK, InvertedIndex, MultiFileReader
+
+
+@pytest.fixture
+def index_dir(tmp_path):
+    rng = random.Random(3)
+    docs = {doc_id: ['common'] * rng.randint(1, 30) + ['rare'] * (doc_id % 50 == 0)
+            for doc_id in range(1, 20 * SKIP_BLOCK + 1)}
+    index = InvertedIndex(docs)
+    index.write_posting_lists(tmp_path, 'body')
+    return tmp_path, index
+
+
+def test_select_candidates_mixes_fields_and_body():
+    field_scores = {1: 5.0, 2: 4.0, 3: 3.0, 4: 2.0}
+    body_impacts = {2: 9.0, 5: 8.0, 6: 1.0, 7: 7.0}
+    # half the cap from the fields, the rest the best body documents not in yet
+    assert select_candidates(field_scores, body_impacts, 4) == {1, 2, 5, 7}
+    assert select_candidates({}, body_impacts, 2) == {2, 5}
+    assert select_candidates(field_scores, {}, 4) == {1, 2}
+    assert len(select_candidates(field_scores, body_impacts, 100)) == 7
+
+
+def test_top_impact_docs_match_brute_force(monkeypatch, index_dir):
+    base_dir, index = index_dir
+    monkeypatch.setattr(cascade, 'MAX_BLOCKS_PER_CANDIDATE', 1.0)
+    postings = index.read_a_posting_list(base_dir, 'common')
+
+    def contribution(doc_id, tf):
+        return tf / (1 + doc_id % 7)
+
+    expected = heapq.nlargest(50, ((contribution(doc_id, tf), doc_id) for doc_id, tf in postings))
+    with closing(MultiFileReader(base_dir)) as reader:
+        found = top_impact_docs(index, base_dir, 'common', 50, contribution, lambda max_tf: max_tf,
+                                lambda w: index.read_a_posting_list(base_dir, w), reader)
+        assert found == expected
+        # without skip entries the whole list is read
+        index.skips.pop('common')
+        assert top_impact_docs(index, base_dir, 'common', 50, contribution, lambda max_tf: max_tf,
+                               lambda w: postings, reader) == expected
+
+
+def test_top_impact_docs_read_a_bounded_number_of_blocks(index_dir):
+    base_dir, index = index_dir
+    reads = []
+    read_posting_range = index.read_posting_range
+
+    def counting(*args, **kwargs):
+        reads.append(args[2])
+        return read_posting_range(*args, **kwargs)
+
+    index.read_posting_range = counting
+    with closing(MultiFileReader(base_dir)) as reader:
+        found = top_impact_docs(index, base_dir, 'common', 40, lambda doc_id, tf: tf, lambda max_tf: max_tf,
+                                None, reader)
+    assert len(reads) <= max(1, int(40 * cascade.MAX_BLOCKS_PER_CANDIDATE))
+    assert len(found) == 40
+
+
+def test_worth_cascading(index_dir):
+    _, index = index_dir
+    assert worth_cascading(index, {'common', 'rare'}, 10)
+    assert not worth_cascading(index, {'common'}, 20)
+    assert not worth_cascading(index, {'rare'}, 1)
+    assert not worth_cascading(index, {'missing'}, 1)
+    index.skips.pop('rare')
+    assert not worth_cascading(index, {'common', 'rare'}, 10)
+
+
+def test_cascade_ranks_only_the_candidates(frontend):
+    gen = frontend.current_generation()
+    tokens = ['python', 'data']
+    cfg = {**frontend.get_config('RECOMMENDED_2'), 'cascade': 3}
+    assert worth_cascading(gen.body_index, set(tokens), 3)
+    scores, notes = frontend.score_query(tokens, gen, cfg)
+    assert len(scores) == 3 and notes == {}
+    full, _ = frontend.score_query(tokens, gen, frontend.get_config('RECOMMENDED_2'))
+    for doc_id, score in scores.items():
+        assert score == pytest.approx(full[doc_id])
@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+
+def fake_clock(monkeypatch, frontend, now):
+    """ Replaces search_frontend's time.monotonic() by `now`, a function. """
+    monkeypatch.setattr(frontend, 'time', SimpleNamespace(monotonic=now))
+
+
+def count_range_reads(monkeypatch, index):
+    reads = []
+    read_posting_range = index.read_posting_range
+
+    def counting(*args, **kwargs):
+        reads.append(args[1])
+        return read_posting_range(*args, **kwargs)
+
+    monkeypatch.setattr(index, 'read_posting_range', counting)
+    return reads
+
+
+def test_planned_scores_chunk_read_before_the_deadline(monkeypatch, frontend):
+    gen = frontend.current_generation()
+    index = gen.body_index
+    assert index.df['python'] > frontend.DEADLINE_CHUNK
+    reads = count_range_reads(monkeypatch, index)
+    # the clock passes the deadline as soon as the first chunk is read
+    fake_clock(monkeypatch, frontend, lambda: 10.0 if reads else 0.0)
+
+    scores, notes = frontend.get_bm25_scores_planned(['python'], index, gen, deadline=5.0)
+    assert reads == ['python']
+    assert notes["approximate"]
+    first_chunk = index.read_posting_range(gen.base_dir, 'python', 0, frontend.DEADLINE_CHUNK)
+    assert sorted(scores) == sorted(doc_id for doc_id, _ in first_chunk)
+
+
+def test_planned_scores_without_time_pressure_are_exact(frontend):
+    gen = frontend.current_generation()
+    scores, notes = frontend.get_bm25_scores_planned(['python'], gen.body_index, gen, deadline=float('inf'))
+    assert notes == {}
+    assert scores == frontend.get_bm25_scores(['python'], gen.body_index, gen)
+
+
+def test_expired_deadline_skips_every_read(monkeypatch, frontend):
+    gen = frontend.current_generation()
+    reads = count_range_reads(monkeypatch, gen.body_index)
+    fake_clock(monkeypatch, frontend, lambda: 10.0)
+    for mode in ('or', 'and'):
+        scores, notes = frontend.score_query(['python', 'data'], gen, frontend.get_config(), mode, deadline=5.0)
+        assert notes["approximate"], mode
+        if mode == 'or':
+            assert scores == {} and reads == []
+
+
+def test_search_reports_budget_cuts(client):
+    response = client.get('/search', query_string={'query': 'python data', 'budget_ms': '0.000001'})
+    assert response.status_code == 200
+    assert response.headers['X-Result-Approximate'] == '1'
+    assert 'X-Result-Approximate' not in client.get('/search', query_string={'query': 'python data'}).headers
+    assert client.get('/search', query_string={'query': 'python', 'budget_ms': 'soon'}).status_code == 400
@@ -0,0 +1,94 @@
+import random
+from contextlib import closing
+
+import pytest
+
+import inverted_index_gcp
+from boolean_query import intersect_postings, probe_postings
+from inverted_index_gcp import SKIP_BLOCK, InvertedIndex, MultiFileReader, make_skips
+
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    """ An index of 5000 random documents written to tmp_path, with posting
+        files small enough that long lists span several of them and postings
+        straddle file boundaries.
+    """
+    monkeypatch.setattr(inverted_index_gcp, 'BLOCK_SIZE', 1001)
+    rng = random.Random(7)
+    words = [f'w{i}' for i in range(30)]
+    docs = {doc_id: rng.choices(words, weights=range(30, 0, -1), k=rng.randint(1, 40))
+            for doc_id in rng.sample(range(1, 100_000), 5000)}
+    index = InvertedIndex(docs)
+    index.write_posting_lists(tmp_path, 'body')
+    index.write_index(tmp_path, 'body_index')
+    return tmp_path, InvertedIndex.read_index(tmp_path, 'body_index'), docs
+
+
+def test_posting_lists_round_trip(index_dir):
+    base_dir, index, docs = index_dir
+    for w in index.df:
+        expected = sorted((doc_id, tokens.count(w)) for doc_id, tokens in docs.items() if w in tokens)
+        assert index.read_a_posting_list(base_dir, w) == expected
+
+
+def test_read_posting_range_matches_full_read(index_dir):
+    base_dir, index, _ = index_dir
+    rng = random.Random(1)
+    with closing(MultiFileReader(base_dir)) as reader:
+        for w in index.df:
+            full = index.read_a_posting_list(base_dir, w)
+            for _ in range(20):
+                start = rng.randrange(len(full) + 5)
+                count = rng.randint(1, 3 * SKIP_BLOCK)
+                expected = full[start:start + count]
+                assert index.read_posting_range(base_dir, w, start, count) == expected
+                assert index.read_posting_range(base_dir, w, start, count, reader=reader) == expected
+
+
+def test_read_posting_range_unknown_term(index_dir):
+    base_dir, index, _ = index_dir
+    assert index.read_posting_range(base_dir, 'missing', 0, 10) == []
+
+
+def test_skips(index_dir):
+    base_dir, index, _ = index_dir
+    for w in index.df:
+        full = index.read_a_posting_list(base_dir, w)
+        assert index.skips[w] == make_skips(full)
+        for block, (last_doc, max_tf) in enumerate(index.skips[w]):
+            postings = full[block * SKIP_BLOCK:(block + 1) * SKIP_BLOCK]
+            assert postings[-1][0] == last_doc
+            assert max(tf for _, tf in postings) == max_tf
+
+
+def test_build_skips_matches_write(index_dir):
+    base_dir, index, _ = index_dir
+    skips = index.skips
+    index.skips = {}
+    index.build_skips(base_dir)
+    assert index.skips == skips
+
+
+@pytest.mark.parametrize('with_skips', [True, False])
+def test_probe_postings(index_dir, with_skips):
+    base_dir, index, docs = index_dir
+    if not with_skips:
+        index.skips = {}
+    rng = random.Random(2)
+    all_ids = sorted(docs)
+    with closing(MultiFileReader(base_dir)) as reader:
+        for w in index.df:
+            full = dict(index.read_a_posting_list(base_dir, w))
+            # ids with and without postings of w, and ids beyond the last one
+            doc_ids = sorted(set(rng.sample(all_ids, 300)) | {max(all_ids) + 1})
+            expected = sorted((doc_id, full[doc_id]) for doc_id in doc_ids if doc_id in full)
+            assert sorted(probe_postings(index, base_dir, w, doc_ids, reader)) == expected
+
+
+def test_intersect_postings(index_dir):
+    base_dir, index, docs = index_dir
+    for terms in (['w0', 'w1'], ['w3', 'w20', 'w29'], ['w5', 'missing'], ['w2']):
+        expected = {doc_id: {w: tokens.count(w) for w in terms}
+                    for doc_id, tokens in docs.items() if all(w in tokens for w in terms)}
+        assert intersect_postings(index, base_dir, terms) == expected
@@ -0,0 +1,91 @@
+import sys
+
+import numpy as np
+import pytest
+
+import pagerank as pr
+from pagerank import LinkGraph, PageRankStore, save_pagerank, warm_start
+
+EDGES = ([10, 10, 20, 30, 30, 30, 40, 10], [20, 30, 30, 10, 20, 20, 40, 20])
+
+
+def dense_pagerank(graph, damping=pr.DAMPING, iterations=500):
+    """ Reference: power iteration over the dense transition matrix. """
+    n = graph.n_nodes
+    m = np.zeros((n, n))
+    for i in range(n):
+        targets = graph.indices[graph.indptr[i]:graph.indptr[i + 1]]
+        if len(targets):
+            m[targets, i] = 1.0 / len(targets)
+        else:
+            m[:, i] = 1.0 / n
+    x = np.full(n, 1.0 / n)
+    for _ in range(iterations):
+        x = damping * m @ x + (1 - damping) / n
+    return x / x.sum()
+
+
+def test_from_edges_drops_duplicates_and_self_links():
+    graph = LinkGraph.from_edges(*EDGES)
+    assert graph.doc_ids.tolist() == [10, 20, 30, 40]
+    assert graph.out_degrees().tolist() == [2, 1, 2, 0]
+    assert graph.n_edges == 5
+
+
+def test_pagerank_matches_dense_reference(monkeypatch):
+    graph = LinkGraph.from_edges(*EDGES)
+    scores, iterations, delta = pr.pagerank(graph, tol=1e-12, max_iter=1000)
+    assert delta < 1e-12 and iterations < 1000
+    assert scores.sum() == pytest.approx(1.0)
+    np.testing.assert_allclose(scores, dense_pagerank(graph), atol=1e-9)
+    # row blocks of a couple of edges give the same result
+    monkeypatch.setattr(pr, 'EDGE_CHUNK', 2)
+    np.testing.assert_allclose(pr.pagerank(graph, tol=1e-12, max_iter=1000)[0], scores)
+
+
+def test_pagerank_reports_hitting_max_iter():
+    graph = LinkGraph.from_edges(*EDGES)
+    _, iterations, delta = pr.pagerank(graph, tol=1e-12, max_iter=2)
+    assert iterations == 2 and delta >= 1e-12
+    assert pr.pagerank(LinkGraph.from_edges([], []))[1:] == (0, 0.0)
+
+
+def test_warm_start_keeps_known_pages():
+    graph = LinkGraph.from_edges(*EDGES)
+    start = warm_start(graph, np.array([10, 30]), np.array([3.0, 1.0]))
+    assert start.sum() == pytest.approx(1.0)
+    assert start[0] == pytest.approx(3 * start[2])
+    assert start[1] == pytest.approx(start[3])
+    scores, iterations, _ = pr.pagerank(graph, start=pr.pagerank(graph)[0])
+    assert iterations == 1
+
+
+def test_store_round_trip(tmp_path):
+    path = tmp_path / 'pagerank.npz'
+    save_pagerank(path, np.array([30, 10, 20]), np.array([0.5, 0.25, 0.25]))
+    store = PageRankStore.load(path)
+    assert len(store) == 3
+    # scaled to average 1 per page
+    assert store.lookup([10, 20, 30, 99], default=-1.0).tolist() == [0.75, 0.75, 1.5, -1.0]
+    assert store.get(30) == 1.5 and store.get(99) == 0
+    assert store.lookup_boosts([99]).tolist() == [1.0]
+    assert PageRankStore.from_dict({2: 4.0, 1: 9.0}).lookup([1, 2]).tolist() == [9.0, 4.0]
+
+
+@pytest.mark.parametrize('argv', [[], ['--graph', 'g.npz', '--parquet', 'a.parquet']])
+def test_main_needs_exactly_one_input(monkeypatch, argv):
+    monkeypatch.setattr(sys, 'argv', ['pagerank.py', *argv])
+    with pytest.raises(SystemExit) as exc:
+        pr.main()
+    assert exc.value.code == 2
+
+
+def test_main_reports_convergence(monkeypatch, tmp_path, capsys):
+    graph_path = tmp_path / 'graph.npz'
+    LinkGraph.from_edges(*EDGES).save(graph_path)
+    out = tmp_path / 'pagerank.npz'
+    for extra, expected in [(['--max-iter', '1'], 'did not converge in 1 iterations'), ([], 'converged after')]:
+        monkeypatch.setattr(sys, 'argv', ['pagerank.py', '--graph', str(graph_path), '--out', str(out), *extra])
+        pr.main()
+        assert f'PageRank {expected}' in capsys.readouterr().out
+    assert len(PageRankStore.load(out)) == 4
@@ -0,0 +1,63 @@
+import bz2
+import gzip
+
+import numpy as np
+import pytest
+
+import pageviews as pv
+from pageviews import PageviewCounter, ingest, load_pageviews, lookup_pageviews, parse_line
+
+
+def test_parse_line():
+    assert parse_line('en.wikipedia Python_(language) 23862 desktop 17 A17', None) == (23862, 17)
+    assert parse_line('en Python_(language) 42 0', {'Python_(language)': 23862}) == (23862, 42)
+    assert parse_line('en.m Unknown 42 0', {'Python_(language)': 23862}) is None
+    assert parse_line('en Python_(language) 42 0', None) is None
+    assert parse_line('de.wikipedia Berlin 3354 desktop 9 A9', None) is None
+    assert parse_line('en.wikipedia', None) is None
+
+
+def test_counter_sums_grows_and_saturates(tmp_path):
+    path = tmp_path / 'views.u32'
+    counter = PageviewCounter(path, initial_size=4)
+    counter.add(np.array([1, 3, 1]), np.array([2.0, 5.0, 4.0]))
+    counter.add(np.array([9]), np.array([7.0]))
+    counter.add(np.array([3]), np.array([2.0 ** 33]))
+    counter.add(np.array([], dtype=np.int64), np.array([]))
+    counter.close()
+    counts = load_pageviews(path)
+    assert len(counts) == 16
+    assert lookup_pageviews(counts, [1, 3, 9, 0, 100, -1]).tolist() == [6, np.iinfo(np.uint32).max, 7, 0, 0, 0]
+
+
+def test_ingest_reads_compressed_dumps_in_chunks(monkeypatch, tmp_path):
+    monkeypatch.setattr(pv, 'CHUNK_LINES', 2)
+    lines = ['en.wikipedia A 10 desktop 3 C3', 'en.wikipedia A 10 mobile-web 4 D4', 'en B 2 0',
+             'fr.wikipedia A 10 desktop 100 A100', 'en.wikipedia C 12 desktop 1 A1']
+    text = '\n'.join(lines) + '\n'
+    with bz2.open(tmp_path / 'a.bz2', 'wt') as f:
+        f.write(text)
+    with gzip.open(tmp_path / 'b.gz', 'wt') as f:
+        f.write(text)
+    out = tmp_path / 'views.u32'
+    ingest([str(tmp_path / 'a.bz2'), str(tmp_path / 'b.gz')], out, title_to_id={'B': 11})
+    assert lookup_pageviews(load_pageviews(out), [10, 11, 12]).tolist() == [14, 4, 2]
+
+
+def test_missing_counts(tmp_path):
+    assert load_pageviews(tmp_path / 'none.u32') is None
+    assert lookup_pageviews(None, [1, 2]).tolist() == [0, 0]
+
+
+def test_pageview_boost(monkeypatch, frontend):
+    gen = frontend.current_generation()
+    without = frontend.rank_with_weights(['python'], gen, frontend.get_config('RECOMMENDED_2'))
+    cfg = frontend.get_config('RECOMMENDED_2_PV')
+    # no counts: the boost is 1 + alpha * log10(0 + 1) == 1
+    assert frontend.rank_with_weights(['python'], gen, cfg) == pytest.approx(without)
+    doc_id = next(iter(without))
+    counts = np.zeros(doc_id + 1, dtype=np.uint32)
+    counts[doc_id] = 99
+    monkeypatch.setattr(gen, 'pageviews', counts)
+    boosted = frontend.rank_with_weights(['python'], gen, cfg)
+    assert boosted[doc_id] == pytest.approx(without[doc_id] * (1 + cfg["pageview_alpha"] * 2))
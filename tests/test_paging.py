@@ -0,0 +1,51 @@
+import random
+
+import pytest
+
+from paging import MAX_PAGE_SIZE, PAGE_SIZE, format_cursor, page_args, top_page
+
+
+def all_pages(scores, limit):
+    """ Follows the cursors like a client would, returns the pages. """
+    pages, args = [], {'limit': str(limit)}
+    while True:
+        limit, after = page_args(args)
+        page, more = top_page(scores, limit, after)
+        pages.append(page)
+        if not more:
+            return pages
+        doc_id, score = page[-1]
+        args = {'limit': str(limit), 'cursor': format_cursor(doc_id, score)}
+
+
+@pytest.mark.parametrize('limit', [1, 7, 100])
+def test_pages_cover_ranking_once(limit):
+    rng = random.Random(limit)
+    # many ties, and scores that do not print exactly in a few digits
+    scores = {doc_id: rng.choice([0.1, 1 / 3, 2.0, rng.random()]) for doc_id in rng.sample(range(10**6), 500)}
+    pages = all_pages(scores, limit)
+    ranked = [item for page in pages for item in page]
+    assert ranked == sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+    assert all(len(page) == limit for page in pages[:-1])
+
+
+def test_cursor_round_trip():
+    for score in [0.1, 1 / 3, 1e-300, 123456789.123456789, 5]:
+        _, after = page_args({'cursor': format_cursor(42, score)})
+        assert after == (float(score), 42)
+        assert type(after[0]) is float
+
+
+def test_page_args_defaults():
+    assert page_args({}) == (PAGE_SIZE, None)
+
+
+@pytest.mark.parametrize('args', [{'limit': '0'}, {'limit': str(MAX_PAGE_SIZE + 1)}, {'limit': 'x'},
+                                  {'cursor': 'nonsense'}, {'cursor': '1.5:x'}, {'cursor': '1:2:3'}])
+def test_page_args_rejects(args):
+    with pytest.raises(ValueError):
+        page_args(args)
+
+
+def test_top_page_empty():
+    assert top_page({}, 10) == ([], False)
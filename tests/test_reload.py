@@ -0,0 +1,71 @@
+import gc
+import os
+import time
+import weakref
+
+from conftest import write_index
+
+
+def test_get_config(frontend):
+    assert frontend.get_config() is frontend.WEIGHT_CONFIGS[frontend.ENGINE_VERSION]
+    assert frontend.get_config('BASE_TITLE_NO_PR') is frontend.WEIGHT_CONFIGS['BASE_TITLE_NO_PR']
+    assert frontend.get_config('nope') is None
+
+
+def test_version_is_per_request(client):
+    by_title = client.get('/search', query_string={'query': 'python', 'version': 'BASE_TITLE_NO_PR'}).get_json()
+    by_body = client.get('/search', query_string={'query': 'python', 'version': 'BASE_BODY_NO_PR'}).get_json()
+    assert by_title != by_body
+    assert all('python' in title for _, title in by_title[:10])
+    assert client.get('/search', query_string={'query': 'python', 'version': 'nope'}).status_code == 400
+
+
+def wait_for_reload(client):
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        status = client.get('/generation').get_json()
+        if status["state"] != "loading":
+            return status
+        time.sleep(0.05)
+    raise AssertionError("reload did not finish")
+
+
+def test_reload_rejects_bad_folders(client, tmp_path):
+    assert client.post('/reload', query_string={'index_dir': str(tmp_path)}).status_code == 400
+    assert client.post('/reload', query_string={'index_dir': '.'}).status_code == 400
+
+
+def test_reload_needs_the_admin_token(monkeypatch, frontend, client):
+    monkeypatch.setattr(frontend, 'ADMIN_TOKEN', 'secret')
+    assert client.post('/reload').status_code == 403
+    assert client.post('/reload', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert client.post('/reload', query_string={'index_dir': '.'},
+                       headers={'X-Admin-Token': 'secret'}).status_code == 400
+
+
+def test_reload_swaps_generations(frontend, client):
+    old = frontend.current_generation()
+    old_id, index_dir = old.generation_id, old.index_dir
+    new_dir = 'postings_reload'
+    docs = {doc_id: ['zebra', 'python'] for doc_id in range(1, 11)}
+    os.makedirs(new_dir, exist_ok=True)
+    for name in ('body', 'title', 'anchor'):
+        write_index(new_dir, name, docs, with_dl=name == 'body')
+    old_ref = weakref.ref(old)
+    try:
+        assert client.post('/reload', query_string={'index_dir': new_dir}).status_code == 202
+        status = wait_for_reload(client)
+        assert status["state"] == "idle" and status["generation"] == old_id + 1
+        assert status["index_dir"] == new_dir
+        results = client.get('/search', query_string={'query': 'zebra'}).get_json()
+        assert sorted(int(doc_id) for doc_id, _ in results) == list(range(1, 11))
+        # a query that still holds the old generation finishes on it
+        scores, _ = frontend.score_query(['python'], old, frontend.get_config())
+        assert len(scores) > 10
+        del old, scores
+        gc.collect()
+        assert old_ref() is None
+    finally:
+        assert client.post('/reload', query_string={'index_dir': index_dir}).status_code == 202
+        assert wait_for_reload(client)["state"] == "idle"
+    assert len(client.get('/search', query_string={'query': 'python'}).get_json()) == 100
@@ -0,0 +1,121 @@
+import random
+
+import pytest
+
+import segmented_index
+from inverted_index_gcp import InvertedIndex
+from segmented_index import SegmentedIndex
+
+WORDS = ['alpha', 'beta', 'gamma', 'delta', 'epsilon']
+
+
+def expected_postings(docs, w):
+    return sorted((doc_id, tokens.count(w)) for doc_id, tokens in docs.items() if w in tokens)
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    """ (SegmentedIndex over a main index of 200 documents, the documents it
+        should serve as a dict that tests keep up to date).
+    """
+    rng = random.Random(3)
+    docs = {doc_id: rng.choices(WORDS, k=rng.randint(1, 12)) for doc_id in range(200)}
+    main = InvertedIndex(docs)
+    main.DL = {doc_id: len(tokens) for doc_id, tokens in docs.items()}
+    main.doc_norms = {doc_id: 1.0 for doc_id in docs}
+    main.write_posting_lists(tmp_path, 'body')
+    main.write_index(tmp_path, 'body_index')
+    return SegmentedIndex(tmp_path, 'body', InvertedIndex.read_index(tmp_path, 'body_index')), dict(docs)
+
+
+
+def check(index, docs):
+    for w in WORDS + ['zeta']:
+        assert index.read_a_posting_list(index._base_dir, w) == expected_postings(docs, w)
+
+
+def random_docs(rng, doc_ids):
+    return {doc_id: rng.choices(WORDS + ['zeta'], k=rng.randint(1, 12)) for doc_id in doc_ids}
+
+
+def test_add_replace_delete(corpus):
+    index, docs = corpus
+    rng = random.Random(4)
+    added = random_docs(rng, [1000, 1001, 5, 6])
+    index.add_documents(added, titles={1000: 'new'}, doc_norms={1000: 2.0, 5: 3.0})
+    docs.update(added)
+    index.delete_documents([7, 1001])
+    del docs[7], docs[1001]
+    check(index, docs)
+    assert index.get_title(1000) == 'new'
+    # document stats come from the newest version of a document
+    assert index.DL.get(5) == len(added[5])
+    assert index.DL.get(8) == len(docs[8])
+    assert index.doc_norms.get(5) == 3.0
+    assert index.doc_norms.get(6) is None
+    assert index.doc_norms.get(8) == 1.0
+
+
+def test_manifest_reload(corpus):
+    index, docs = corpus
+    rng = random.Random(5)
+    added = random_docs(rng, [300, 3])
+    index.add_documents(added)
+    docs.update(added)
+    index.delete_documents([4])
+    del docs[4]
+    reloaded = SegmentedIndex(index._base_dir, 'body', index.main_index)
+    check(reloaded, docs)
+    assert reloaded.DL.get(3) == len(added[3])
+
+
+def test_compaction_keeps_results(corpus, monkeypatch):
+    monkeypatch.setattr(segmented_index, 'MIN_TIER_SIZE', 10)
+    index, docs = corpus
+    rng = random.Random(6)
+    for i in range(20):
+        added = random_docs(rng, rng.sample(range(400), 3))
+        index.add_documents(added)
+        docs.update(added)
+        deleted = rng.sample(sorted(docs), 2)
+        index.delete_documents(deleted)
+        for doc_id in deleted:
+            del docs[doc_id]
+        if i % 3 == 0:
+            index.compact()
+        check(index, docs)
+        for doc_id, tokens in docs.items():
+            assert index.DL.get(doc_id) == len(tokens)
+    index.compact()
+    check(index, docs)
+    assert len(index.segments) < 20
+
+
+def test_compaction_reclaims_dead_segments(corpus):
+    index, docs = corpus
+    index.add_documents({500: ['alpha'], 501: ['zeta', 'zeta']})
+    index.add_documents({500: ['beta']})
+    index.delete_documents([501])
+    first = index.segments[0]
+    index.compact()
+    # both documents of the first segment are dead, it goes away
+    assert first.name not in {seg.name for seg in index.segments}
+    assert index.df.get('zeta') is None
+    docs[500] = ['beta']
+    check(index, docs)
+
+
+def test_tombstones_reclaimed(corpus):
+    index, docs = corpus
+    index.add_documents({600: ['alpha']})
+    index.delete_documents([600])
+    # hides a main index document, must stay
+    index.delete_documents([9])
+    # no document with this id exists anywhere
+    index.delete_documents([12345])
+    index.compact()
+    segments, tombstones = index._state
+    assert set(tombstones) == {9}
+    assert not segments
+    del docs[9]
+    check(index, docs)
@@ -0,0 +1,78 @@
+import pickle
+
+import pytest
+
+from inverted_index_gcp import InvertedIndex
+from sharding import GLOBAL_STATS_FILE, ShardCoordinator, build_shards, read_global_stats, shard_dir, shard_of
+
+
+def test_build_shards_partitions_docs_and_writes_global_stats(tmp_path):
+    body = {1: ['a', 'b'], 2: ['a'], 3: ['b', 'c'], 4: ['a', 'c']}
+    stats = build_shards({'body': body, 'title': {1: ['a']}}, tmp_path, n_shards=2)
+    assert stats['N'] == 4
+    assert stats['df']['body'] == {'a': 3, 'b': 2, 'c': 2}
+    for shard_id in range(2):
+        base_dir = shard_dir(tmp_path, shard_id)
+        index = InvertedIndex.read_index(base_dir, 'body_index')
+        docs = {doc_id for w in index.df for doc_id, _ in index.read_a_posting_list(base_dir, w)}
+        assert docs == {doc_id for doc_id in body if shard_of(doc_id, 2) == shard_id}
+        assert read_global_stats(base_dir) == {**stats, 'shard_id': shard_id}
+    assert read_global_stats(tmp_path) is None
+    with open(shard_dir(tmp_path, 0) / GLOBAL_STATS_FILE, 'rb') as f:
+        assert pickle.load(f)['n_shards'] == 2
+
+
+class FakeCoordinator(ShardCoordinator):
+    """ Coordinator whose shards answer from a dict url -> (results, headers),
+        or raise the exception stored there.
+    """
+
+    def __init__(self, answers, timeout=1.0):
+        super().__init__(list(answers), timeout)
+        self.answers = answers
+        self.params = []
+
+    def _query_shard(self, url, params):
+        self.params.append(params)
+        answer = self.answers[url]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def test_coordinator_merges_top_k_across_shards():
+    coordinator = FakeCoordinator({
+        'http://s0': ([[2, 0.9, 'b'], [4, 0.1, 'd']], {}),
+        'http://s1': ([[1, 0.5, 'a'], [3, 0.95, 'c']], {'X-Result-Approximate': '1'}),
+        'http://s2': OSError('down'),
+    })
+    top_docs, missing, notes = coordinator.search({'query': 'x'}, k=3)
+    assert [doc[0] for doc in top_docs] == [3, 2, 1]
+    assert missing == ['http://s2']
+    assert notes == {'approximate': True}
+    assert all(params == {'query': 'x', 'k': 3} for params in coordinator.params)
+
+
+def test_coordinator_merges_notes_from_headers():
+    coordinator = FakeCoordinator({
+        'http://s0': ([], {'X-Skipped-Terms': 'the,of'}),
+        'http://s1': ([[1, 1.0, 'a']], {'X-Corrected-Query': 'mount%20everest'}),
+    })
+    top_docs, missing, notes = coordinator.search({'query': 'mount everst'})
+    assert top_docs == [[1, 1.0, 'a']] and missing == []
+    assert notes == {'skipped_terms': ['the', 'of'], 'corrected_query': 'mount everest'}
+
+
+@pytest.mark.parametrize('args', [{'k': 'x'}, {'k': '0'}, {'k': '1000000'}, {'mode': 'xor'},
+                                  {'version': 'nope'}, {'budget_ms': 'soon'}])
+def test_search_shard_rejects_bad_args(client, args):
+    response = client.get('/search_shard', query_string={'query': 'python', **args})
+    assert response.status_code == 400, args
+
+
+def test_search_shard_returns_scored_top_k(client):
+    results = client.get('/search_shard', query_string={'query': 'python data', 'k': 5}).get_json()
+    assert len(results) == 5
+    scores = [score for _, score, _ in results]
+    assert scores == sorted(scores, reverse=True)
+    assert client.get('/search_shard', query_string={'query': '', 'k': 5}).get_json() == []
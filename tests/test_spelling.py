@@ -0,0 +1,77 @@
+import random
+from collections import Counter
+
+import pytest
+
+from spelling import MAX_DISTANCE, SHORT_TERM, SpellChecker, build_spelling, edit_distance
+
+
+def osa_distance(a, b):
+    """ Plain optimal string alignment distance, without cut-offs. """
+    d = [[i + j if not i or not j else 0 for j in range(len(b) + 1)] for i in range(len(a) + 1)]
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            d[i][j] = min(d[i - 1][j] + 1, d[i][j - 1] + 1, d[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                d[i][j] = min(d[i][j], d[i - 2][j - 2] + 1)
+    return d[-1][-1]
+
+
+def random_word(rng, letters='abcdefgh'):
+    return ''.join(rng.choice(letters) for _ in range(rng.randint(1, 12)))
+
+
+def test_edit_distance():
+    rng = random.Random(8)
+    for _ in range(3000):
+        a, b = random_word(rng), random_word(rng)
+        expected = osa_distance(a, b)
+        for max_distance in (1, 2, 3):
+            distance = edit_distance(a, b, max_distance)
+            if expected <= max_distance:
+                assert distance == expected
+            else:
+                assert distance > max_distance
+
+
+@pytest.fixture(scope='module')
+def speller(tmp_path_factory):
+    rng = random.Random(9)
+    vocab = {random_word(rng, 'abcdefghijklmnop') for _ in range(3000)}
+    counts = Counter({w: rng.randint(1, 1000) for w in vocab})
+    path = tmp_path_factory.mktemp('spelling') / 'spelling.npz'
+    build_spelling(counts, path)
+    return SpellChecker.load(path), counts
+
+
+def typo(rng, w):
+    i = rng.randrange(len(w))
+    op = rng.choice('dist')
+    if op == 'd':
+        return w[:i] + w[i + 1:]
+    if op == 'i':
+        return w[:i] + rng.choice('abcdefghijklmnop') + w[i:]
+    if op == 's':
+        return w[:i] + rng.choice('abcdefghijklmnop') + w[i + 1:]
+    return w[:i] + w[i + 1:i + 2] + w[i] + w[i + 2:] if i + 1 < len(w) else w[:i]
+
+
+def test_correct_matches_brute_force(speller):
+    checker, counts = speller
+    rng = random.Random(10)
+    words = sorted(counts)
+    for _ in range(200):
+        term = typo(rng, typo(rng, rng.choice(words)) or 'a') or 'a'
+        max_distance = 1 if len(term) <= SHORT_TERM else MAX_DISTANCE
+        if term in counts:
+            assert checker.correct(term) is None
+            continue
+        # edit_distance itself is checked against osa_distance above
+        best = min(((edit_distance(term, w, max_distance), -counts[w]) for w in words),
+                   default=(max_distance + 1, 0))
+        correction = checker.correct(term)
+        if best[0] > max_distance:
+            assert correction is None
+        else:
+            # ties in distance and count may pick either term
+            assert (edit_distance(term, correction, max_distance), -counts[correction]) == best
@@ -0,0 +1,57 @@
+import random
+
+import numpy as np
+import pytest
+
+from pagerank import PageRankStore
+from suggest import TitleSuggester, build_suggest, normalize
+
+
+@pytest.fixture(scope='module')
+def titles():
+    rng = random.Random(5)
+    syllables = ['ab', 'abc', 'b', 'ba', 'Über', 'new', 'New_York', 'z']
+    return {doc_id: ' '.join(rng.choices(syllables, k=rng.randint(1, 3))) for doc_id in range(1, 1500)}
+
+
+@pytest.fixture(scope='module')
+def pagerank(titles):
+    # distinct ranks, so the expected order is unique
+    return PageRankStore(np.array(list(titles)), np.random.default_rng(5).permutation(len(titles)) + 1.0)
+
+
+@pytest.fixture(scope='module')
+def suggester(tmp_path_factory, titles, pagerank):
+    out = tmp_path_factory.mktemp('suggest')
+    n_titles, n_prefixes = build_suggest(titles, pagerank, str(out), k=5, scan_limit=20)
+    assert n_titles == len(titles) and n_prefixes > 0
+    return TitleSuggester.load(str(out))
+
+
+def brute_force(titles, pagerank, prefix, k):
+    prefix = normalize(prefix)
+    matches = [doc_id for doc_id, title in titles.items() if normalize(title).startswith(prefix)]
+    matches.sort(key=lambda doc_id: pagerank.get(doc_id), reverse=True)
+    return [(doc_id, titles[doc_id]) for doc_id in matches[:k]]
+
+
+@pytest.mark.parametrize('prefix', ['a', 'ab', 'abc a', 'B', 'üb', 'new y', 'New_York n', 'z z', 'q', 'ab ab ab x'])
+@pytest.mark.parametrize('k', [1, 5, 12])
+def test_suggest_matches_brute_force(suggester, titles, pagerank, prefix, k):
+    assert suggester.suggest(prefix, k) == brute_force(titles, pagerank, prefix, k)
+
+
+def test_suggest_edge_cases(suggester):
+    assert suggester.suggest('   ') == []
+    assert normalize(' New_York  City ') == 'new york city'
+    assert len(suggester) == 1499
+
+
+def test_suggest_route(client):
+    results = client.get('/suggest', query_string={'query': 'py', 'k': 3}).get_json()
+    assert len(results) == 3 and all(title.startswith('python') for _, title in results)
+    # k is capped at the titles stored per prefix
+    assert len(client.get('/suggest', query_string={'query': 'p', 'k': 1000}).get_json()) == 10
+    assert client.get('/suggest', query_string={'query': 'p', 'k': 'x'}).status_code == 400
+    assert client.get('/suggest', query_string={'query': 'p', 'k': 0}).get_json() == []
+    assert client.get('/suggest').get_json() == []
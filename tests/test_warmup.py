@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from inverted_index_gcp import TUPLE_SIZE, InvertedIndex
+from warmup import QueryLog, hot_terms, load_queries, prefetch_postings
+
+
+def test_query_log_round_trip(tmp_path):
+    path = str(tmp_path / 'queries.log')
+    log = QueryLog(path)
+    for query in ['mount  everest', '   ', 'python\tdata\n', 'king']:
+        log.append(query)
+    assert load_queries(path) == ['mount everest', 'python data', 'king']
+    # only the most recent lines
+    assert load_queries(path, limit=2) == ['python data', 'king']
+
+
+def test_load_queries_from_json(tmp_path):
+    path = tmp_path / 'queries_train.json'
+    path.write_text(json.dumps({'a b': ['1'], 'c': ['2']}))
+    assert load_queries(str(path)) == ['a b', 'c']
+    path.write_text(json.dumps(['x', 'y', 'z']))
+    assert load_queries(str(path), limit=1) == ['z']
+
+
+def test_hot_terms_count_queries_not_occurrences():
+    token_lists = [['a', 'a', 'a', 'b'], ['b', 'c'], ['b', 'c']]
+    assert hot_terms(token_lists, n=2) == ['b', 'c']
+
+
+@pytest.mark.parametrize('bucket', [False, True])
+def test_prefetch_postings_reads_whole_lists(tmp_path, bucket):
+    index = InvertedIndex({1: ['a', 'b'], 2: ['a'], 3: ['a', 'c']})
+    index.write_posting_lists(tmp_path, 'body')
+    bucket_name = f'file://{tmp_path}' if bucket else None
+    assert prefetch_postings(index, tmp_path, ['a', 'c', 'missing'], bucket_name) == 4 * TUPLE_SIZE
+
+
+def test_warmup_worker_reports_state(monkeypatch, tmp_path, frontend, client):
+    queries = tmp_path / 'queries.json'
+    queries.write_text(json.dumps(['python data', 'king queen']))
+    for path, state, ready in [(str(queries), 'ready', 200), (str(tmp_path / 'missing.json'), 'failed', 503)]:
+        monkeypatch.setattr(frontend, 'WARMUP_QUERIES', path)
+        monkeypatch.setattr(frontend, '_warmup_queries', [])
+        monkeypatch.setattr(frontend, '_warmup_status', {"state": "warming", "queries": 0, "bytes_prefetched": 0,
+                                                         "seconds": None, "error": None})
+        frontend._warmup_worker()
+        assert frontend._warmup_status["state"] == state
+        if state == 'ready':
+            assert frontend._warmup_queries == ['python data', 'king queen']
+            assert frontend._warmup_status["bytes_prefetched"] > 0
+        response = client.get('/ready')
+        assert response.status_code == ready
+        assert response.get_json()["state"] == state
+    # the last run failed, serving cold is allowed with WARMUP_ALLOW_COLD
+    monkeypatch.setattr(frontend, 'WARMUP_ALLOW_COLD', True)
+    assert client.get('/ready').status_code == 200
+
+
+def test_warm_generation_reads_hot_postings(frontend):
+    gen = frontend.current_generation()
+    assert frontend.warm_generation(gen, ['python data', 'python']) > 0
+    assert frontend.warm_generation(gen, ['nothingmatches']) == 0
@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+from collections import Counter, deque
+from contextlib import closing
+
+from inverted_index_gcp import BLOCK_SIZE, TUPLE_SIZE, MultiFileReader
+
+# Startup warm-up. Right after a restart the posting files are not in the OS
+# page cache (or, with a bucket, not in the block cache), so the first
+# queries pay for cold reads. Before the frontend reports ready it takes the
+# queries of a query log (the frontend appends every /search query to
+# QUERY_LOG when that is set) or of queries_train.json, reads the posting
+# lists of the WARMUP_TERMS most frequent query terms of every index, and
+# replays the first WARMUP_REPLAY queries through /search. WARMUP_QUERIES=""
+# skips the warm-up. A failed warm-up keeps the frontend not ready (the
+# error is reported) unless WARMUP_ALLOW_COLD=1 lets it serve cold.
+QUERY_LOG = os.getenv("QUERY_LOG", "")
+WARMUP_QUERIES = os.getenv("WARMUP_QUERIES", QUERY_LOG if QUERY_LOG and os.path.exists(QUERY_LOG)
+                           else "queries_train.json")
+WARMUP_TERMS = int(os.getenv("WARMUP_TERMS", "2000"))
+WARMUP_REPLAY = int(os.getenv("WARMUP_REPLAY", "100"))
+WARMUP_ALLOW_COLD = os.getenv("WARMUP_ALLOW_COLD", "0") == "1"
+# only the most recent lines of a query log are used
+MAX_LOG_QUERIES = 100_000
+# posting bytes read per call while prefetching local files
+READ_CHUNK = 1 << 20
+
+
+class QueryLog:
+    """ Appends queries to a text file, one per line. Thread safe. """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._f = open(path, 'a', encoding='utf-8', buffering=1)
+
+    def append(self, query):
+        line = ' '.join(query.split())
+        if line:
+            with self._lock:
+                self._f.write(line + '\n')
+
+
+def load_queries(path, limit=MAX_LOG_QUERIES):
+    """ Queries from a .json file (the keys of queries_train.json, or a list
+        of query strings) or from a query log (the last `limit` lines).
+    """
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            return list(json.load(f))[-limit:]
+    with open(path, encoding='utf-8') as f:
+        lines = deque((line.strip() for line in f), maxlen=limit)
+    return [line for line in lines if line]
+
+
+def hot_terms(token_lists, n=WARMUP_TERMS):
+    """ The n terms occurring in the most queries, most frequent first. """
+    counts = Counter(term for tokens in token_lists for term in set(tokens))
+    return [term for term, _ in counts.most_common(n)]
+
+
+def _posting_pieces(index, w):
+    """ (file name, offset, n_bytes) of the parts of w's posting list. """
+    n_bytes = index.df[w] * TUPLE_SIZE
+    pieces = []
+    for f_name, offset in index.posting_locs[w]:
+        n_read = min(n_bytes, BLOCK_SIZE - offset)
+        pieces.append((f_name, offset, n_read))
+        n_bytes -= n_read
+    return pieces
+
+
+def prefetch_postings(index, base_dir, terms, bucket_name=None):
+    """ Read the posting lists of `terms` so later reads are served from
+        memory: local files end up in the OS page cache, bucket objects in the
+        block cache. `index` is a plain InvertedIndex (for a SegmentedIndex,
+        its main_index; delta segments are small and recently written).
+        Returns the number of posting bytes read.
+    """
+    pieces = [piece for w in terms if w in index.posting_locs for piece in _posting_pieces(index, w)]
+    if bucket_name is not None:
+        with closing(MultiFileReader(base_dir, bucket_name)) as reader:
+            for f_name, offset, n_bytes in pieces:
+                reader.read([(f_name, offset)], n_bytes)
+        return sum(n_bytes for _, _, n_bytes in pieces)
+
+    files = {}
+    try:
+        for f_name, _, _ in pieces:
+            if f_name not in files:
+                files[f_name] = os.open(os.path.join(base_dir, f_name), os.O_RDONLY)
+        # announce every range first so the kernel can read them in parallel,
+        # then wait for them by reading
+        if hasattr(os, 'posix_fadvise'):
+            for f_name, offset, n_bytes in pieces:
+                os.posix_fadvise(files[f_name], offset, n_bytes, os.POSIX_FADV_WILLNEED)
+        for f_name, offset, n_bytes in pieces:
+            for start in range(offset, offset + n_bytes, READ_CHUNK):
+                os.pread(files[f_name], min(READ_CHUNK, offset + n_bytes - start), start)
+    finally:
+        for fd in files.values():
+            os.close(fd)
+    return sum(n_bytes for _, _, n_bytes in pieces)